@@ -0,0 +1,485 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Benchmarks for the copyvio detector.
+
+Times Markov chain construction and set operations, the source parsers, article
+stripping and chunking, and full :py:class:`~earwigbot.wiki.copyvios.CopyvioChecker`
+runs against the corpus in ``benchmarks/corpus``. Sources are served by a local
+HTTP server, and searches are answered by a fake search engine, so no network
+access is needed (except to download NLTK data on the first run).
+
+Usage::
+
+    python benchmarks/run.py [-o results.json] [-b baseline.json] [-n REPEAT]
+                             [-k FILTER] [--backend {python,numpy}]
+    python benchmarks/run.py --verify-html
+
+Results are written as JSON. Given a baseline from an earlier run, benchmarks
+whose best time grew by more than ``--threshold`` are reported, and the script
+exits with status 1.
+
+With ``--verify-html``, nothing is timed; instead, the text extracted from each
+HTML source by lxml is compared against what BeautifulSoup extracts, and any
+differences are printed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import difflib
+import functools
+import http.server
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+import earwigbot
+from earwigbot.wiki.copyvios import (
+    CopyvioChecker,
+    start_parse_pool,
+    stop_parse_pool,
+)
+from earwigbot.wiki.copyvios.markov import (
+    MarkovChain,
+    MarkovChainIntersection,
+    MarkovChainUnion,
+    MultiDegreeChainBuilder,
+    get_backend,
+    set_backend,
+)
+from earwigbot.wiki.copyvios.parsers import (
+    ArticleParser,
+    HTMLParser,
+    PDFParser,
+    PlainTextParser,
+    SourceParser,
+)
+from earwigbot.wiki.copyvios.search import SEARCH_ENGINES, SearchEngine
+from earwigbot.wiki.page import ParseCache
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+DEFAULT_NLTK_DIR = os.path.join(os.path.expanduser("~"), ".earwigbot", "nltk")
+
+# Each source is requested from its own fake host, which is mapped to the local
+# server with the "proxies" search config option:
+SOURCES = {
+    "copy.html": "www.coastal-walks.example.com",
+    "partial.html": "www.carrick-guide.example.org",
+    "unrelated.html": "www.railway-heritage.example.net",
+    "notes.txt": "files.coastal-walks.example.com",
+    "report.pdf": "www.harrow-trust.example.org",
+}
+
+
+@dataclass
+class Result:
+    """The timings of a single benchmark, in seconds."""
+
+    name: str
+    times: list[float] = field(default_factory=list)
+    info: dict[str, Any] = field(default_factory=dict)
+    skipped: str | None = None
+
+    def to_json(self) -> dict[str, Any]:
+        if self.skipped:
+            return {"name": self.name, "skipped": self.skipped}
+        return {
+            "name": self.name,
+            "repeat": len(self.times),
+            "min": min(self.times),
+            "median": statistics.median(self.times),
+            "mean": statistics.fmean(self.times),
+            "stdev": statistics.stdev(self.times) if len(self.times) > 1 else 0.0,
+            "max": max(self.times),
+            "info": self.info,
+        }
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves the corpus without logging every request to stderr."""
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@contextmanager
+def serve_corpus() -> Iterator[str]:
+    """Serve the corpus directory over HTTP, yielding the server's base URL."""
+    handler = functools.partial(_QuietHandler, directory=CORPUS_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f"http://{host}:{port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class BenchmarkSearchEngine(SearchEngine):
+    """A fake search engine that finds the corpus sources for every query."""
+
+    name = "Benchmark"
+
+    def search(self, query: str) -> list[str]:
+        return [f"http://{host}/{path}" for path, host in SOURCES.items()]
+
+
+class FakeSite:
+    """Just enough of a :py:class:`~earwigbot.wiki.site.Site` for the checker."""
+
+    name = "benchwiki"
+    lang = "en"
+    user_agent = f"EarwigBot/{earwigbot.__version__} (benchmarks)"
+
+    def __init__(self, search_config: dict[str, Any]) -> None:
+        self._search_config = search_config
+
+
+class FakePage:
+    """Just enough of a :py:class:`~earwigbot.wiki.page.Page` for the checker."""
+
+    title = "Harrow Point Lighthouse"
+    pageid = 1
+    lastrevid = 1
+
+    def __init__(self, text: str, site: FakeSite) -> None:
+        self._text = text
+        self.site = site
+
+    def get(self) -> str:
+        return self._text
+
+    @functools.cached_property
+    def parse_cache(self) -> ParseCache:
+        return ParseCache(self._text, self.lastrevid)
+
+
+class Runner:
+    """Collects and times the benchmarks."""
+
+    PARSERS: list[tuple[str, type[SourceParser]]] = [
+        ("copy.html", HTMLParser),
+        ("partial.html", HTMLParser),
+        ("unrelated.html", HTMLParser),
+        ("notes.txt", PlainTextParser),
+        ("report.pdf", PDFParser),
+    ]
+
+    def __init__(
+        self, repeat: int, pattern: str | None, nltk_dir: str, base_url: str
+    ) -> None:
+        self.repeat = repeat
+        self.pattern = pattern
+        self.nltk_dir = nltk_dir
+        self.base_url = base_url
+        self.results: list[Result] = []
+
+        self.article = self._read("article.wiki").decode("utf-8")
+        self.sources = {path: self._read(path) for path in SOURCES}
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(os.path.join(CORPUS_DIR, path), "rb") as fp:
+            return fp.read()
+
+    def _wanted(self, name: str) -> bool:
+        return not self.pattern or self.pattern in name
+
+    def _timeit(self, name: str, func: Callable[[], Any], **info: Any) -> Result | None:
+        """Time *func*, after one untimed warm-up call, and record the result."""
+        if not self._wanted(name):
+            return None
+        result = Result(name, info=info)
+        try:
+            func()
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                func()
+                result.times.append(time.perf_counter() - start)
+        except LookupError as exc:  # Missing NLTK data that couldn't be downloaded
+            result.skipped = f"{type(exc).__name__}: {exc}".strip().splitlines()[0]
+        self.results.append(result)
+        print(self._describe(result), file=sys.stderr)
+        return result
+
+    @staticmethod
+    def _describe(result: Result) -> str:
+        if result.skipped:
+            return f"{result.name:<36} skipped ({result.skipped})"
+        median = statistics.median(result.times) * 1000
+        best = min(result.times) * 1000
+        return f"{result.name:<36} {median:10.3f} ms (best {best:.3f} ms)"
+
+    def _search_config(self, **options: Any) -> dict[str, Any]:
+        return {
+            "engine": BenchmarkSearchEngine.name,
+            "credentials": {},
+            "nltk_dir": self.nltk_dir,
+            "proxies": [
+                {"netloc": host, "target": self.base_url}
+                for host in set(SOURCES.values())
+            ],
+            "source_cache": False,
+            **options,
+        }
+
+    def _checker(self, **options: Any) -> CopyvioChecker:
+        page = FakePage(self.article, FakeSite(self._search_config(**options)))
+        return CopyvioChecker(page, max_time=30)  # type: ignore[arg-type]
+
+    def run_markov(self) -> None:
+        text = ArticleParser(self.article, "en", self.nltk_dir).strip()
+        source = HTMLParser(self.sources["partial.html"], "partial.html").parse()
+        size = len(text)
+
+        def build_multi() -> None:
+            builder = MultiDegreeChainBuilder([3, 4, 5])
+            builder.feed(text)
+            builder.build()
+
+        self._timeit("markov.build", lambda: MarkovChain(text), chars=size)
+        self._timeit("markov.build_multi", build_multi, chars=size, degrees=[3, 4, 5])
+
+        article, other = MarkovChain(text), MarkovChain(source)
+        self._timeit(
+            "markov.intersection",
+            lambda: MarkovChainIntersection(article, other),
+            nodes=[article.size, other.size],
+        )
+        chains = [
+            MarkovChain(parser(self.sources[path], path).parse())
+            for path, parser in self.PARSERS
+        ]
+        self._timeit(
+            "markov.union",
+            lambda: MarkovChainUnion(chains),
+            nodes=[chain.size for chain in chains],
+        )
+
+    def run_parsers(self) -> None:
+        for path, parser in self.PARSERS:
+            data = self.sources[path]
+            self._timeit(
+                f"parsers.{parser.__name__}[{path}]",
+                lambda data=data, parser=parser, path=path: parser(data, path).parse(),
+                bytes=len(data),
+            )
+
+        for path, parser in self.PARSERS:
+            if parser is not HTMLParser:
+                continue
+            data = self.sources[path]
+            self._timeit(
+                f"parsers.HTMLParser[{path},bs4]",
+                lambda data=data, path=path: parse_html(data, path, use_lxml=False),
+                bytes=len(data),
+            )
+
+    def run_article(self) -> None:
+        def strip() -> None:
+            ArticleParser(self.article, "en", self.nltk_dir).strip()
+
+        def chunk() -> None:
+            ArticleParser(self.article, "en", self.nltk_dir).chunk(15)
+
+        self._timeit("article.strip", strip, chars=len(self.article))
+        self._timeit("article.chunk", chunk, chars=len(self.article), max_chunks=15)
+
+    def run_checker(self) -> None:
+        urls = [f"http://{host}/{path}" for path, host in SOURCES.items()]
+
+        def compare(**options: Any) -> Callable[[], None]:
+            return lambda: self._checker(**options).run_compare(urls)
+
+        self._timeit("checker.run_compare", compare(), sources=len(urls))
+        self._timeit(
+            "checker.run_compare[asyncio]",
+            compare(fetcher="asyncio"),
+            sources=len(urls),
+        )
+        if self._wanted("checker.run_compare[parse_pool]"):
+            start_parse_pool(2)
+            try:
+                self._timeit(
+                    "checker.run_compare[parse_pool]",
+                    compare(),
+                    sources=len(urls),
+                    processes=2,
+                )
+            finally:
+                stop_parse_pool()
+
+        # Each search query is followed by a one-second pause in run_check(), so
+        # keep the number of queries low:
+        def check(**options: Any) -> Callable[[], None]:
+            return lambda: self._checker(**options).run_check(
+                max_queries=1, short_circuit=False
+            )
+
+        self._timeit("checker.run_check", check(), max_queries=1)
+        self._timeit(
+            "checker.run_check[source_cache]", check(source_cache=True), max_queries=1
+        )
+
+    def run(self) -> None:
+        self.run_markov()
+        self.run_parsers()
+        self.run_article()
+        self.run_checker()
+
+
+def parse_html(data: bytes, path: str, use_lxml: bool) -> str:
+    """Extract the text of an HTML source, with or without lxml."""
+    parser = HTMLParser(data, path)
+    parser.use_lxml = use_lxml
+    return parser.parse()
+
+
+def verify_html() -> int:
+    """Check that lxml and BeautifulSoup extract the same text from the corpus."""
+    failures = 0
+    for path in sorted(os.listdir(CORPUS_DIR)):
+        if not path.endswith((".html", ".htm")):
+            continue
+        data = Runner._read(path)
+        expected = parse_html(data, path, use_lxml=False)
+        actual = parse_html(data, path, use_lxml=True)
+        if actual == expected:
+            print(f"{path}: OK", file=sys.stderr)
+            continue
+        failures += 1
+        print(f"{path}: MISMATCH", file=sys.stderr)
+        sys.stdout.writelines(
+            difflib.unified_diff(
+                expected.splitlines(keepends=True),
+                actual.splitlines(keepends=True),
+                fromfile=f"{path} (bs4)",
+                tofile=f"{path} (lxml)",
+            )
+        )
+    return 1 if failures else 0
+
+
+def compare_results(
+    results: list[dict[str, Any]], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    """Return descriptions of the benchmarks that regressed against *baseline*."""
+    previous = {
+        result["name"]: result
+        for result in baseline.get("results", [])
+        if "min" in result
+    }
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if not old or "min" not in result:
+            continue
+        change = result["min"] / old["min"] - 1
+        result["baseline_min"] = old["min"]
+        result["change"] = change
+        if change > threshold:
+            regressions.append(f"{result['name']}: {change:+.1%}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the copyvio detector.")
+    parser.add_argument("-o", "--output", help="write JSON results to this file")
+    parser.add_argument("-b", "--baseline", help="compare against earlier results")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown to report as a regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=10, help="timed runs per benchmark"
+    )
+    parser.add_argument("-k", "--filter", help="only run benchmarks matching this")
+    parser.add_argument("--backend", choices=["python", "numpy"])
+    parser.add_argument(
+        "--nltk-dir", default=DEFAULT_NLTK_DIR, help="where to find NLTK data"
+    )
+    parser.add_argument(
+        "--verify-html",
+        action="store_true",
+        help="compare HTML text extraction with lxml against BeautifulSoup",
+    )
+    args = parser.parse_args()
+
+    if args.verify_html:
+        return verify_html()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    if args.backend:
+        set_backend(args.backend)
+
+    with serve_corpus() as base_url:
+        runner = Runner(args.repeat, args.filter, args.nltk_dir, base_url)
+        SEARCH_ENGINES[BenchmarkSearchEngine.name] = BenchmarkSearchEngine
+        runner.run()
+
+    results = [result.to_json() for result in runner.results]
+    regressions: list[str] = []
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = compare_results(results, json.load(fp), args.threshold)
+
+    report = {
+        "version": earwigbot.__version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "backend": get_backend(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    if args.baseline:
+        report["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+            fp.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
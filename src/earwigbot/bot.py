@@ -113,6 +113,15 @@ class Bot:
             thread.daemon = True  # Stop if other threads stop
             thread.start()
 
+    def _start_tokenizer_warmup(self):
+        """Load copyvio sentence tokenizers in a separate thread if enabled."""
+        if self.config.wiki.get("search", {}).get("tokenizer_warmup"):
+            thread = Thread(
+                name="tokenizer_warmup", target=self.wiki.warm_up_tokenizers
+            )
+            thread.daemon = True
+            thread.start()
+
     def _keep_irc_component_alive(self, name, klass):
         """Ensure that IRC components stay connected, else restart them."""
         component = getattr(self, name)
@@ -178,6 +187,7 @@ class Bot:
         self.logger.info(f"Starting bot (EarwigBot {__version__})")
         self._start_irc_components()
         self._start_wiki_scheduler()
+        self._start_tokenizer_warmup()
         while self._keep_looping:
             with self.component_lock:
                 self._keep_irc_component_alive("frontend", Frontend)
@@ -24,22 +24,39 @@ __all__ = [
     "DEFAULT_DEGREE",
     "CopyvioChecker",
     "CopyvioCheckResult",
+    "get_pool_stats",
+    "get_timing_stats",
     "globalize",
     "localize",
+    "start_parse_pool",
+    "stop_parse_pool",
 ]
 
 import functools
 import logging
 import time
 import typing
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
 
+from earwigbot.wiki.copyvios.cache import ArticleCache, CachedArticle
 from earwigbot.wiki.copyvios.exclusions import ExclusionsDB
-from earwigbot.wiki.copyvios.markov import DEFAULT_DEGREE, MarkovChain
+from earwigbot.wiki.copyvios.markov import (
+    DEFAULT_DEGREE,
+    MarkovChain,
+    MultiDegreeChainBuilder,
+)
 from earwigbot.wiki.copyvios.parsers import ArticleParser, ParserArgs
 from earwigbot.wiki.copyvios.result import CopyvioCheckResult
 from earwigbot.wiki.copyvios.search import SearchEngine, get_search_engine
-from earwigbot.wiki.copyvios.workers import CopyvioWorkspace, globalize, localize
+from earwigbot.wiki.copyvios.workers import (
+    CopyvioWorkspace,
+    get_pool_stats,
+    get_timing_stats,
+    globalize,
+    localize,
+    start_parse_pool,
+    stop_parse_pool,
+)
 
 if typing.TYPE_CHECKING:
     from earwigbot.wiki.page import Page
@@ -60,6 +77,9 @@ class CopyvioChecker:
         min_confidence: float = 0.75,
         max_time: float = 30,
         degree: int = DEFAULT_DEGREE,
+        extra_degrees: Iterable[int] = (),
+        compact: bool = False,
+        max_phrases: int = 0,
         logger: logging.Logger | None = None,
     ) -> None:
         self._page = page
@@ -68,6 +88,9 @@ class CopyvioChecker:
         self._min_confidence = min_confidence
         self._max_time = max_time
         self._degree = degree
+        self._extra_degrees = sorted(set(extra_degrees) - {degree})
+        self._compact = compact
+        self._max_phrases = max_phrases
         self._logger = logger or logging.getLogger("earwigbot.wiki")
 
         self._headers = [
@@ -75,12 +98,16 @@ class CopyvioChecker:
             ("Accept-Encoding", "gzip"),
         ]
 
+        parse_cache = self._page.parse_cache
         self._parser = ArticleParser(
-            self._page.get(),
+            parse_cache.text,
             lang=self._site.lang,
             nltk_dir=self._config["nltk_dir"],
+            parse_cache=parse_cache,
         )
-        self._article = MarkovChain(self._parser.strip(), degree=self._degree)
+        self._extra_articles: dict[int, MarkovChain] = {}
+        self._cached = self._load_article()
+        self._article = self._cached.chain
 
     @functools.cached_property
     def _searcher(self) -> SearchEngine:
@@ -90,10 +117,59 @@ class CopyvioChecker:
     def _exclusions_db(self) -> ExclusionsDB | None:
         return self._config.get("exclusions_db")
 
+    @property
+    def _article_cache(self) -> ArticleCache | None:
+        return self._config.get("article_cache")
+
     @property
     def article_chain(self) -> MarkovChain:
         return self._article
 
+    @property
+    def article_chains(self) -> dict[int, MarkovChain]:
+        return {self._degree: self._article, **self._extra_articles}
+
+    def _build_chains(self, text: str, degrees: list[int]) -> dict[int, MarkovChain]:
+        builder = MultiDegreeChainBuilder(degrees, keep_text=True)
+        builder.feed(text)
+        return builder.build()
+
+    def _load_article(self) -> CachedArticle:
+        cache = self._article_cache
+        if cache:
+            cached = cache.get(self._page, self._degree)
+            if cached:
+                self._logger.debug(f"[[{self._page.title}]] -> loaded from cache")
+                self._parser.clean = cached.text
+                if self._extra_degrees:
+                    self._extra_articles = self._build_chains(
+                        cached.text, self._extra_degrees
+                    )
+                return cached
+
+        text = self._parser.strip()
+        if self._extra_degrees:
+            # Tokenize the article once for all degrees:
+            chains = self._build_chains(text, [self._degree, *self._extra_degrees])
+            chain = chains.pop(self._degree)
+            self._extra_articles = chains
+        else:
+            chain = MarkovChain(text, degree=self._degree)
+        cached = CachedArticle(text=text, links=self._parser.get_links(), chain=chain)
+        if cache:
+            cache.put(self._page, cached)
+        return cached
+
+    def _get_chunks(self, max_chunks: int) -> list[str]:
+        if max_chunks not in self._cached.chunks:
+            chunks = self._parser.chunk(max_chunks)
+            self._cached.chunks[max_chunks] = chunks
+            if self._article_cache:
+                self._article_cache.set_chunks(
+                    self._page, self._degree, max_chunks, chunks
+                )
+        return list(self._cached.chunks[max_chunks])
+
     def _get_exclusion_callback(self) -> Callable[[str], bool] | None:
         if not self._exclusions_db:
             return None
@@ -124,16 +200,21 @@ class CopyvioChecker:
             exclusion_callback=self._get_exclusion_callback(),
             config=self._config,
             degree=self._degree,
+            use_source_cache=self._config.get("source_cache", False),
+            compact=self._compact,
+            max_phrases=self._max_phrases,
+            extra_articles=self._extra_articles,
+            fetcher=self._config.get("fetcher", "urllib"),
         )
 
         if self._article.size < 20:  # Auto-fail very small articles
             return workspace.get_result()
 
         if not no_links:
-            workspace.enqueue(self._parser.get_links())
+            workspace.enqueue(self._cached.links, origin="link")
         num_queries = 0
         if not no_searches:
-            chunks = self._parser.chunk(max_queries)
+            chunks = self._get_chunks(max_queries)
             for chunk in chunks:
                 if short_circuit and workspace.finished:
                     workspace.possible_miss = True
@@ -142,7 +223,10 @@ class CopyvioChecker:
                     f"[[{self._page.title}]] -> querying {self._searcher.name} "
                     f"for {chunk!r}"
                 )
-                workspace.enqueue(self._searcher.search(chunk))
+                start = time.perf_counter()
+                urls = self._searcher.search(chunk)
+                workspace.search_time += time.perf_counter() - start
+                workspace.enqueue(urls)
                 num_queries += 1
                 time.sleep(1)  # TODO: Check whether this is needed
 
@@ -161,6 +245,11 @@ class CopyvioChecker:
             short_circuit=False,
             config=self._config,
             degree=self._degree,
+            revalidate=True,
+            compact=self._compact,
+            max_phrases=self._max_phrases,
+            extra_articles=self._extra_articles,
+            fetcher=self._config.get("fetcher", "urllib"),
         )
 
         workspace.enqueue(urls)
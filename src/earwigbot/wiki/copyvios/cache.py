@@ -0,0 +1,550 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import annotations
+
+__all__ = [
+    "ArticleCache",
+    "CachedArticle",
+    "CachedResponse",
+    "CachedSource",
+    "HTTPCache",
+    "SourceCache",
+    "get_source_cache",
+    "set_source_cache",
+]
+
+import collections
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import typing
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+
+from earwigbot import __version__
+from earwigbot.wiki.copyvios.markov import ChainTable, MarkovChain
+
+if typing.TYPE_CHECKING:
+    from earwigbot.wiki.page import Page
+
+# Serialized chains depend on the interpreter's tuple hashing and byte order, and
+# the stored text, chunks, and links on how this version strips and chunks articles,
+# so entries written by a different Python or earwigbot are ignored, not misread:
+_FORMAT = f"1/{sys.implementation.name}{sys.version_info[0]}.{sys.version_info[1]}"
+_FORMAT += f"/{sys.byteorder}/{__version__}"
+
+
+@dataclass
+class CachedArticle:
+    """The parsed form of an article revision, as needed by a copyvio check."""
+
+    text: str
+    links: list[str]
+    chain: MarkovChain
+    chunks: dict[int, list[str]] = field(default_factory=dict)
+
+
+class ArticleCache:
+    """
+    **EarwigBot: Wiki Toolset: Article Cache Manager**
+
+    Controls the :file:`articles.db` file, which stores the stripped text, search
+    chunks, external links, and Markov chains of recently checked article revisions,
+    so repeated checks of the same revision can skip parsing the wikicode.
+
+    Entries are keyed by site, page ID, revision ID, and chain degree. Once the
+    stored data exceeds *max_size* bytes, the least recently used entries are
+    evicted.
+    """
+
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(
+        self, dbfile: str, logger: logging.Logger, max_size: int = DEFAULT_MAX_SIZE
+    ) -> None:
+        self._dbfile = dbfile
+        self._logger = logger
+        self._max_size = max_size
+        self._db_access_lock = threading.Lock()
+        self._created = False
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the ArticleCache."""
+        return (
+            f"ArticleCache(dbfile={self._dbfile!r}, logger={self._logger!r}, "
+            f"max_size={self._max_size!r})"
+        )
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the ArticleCache."""
+        return f"<ArticleCache at {self._dbfile}>"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the database, creating its tables if necessary."""
+        conn = sqlite3.connect(self._dbfile)
+        if not self._created:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    article_sitename, article_pageid, article_revid, article_degree,
+                    article_format, article_text, article_links, article_chunks,
+                    article_hashes, article_counts, article_size, article_access,
+                    PRIMARY KEY (
+                        article_sitename, article_pageid, article_revid, article_degree
+                    )
+                );
+                CREATE INDEX IF NOT EXISTS articles_access ON articles (article_access);
+            """)
+            self._created = True
+        return conn
+
+    @staticmethod
+    def _get_key(page: Page, degree: int) -> tuple[str, int, int, int] | None:
+        """Return the key used to store the given page, if it has one."""
+        revid = page.lastrevid
+        if revid is None:
+            return None
+        return (page.site.name, page.pageid, revid, degree)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Remove the least recently used entries until we are under the size cap."""
+        query1 = "SELECT TOTAL(article_size) FROM articles"
+        query2 = "SELECT rowid, article_size FROM articles ORDER BY article_access"
+        query3 = "DELETE FROM articles WHERE rowid = ?"
+
+        excess = conn.execute(query1).fetchone()[0] - self._max_size
+        if excess <= 0:
+            return
+        evicted: list[tuple[int]] = []
+        for rowid, size in conn.execute(query2):
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        conn.executemany(query3, evicted)
+        self._logger.debug(f"Evicted {len(evicted)} articles from the cache")
+
+    def get(self, page: Page, degree: int) -> CachedArticle | None:
+        """
+        Return the cached data for the page's current revision and *degree*.
+
+        Return ``None`` if the revision is not in the cache.
+        """
+        key = self._get_key(page, degree)
+        if not key:
+            return None
+
+        where = """WHERE article_sitename = ? AND article_pageid = ?
+                   AND article_revid = ? AND article_degree = ?"""
+        query1 = f"""SELECT article_format, article_text, article_links,
+                     article_chunks, article_hashes, article_counts
+                     FROM articles {where}"""
+        query2 = f"UPDATE articles SET article_access = ? {where}"
+
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                row = conn.execute(query1, key).fetchone()
+                if not row or row[0] != _FORMAT:
+                    return None
+                conn.execute(query2, (time.time(), *key))
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to read from article cache: {exc}")
+            return None
+
+        _, text, links, chunks, hashes, counts = row
+        try:
+            table = ChainTable.from_bytes(hashes, counts)
+        except ValueError:
+            return None
+        return CachedArticle(
+            text=text,
+            links=json.loads(links),
+            chain=MarkovChain._from_table(table, degree, text),
+            chunks={int(num): chunk for num, chunk in json.loads(chunks).items()},
+        )
+
+    def put(self, page: Page, article: CachedArticle) -> None:
+        """
+        Store the given data for the page's current revision.
+
+        Entries for older revisions of the same page are removed, since they will
+        not be checked again.
+        """
+        key = self._get_key(page, article.chain.degree)
+        if not key:
+            return
+
+        query1 = """DELETE FROM articles WHERE article_sitename = ?
+                    AND article_pageid = ? AND article_degree = ?"""
+        query2 = "INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+        text = article.text
+        links = json.dumps(article.links)
+        chunks = json.dumps(article.chunks)
+        hashes, counts = article.chain.chain.to_bytes()
+        size = len(text) + len(links) + len(chunks) + len(hashes) + len(counts)
+        if size > self._max_size:
+            return
+
+        sitename, pageid, revid, degree = key
+        row = (
+            *key,
+            _FORMAT,
+            text,
+            links,
+            chunks,
+            hashes,
+            counts,
+            size,
+            time.time(),
+        )
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                conn.execute(query1, (sitename, pageid, degree))
+                conn.execute(query2, row)
+                self._evict(conn)
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to write to article cache: {exc}")
+
+    def set_chunks(
+        self, page: Page, degree: int, max_chunks: int, chunks: list[str]
+    ) -> None:
+        """Add a list of search chunks to the page's entry, if it is cached."""
+        key = self._get_key(page, degree)
+        if not key:
+            return
+
+        where = """WHERE article_sitename = ? AND article_pageid = ?
+                   AND article_revid = ? AND article_degree = ?"""
+        query1 = f"SELECT article_chunks FROM articles {where}"
+        query2 = f"""UPDATE articles SET article_chunks = ?,
+                     article_size = article_size + ? {where}"""
+
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                row = conn.execute(query1, key).fetchone()
+                if not row:
+                    return
+                old = row[0]
+                data = json.loads(old)
+                data[str(max_chunks)] = chunks
+                new = json.dumps(data)
+                conn.execute(query2, (new, len(new) - len(old), *key))
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to write to article cache: {exc}")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """The parsed text of a downloaded source, as stored in an :py:class:`HTTPCache`.
+
+    *etag* and *last_modified* are the validators the server sent with it, if any,
+    and *fetched* is when it was last downloaded or revalidated.
+    """
+
+    text: str
+    etag: str | None
+    last_modified: str | None
+    fetched: float
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """The headers to send to ask the server whether this response is stale."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    **EarwigBot: Wiki Toolset: HTTP Cache**
+
+    Controls the :file:`sources.db` file, which stores the parsed text of downloaded
+    copyvio sources along with their ``ETag`` and ``Last-Modified`` headers, so they
+    can be reused by later checks, including after a restart. This stores the
+    content of third-party pages on disk, so it is only used if the ``http_cache``
+    search option is enabled.
+
+    Entries are kept for at most *max_age* seconds since the server last sent or
+    confirmed them, after which they are deleted. Until then, checks use them without
+    contacting the server, while comparisons revalidate them with a conditional
+    request and only download and parse the source again if the server says it has
+    changed. Entries are keyed by URL and *variant*, a string standing for anything
+    else that affects parsing. Once the stored text exceeds *max_size* bytes, the
+    least recently used entries are evicted.
+    """
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+    DEFAULT_MAX_AGE = 60 * 60
+
+    def __init__(
+        self,
+        dbfile: str,
+        logger: logging.Logger,
+        max_size: int = DEFAULT_MAX_SIZE,
+        max_age: float = DEFAULT_MAX_AGE,
+    ) -> None:
+        self._dbfile = dbfile
+        self._logger = logger
+        self._max_size = max_size
+        self._max_age = max_age
+        self._db_access_lock = threading.Lock()
+        self._created = False
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the HTTPCache."""
+        return (
+            f"HTTPCache(dbfile={self._dbfile!r}, logger={self._logger!r}, "
+            f"max_size={self._max_size!r}, max_age={self._max_age!r})"
+        )
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the HTTPCache."""
+        return f"<HTTPCache at {self._dbfile}>"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the database, creating its tables if necessary."""
+        conn = sqlite3.connect(self._dbfile)
+        if not self._created:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    response_url, response_variant, response_text, response_etag,
+                    response_last_modified, response_fetched, response_size,
+                    response_access,
+                    PRIMARY KEY (response_url, response_variant)
+                );
+                CREATE INDEX IF NOT EXISTS responses_access
+                    ON responses (response_access);
+            """)
+            self._expire(conn)
+            self._created = True
+        return conn
+
+    def _expire(self, conn: sqlite3.Connection) -> None:
+        """Remove entries older than the maximum age."""
+        query = "DELETE FROM responses WHERE response_fetched <= ?"
+        count = conn.execute(query, (time.time() - self._max_age,)).rowcount
+        if count > 0:
+            self._logger.debug(f"Expired {count} responses from the cache")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Remove the least recently used entries until we are under the size cap."""
+        query1 = "SELECT TOTAL(response_size) FROM responses"
+        query2 = "SELECT rowid, response_size FROM responses ORDER BY response_access"
+        query3 = "DELETE FROM responses WHERE rowid = ?"
+
+        excess = conn.execute(query1).fetchone()[0] - self._max_size
+        if excess <= 0:
+            return
+        evicted: list[tuple[int]] = []
+        for rowid, size in conn.execute(query2):
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        conn.executemany(query3, evicted)
+        self._logger.debug(f"Evicted {len(evicted)} responses from the cache")
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        """Return whether a cached response is younger than the maximum age."""
+        return response.fetched + self._max_age > time.time()
+
+    def get(self, url: str, variant: str = "") -> CachedResponse | None:
+        """Return the cached response for *url*, or ``None`` if it is missing.
+
+        Expired responses count as missing, and are deleted.
+        """
+        where = "WHERE response_url = ? AND response_variant = ?"
+        query1 = f"""SELECT response_text, response_etag, response_last_modified,
+                     response_fetched FROM responses {where}"""
+        query2 = f"UPDATE responses SET response_access = ? {where}"
+        query3 = f"DELETE FROM responses {where}"
+
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                row = conn.execute(query1, (url, variant)).fetchone()
+                if not row:
+                    return None
+                if not self.is_fresh(CachedResponse(*row)):
+                    conn.execute(query3, (url, variant))
+                    return None
+                conn.execute(query2, (time.time(), url, variant))
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to read from HTTP cache: {exc}")
+            return None
+        return CachedResponse(*row)
+
+    def put(self, url: str, response: CachedResponse, variant: str = "") -> None:
+        """Store the parsed text of a response for *url*."""
+        query = "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+        size = len(url) + len(response.text)
+        if size > self._max_size or not self.is_fresh(response):
+            return
+        row = (
+            url,
+            variant,
+            response.text,
+            response.etag,
+            response.last_modified,
+            response.fetched,
+            size,
+            time.time(),
+        )
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                conn.execute(query, row)
+                self._expire(conn)
+                self._evict(conn)
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to write to HTTP cache: {exc}")
+
+    def refresh(self, url: str, variant: str = "") -> None:
+        """Mark the response for *url* as fresh, after the server said it is."""
+        query = """UPDATE responses SET response_fetched = ?
+                   WHERE response_url = ? AND response_variant = ?"""
+        try:
+            with self._db_access_lock, self._connect() as conn:
+                conn.execute(query, (time.time(), url, variant))
+        except sqlite3.Error as exc:
+            self._logger.warning(f"Failed to write to HTTP cache: {exc}")
+
+
+@dataclass(frozen=True)
+class CachedSource:
+    """A parsed source document, as stored in a :py:class:`SourceCache`.
+
+    *chains* maps each degree the source was scored at to its chain.
+    """
+
+    url: str
+    chains: dict[int, MarkovChain]
+    size: int
+    expires: float
+
+
+class SourceCache:
+    """
+    **EarwigBot: Wiki Toolset: Source Cache**
+
+    Stores the Markov chains of recently downloaded and parsed source URLs in memory,
+    so checks run close together in the same process can reuse them. Checks only use
+    it if the ``source_cache`` search option is enabled; comparisons never do.
+
+    Entries are keyed by the source URL along with anything else that affects how it
+    is parsed, and expire after *ttl* seconds. Once the stored chains and text exceed
+    *max_size* bytes, the least recently used entries are evicted.
+    """
+
+    DEFAULT_MAX_SIZE = 128 * 1024 * 1024
+    DEFAULT_TTL = 15 * 60
+
+    def __init__(
+        self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL
+    ) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: collections.OrderedDict[Hashable, CachedSource] = (
+            collections.OrderedDict()
+        )
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the SourceCache."""
+        return f"SourceCache(max_size={self._max_size!r}, ttl={self._ttl!r})"
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the SourceCache."""
+        return f"<SourceCache of {len(self)} sources in {self._size} bytes>"
+
+    def __len__(self) -> int:
+        """Return the number of sources in the cache."""
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """The approximate number of bytes used by the cached sources."""
+        return self._size
+
+    def _remove(self, key: Hashable) -> None:
+        """Remove an entry from the cache. The lock must be held."""
+        self._size -= self._entries.pop(key).size
+
+    def get(self, key: Hashable) -> CachedSource | None:
+        """Return the source stored under *key*, or ``None`` if it is missing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, url: str, chains: dict[int, MarkovChain]) -> None:
+        """Store the chains of a source, which was finally retrieved from *url*."""
+        # The chains of each degree usually share the same text, so count it once:
+        texts = {id(chain.text): chain.text for chain in chains.values() if chain.text}
+        size = sum(chain.chain.nbytes for chain in chains.values()) + sum(
+            sys.getsizeof(text) for text in texts.values()
+        )
+        if size > self._max_size:
+            return
+        entry = CachedSource(url, dict(chains), size, time.time() + self._ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self._max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Remove all sources from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_source_cache: SourceCache | None = SourceCache()
+
+
+def get_source_cache() -> SourceCache | None:
+    """Return the process-wide cache of parsed sources, or ``None`` if disabled."""
+    return _source_cache
+
+
+def set_source_cache(cache: SourceCache | None) -> None:
+    """
+    Replace the process-wide cache of parsed sources.
+
+    Pass a new :py:class:`SourceCache` to change its size or TTL, or ``None`` to
+    disable caching sources entirely.
+    """
+    global _source_cache
+    _source_cache = cache
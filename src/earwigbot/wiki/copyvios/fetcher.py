@@ -0,0 +1,445 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import annotations
+
+__all__ = ["AsyncFetcher", "get_async_fetcher", "stop_async_fetcher"]
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import socket
+import threading
+import time
+import urllib.parse
+from collections.abc import Container
+from typing import Any
+
+import aiohttp
+import aiohttp.abc
+
+from earwigbot.exceptions import ParserExclusionError
+from earwigbot.wiki.copyvios.markov import MarkovChain
+from earwigbot.wiki.copyvios.resolver import DNSCache, get_dns_cache
+from earwigbot.wiki.copyvios.result import CopyvioSource
+from earwigbot.wiki.copyvios.workers import (
+    _CHUNK_SIZE,
+    _MAX_REDIRECTS,
+    OpenedURL,
+    _add_cache_headers,
+    _CacheLookup,
+    _compare_source,
+    _ContentDecoder,
+    _get_accept_encoding,
+    _get_response_parser,
+    _NotModifiedError,
+    _parse_opened,
+    _QueuedSource,
+    _resolve_host,
+    _SourceCancelledError,
+    _SourceScheduler,
+    _timed,
+    _try_map_proxy_url,
+)
+
+_FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError)
+
+_fetcher: AsyncFetcher | None = None
+_fetcher_lock = threading.Lock()
+
+
+class _CachedResolver(aiohttp.abc.AbstractResolver):
+    """Resolves hosts for aiohttp through the copyvio DNS cache."""
+
+    def __init__(self, cache: DNSCache) -> None:
+        self._cache = cache
+
+    async def resolve(
+        self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET
+    ) -> list[aiohttp.abc.ResolveResult]:
+        addresses = self._cache.get(host, port, family)
+        if addresses is None:
+            loop = asyncio.get_running_loop()
+            addresses = await loop.run_in_executor(
+                None, self._cache.resolve, host, port, family
+            )
+        return [
+            {
+                "hostname": host,
+                "host": addr[0],
+                "port": addr[1],
+                "family": fam,
+                "proto": proto,
+                "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+            }
+            for fam, _, proto, _, addr in addresses
+        ]
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncFetcher:
+    """
+    **EarwigBot: Wiki Toolset: Async Source Fetcher**
+
+    Downloads sources for copyvio checks using :py:mod:`aiohttp` on a single event
+    loop, running in a background thread, instead of a blocking worker thread per
+    download. Many downloads can be in flight at once without a thread waiting on
+    each of them.
+
+    Sources are scheduled as with the global worker threads: checks take turns, at
+    most *max_per_site* sources from a site are fetched at once, and requests to a
+    site are started at least *site_interval* seconds apart. Parsing and comparing
+    downloaded sources is CPU-bound, so it is done by a small pool of *num_threads*
+    threads (or handed to the parse pool, if one is running). At most
+    *max_connections* connections are open at once.
+
+    Checks select this engine by setting the ``fetcher`` search config option to
+    ``"asyncio"``. They then bypass the worker threads entirely, including the
+    global ones started by :py:func:`~earwigbot.wiki.copyvios.globalize`.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 256,
+        num_threads: int = 4,
+        max_per_site: int = 1,
+        site_interval: float = 0,
+    ) -> None:
+        self._max_connections = max_connections
+        self._num_threads = num_threads
+        self._logger = logging.getLogger("earwigbot.wiki.cvfetcher")
+        self._session: aiohttp.ClientSession | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._ready = asyncio.Event()
+        self.scheduler = _SourceScheduler(max_per_site, site_interval, self._wake)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            num_threads, thread_name_prefix="cvfetcher-parse"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="cvfetcher", daemon=True
+        )
+        self._thread.start()
+        self._dispatcher = asyncio.run_coroutine_threadsafe(
+            self._dispatch(), self._loop
+        )
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the AsyncFetcher."""
+        return (
+            f"AsyncFetcher(max_connections={self._max_connections!r}, "
+            f"num_threads={self._num_threads!r})"
+        )
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the AsyncFetcher."""
+        return f"<AsyncFetcher with {self._max_connections} connections>"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session, creating it if necessary.
+
+        This must be called from within the event loop.
+        """
+        if self._session is None:
+            dns_cache = get_dns_cache()
+            if dns_cache is not None:
+                # Our cache keeps entries as long as it likes, so skip aiohttp's:
+                connector = aiohttp.TCPConnector(
+                    limit=self._max_connections,
+                    resolver=_CachedResolver(dns_cache),
+                    use_dns_cache=False,
+                )
+            else:
+                connector = aiohttp.TCPConnector(limit=self._max_connections)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                # Like urllib, only send the headers we were given, and leave the
+                # content compressed so we can check its size while inflating it:
+                skip_auto_headers=["Accept-Encoding"],
+                auto_decompress=False,
+            )
+        return self._session
+
+    async def _request(
+        self,
+        url: str,
+        headers: list[tuple[str, str]] | None,
+        extra_headers: dict[str, str],
+        timeout: float,
+    ) -> aiohttp.ClientResponse:
+        """Send a GET request and return the response once its headers arrive."""
+        return await self._get_session().get(
+            url,
+            headers={**dict(headers or []), **extra_headers},
+            timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout),
+            raise_for_status=True,
+        )
+
+    @staticmethod
+    async def _read(
+        response: aiohttp.ClientResponse,
+        decoder: _ContentDecoder,
+        source: CopyvioSource | None = None,
+    ) -> OpenedURL | None:
+        """Stream a response's body through a decoder, stopping if it says to."""
+        start = time.perf_counter()
+        try:
+            while chunk := await response.content.read(_CHUNK_SIZE):
+                if not decoder.feed(chunk):
+                    return None
+            return decoder.finish()
+        finally:
+            decoder.add_stats(source, time.perf_counter() - start)
+
+    async def _open_url_raw(
+        self,
+        url: str,
+        headers: list[tuple[str, str]] | None,
+        search_config: dict[str, Any] | None,
+        timeout: float = 5,
+        allow_content_types: Container[str] | None = None,
+        validators: dict[str, str] | None = None,
+        source: CopyvioSource | None = None,
+    ) -> OpenedURL | None:
+        """Open a URL, without parsing it.
+
+        None will be returned for URLs that cannot be read for whatever reason. If
+        *validators* are given, the request is conditional, and _NotModifiedError is
+        raised if the server says our copy is current. If *source* is given, the time
+        taken and bytes received are recorded on it.
+        """
+        parsed = urllib.parse.urlparse(url)
+        extra_headers = {
+            "Accept-Encoding": _get_accept_encoding(),
+            **(validators or {}),
+        }
+        url, _ = _try_map_proxy_url(search_config, url, parsed, extra_headers)
+        if source:
+            with _timed(source, "dns"):
+                await self._loop.run_in_executor(None, _resolve_host, url)
+        with _timed(source, "connect"):
+            try:
+                response = await self._request(url, headers, extra_headers, timeout)
+            except _FETCH_ERRORS:
+                url, remapped = _try_map_proxy_url(
+                    search_config, url, parsed, extra_headers, is_error=True
+                )
+                if not remapped:
+                    self._logger.exception(f"Failed to fetch URL: {url}")
+                    return None
+                self._logger.info(f"Failed to fetch URL, trying proxy remap: {url}")
+                try:
+                    response = await self._request(url, headers, extra_headers, timeout)
+                except _FETCH_ERRORS:
+                    self._logger.exception(
+                        f"Failed to fetch URL after proxy remap: {url}"
+                    )
+                    return None
+
+        try:
+            if response.status == 304 and validators:
+                raise _NotModifiedError()
+            parser_class = _get_response_parser(response.headers, allow_content_types)
+            if not parser_class:
+                return None
+            decoder = _ContentDecoder(
+                response.headers.get("Content-Encoding"), parser_class
+            )
+            try:
+                opened = await self._read(response, decoder, source)
+            except _FETCH_ERRORS:
+                return None
+            return _add_cache_headers(opened, response.headers)
+        finally:
+            response.release()
+
+    def _open_url_blocking(
+        self,
+        url: str,
+        headers: list[tuple[str, str]] | None,
+        search_config: dict[str, Any] | None,
+        timeout: float = 5,
+        allow_content_types: Container[str] | None = None,
+    ) -> OpenedURL | None:
+        """Open a URL from outside the event loop, such as while parsing."""
+        coro = self._open_url_raw(
+            url, headers, search_config, timeout, allow_content_types
+        )
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _open_url(
+        self, source: CopyvioSource, redirects: int = 0
+    ) -> dict[int, MarkovChain] | None:
+        """Open a source's URL and return Markov chains of its parsed content.
+
+        This follows the same rules as the worker threads; see
+        :py:meth:`_CopyvioWorker._open_url <.workers._CopyvioWorker._open_url>`.
+        """
+        lookup = await self._loop.run_in_executor(
+            self._executor, _CacheLookup.find, source
+        )
+        if lookup and lookup.fresh:
+            self._logger.debug(f"Loaded from HTTP cache: {source.url}")
+            return await self._loop.run_in_executor(self._executor, lookup.load)
+        try:
+            result = await self._open_url_raw(
+                source.url,
+                source.headers,
+                source.search_config,
+                source.timeout,
+                validators=lookup.validators if lookup else None,
+                source=source,
+            )
+        except _NotModifiedError:
+            assert lookup is not None
+            self._logger.debug(f"Revalidated in HTTP cache: {source.url}")
+            return await self._loop.run_in_executor(self._executor, lookup.load, True)
+        if result is None:
+            return None
+
+        open_url = functools.partial(
+            self._open_url_blocking,
+            headers=source.headers,
+            search_config=source.search_config,
+            timeout=source.timeout,
+        )
+        parsed = await self._loop.run_in_executor(
+            self._executor,
+            _parse_opened,
+            source,
+            result,
+            open_url,
+            self._logger,
+            lookup is not None,
+        )
+        if parsed is None:
+            return None
+        if parsed.redirect is not None:
+            if redirects >= _MAX_REDIRECTS:
+                return None
+            source.url = parsed.redirect
+            return await self._open_url(source, redirects=redirects + 1)
+        if lookup:
+            return await self._loop.run_in_executor(
+                self._executor, lookup.store, result, parsed.chains
+            )
+        return parsed.chains
+
+    async def _handle(self, item: _QueuedSource) -> None:
+        """Download, parse, and compare a single source.
+
+        If the source's check is cancelled while it is being opened, the download
+        is abandoned right away.
+        """
+        source = item.source
+        url = source.url
+        opening = self._loop.create_task(self._open_url(source))
+
+        def cancel() -> None:
+            self._loop.call_soon_threadsafe(opening.cancel)
+
+        cancellation = source.workspace._cancellation
+        cancellation.register(cancel)
+        try:
+            chains = await opening
+        except ParserExclusionError:
+            self._logger.debug("Source excluded by content parser")
+            source.skipped = source.excluded = True
+            source.finish_work()
+        except (_SourceCancelledError, asyncio.CancelledError):
+            self._logger.debug("Source cancelled; check is over")
+            source.skipped = True
+            source.finish_work()
+        except Exception:
+            self._logger.exception("Uncaught exception in fetcher")
+            source.skip()
+            source.finish_work()
+        else:
+            try:
+                await self._loop.run_in_executor(
+                    self._executor, _compare_source, source, url, chains
+                )
+            except Exception:
+                self._logger.exception("Uncaught exception in fetcher")
+        finally:
+            cancellation.unregister(cancel)
+            self.scheduler.release(item)
+
+    def _wake(self) -> None:
+        """Tell the dispatcher that sources may be ready. Safe from any thread."""
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def _dispatch(self) -> None:
+        """Start handling sources as soon as the scheduler says they are ready."""
+        while True:
+            self._ready.clear()
+            items, delay = self.scheduler.get_ready()
+            for item in items:
+                task = self._loop.create_task(self._handle(item))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            try:
+                await asyncio.wait_for(self._ready.wait(), delay)
+            except TimeoutError:
+                pass
+
+    async def _shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self) -> None:
+        """Stop the event loop and its threads, abandoning any downloads."""
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(timeout=5)
+        except (concurrent.futures.TimeoutError, aiohttp.ClientError):
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_async_fetcher() -> AsyncFetcher:
+    """Return the process-wide :py:class:`AsyncFetcher`, starting it if necessary."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = AsyncFetcher()
+        return _fetcher
+
+
+def stop_async_fetcher() -> None:
+    """Shut down the process-wide :py:class:`AsyncFetcher`, if it is running."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            return
+        _fetcher.close()
+        _fetcher = None
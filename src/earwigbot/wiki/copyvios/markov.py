@@ -18,56 +18,361 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from __future__ import annotations
+
 __all__ = [
     "DEFAULT_DEGREE",
     "EMPTY",
     "EMPTY_INTERSECTION",
+    "ChainTable",
     "MarkovChain",
+    "MarkovChainBuilder",
     "MarkovChainIntersection",
+    "MarkovChainUnion",
+    "MultiDegreeChainBuilder",
+    "get_backend",
+    "hash_phrase",
+    "set_backend",
 ]
 
+import bisect
+import functools
+import hashlib
 import re
-from collections.abc import Iterable
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
 from enum import Enum
+from types import ModuleType
+from typing import Any
 
 DEFAULT_DEGREE = 5
 
+_HASH_TYPECODE = "q"  # Signed 64-bit n-gram hashes
+_COUNT_TYPECODE = "I"  # Unsigned 32-bit n-gram counts
+_BACKENDS = ("numpy", "python")
+
+_RE_NON_WORD = re.compile(r"[^\w\s-]")
+_RE_TRAILING_WORD = re.compile(r"\S*\Z")
+
+_backend: str | None = None
+
 
 class Sentinel(Enum):
     START = -1
     END = -2
 
 
-RawChain = dict[tuple[str | Sentinel, ...], int]
+Phrase = Sequence[str | Sentinel]
+
+
+@functools.lru_cache(maxsize=2**16)
+def _hash_word(word: str) -> int:
+    """Return a stable 64-bit hash of a single word."""
+    digest = hashlib.blake2b(word.encode("utf8", "surrogatepass"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+# Words never contain NUL bytes, so these cannot collide with a real word's hash:
+_SENTINEL_HASHES = {
+    Sentinel.START: _hash_word("\0START"),
+    Sentinel.END: _hash_word("\0END"),
+}
+
+
+def _hash_phrase(word_hashes: Iterable[int]) -> int:
+    """Combine a sequence of word hashes into a single 64-bit n-gram hash."""
+    # Unlike strings, tuples of integers hash deterministically across processes:
+    return hash(tuple(word_hashes))
+
+
+def hash_phrase(phrase: Phrase) -> int:
+    """Return the 64-bit hash of an n-gram given as a sequence of words."""
+    return _hash_phrase(
+        _SENTINEL_HASHES[word] if isinstance(word, Sentinel) else _hash_word(word)
+        for word in phrase
+    )
+
+
+def _hash_ngrams(word_hashes: list[int], degree: int) -> list[int]:
+    """Return the hash of every n-gram of the given degree in a list of words."""
+    windows = zip(*(word_hashes[offset:] for offset in range(degree)))
+    return list(map(hash, windows))
+
+
+class ChainTable:
+    """
+    Stores the nodes of a Markov chain compactly.
+
+    Each n-gram is represented by a 64-bit hash; the hashes are kept sorted in an
+    array, with the number of times each n-gram occurs in a parallel array.
+    """
+
+    __slots__ = ("hashes", "counts")
+
+    def __init__(
+        self, hashes: array[int] | None = None, counts: array[int] | None = None
+    ) -> None:
+        self.hashes = hashes if hashes is not None else array(_HASH_TYPECODE)
+        self.counts = counts if counts is not None else array(_COUNT_TYPECODE)
+
+    @classmethod
+    def from_dict(cls, counts: dict[int, int]) -> ChainTable:
+        """Build a table from a mapping of n-gram hashes to counts."""
+        keys = sorted(counts)
+        return cls(
+            array(_HASH_TYPECODE, keys),
+            array(_COUNT_TYPECODE, map(counts.__getitem__, keys)),
+        )
+
+    @classmethod
+    def from_bytes(cls, hashes: bytes, counts: bytes) -> ChainTable:
+        """Rebuild a table from the output of :py:meth:`to_bytes`."""
+        table = cls()
+        table.hashes.frombytes(hashes)
+        table.counts.frombytes(counts)
+        if len(table.hashes) != len(table.counts):
+            raise ValueError("Mismatched hash and count arrays")
+        return table
+
+    def to_bytes(self) -> tuple[bytes, bytes]:
+        """Serialize the table's hashes and counts, in machine byte order."""
+        return self.hashes.tobytes(), self.counts.tobytes()
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the ChainTable."""
+        return f"ChainTable(hashes={self.hashes!r}, counts={self.counts!r})"
+
+    def __len__(self) -> int:
+        """Return the number of distinct n-grams in the table."""
+        return len(self.hashes)
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the n-gram hashes in the table, in sorted order."""
+        return iter(self.hashes)
+
+    def __contains__(self, phrase: Phrase | int) -> bool:
+        """Return whether the given n-gram (or n-gram hash) is in the table."""
+        return self._index(phrase) >= 0
+
+    def _index(self, phrase: Phrase | int) -> int:
+        """Return the position of the given n-gram in the table, or -1."""
+        key = phrase if isinstance(phrase, int) else hash_phrase(phrase)
+        index = bisect.bisect_left(self.hashes, key)
+        if index < len(self.hashes) and self.hashes[index] == key:
+            return index
+        return -1
+
+    def get(self, phrase: Phrase | int, default: int = 0) -> int:
+        """Return the number of times the given n-gram occurs in the table."""
+        index = self._index(phrase)
+        return self.counts[index] if index >= 0 else default
+
+    def items(self) -> Iterator[tuple[int, int]]:
+        """Iterate over (hash, count) pairs in the table, in sorted order."""
+        return zip(self.hashes, self.counts)
+
+    def values(self) -> array[int]:
+        """Return the counts of each n-gram in the table."""
+        return self.counts
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate number of bytes used to store the table."""
+        return (
+            len(self.hashes) * self.hashes.itemsize
+            + len(self.counts) * self.counts.itemsize
+        )
+
+
+@functools.cache
+def _import_numpy() -> ModuleType | None:
+    """Return the numpy module if it is available, or None."""
+    try:
+        import numpy
+    except ModuleNotFoundError:
+        return None
+    return numpy
+
+
+def get_backend() -> str:
+    """
+    Return the name of the engine used to build and compare chains.
+
+    This is ``"numpy"`` if :py:mod:`numpy` is installed, unless overridden by
+    :py:func:`set_backend`, and ``"python"`` otherwise.
+    """
+    if _backend:
+        return _backend
+    return "numpy" if _import_numpy() else "python"
+
+
+def set_backend(name: str | None) -> None:
+    """
+    Force chains to be built and compared using the given engine.
+
+    *name* should be ``"numpy"`` or ``"python"``, or ``None`` to pick one
+    automatically. Both engines produce identical chains.
+    """
+    global _backend
+    if name is not None and name not in _BACKENDS:
+        raise ValueError(f"Unknown chain backend: {name!r}")
+    if name == "numpy" and not _import_numpy():
+        raise ValueError("The numpy chain backend requires numpy to be installed")
+    _backend = name
+
+
+def _to_array(typecode: str, values: Any) -> array[int]:
+    """Convert a numpy array into a Python array of the given type."""
+    result = array(typecode)
+    result.frombytes(values.astype(typecode, copy=False).tobytes())
+    return result
+
+
+def _table_from_counts(counts: dict[int, int]) -> ChainTable:
+    """Convert a mapping of n-gram hashes to counts into a table."""
+    np = _import_numpy() if get_backend() == "numpy" else None
+    if not np:
+        return ChainTable.from_dict(counts)
+
+    keys = np.fromiter(counts.keys(), dtype=_HASH_TYPECODE, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=_COUNT_TYPECODE, count=len(counts))
+    order = np.argsort(keys)
+    return ChainTable(
+        _to_array(_HASH_TYPECODE, keys[order]),
+        _to_array(_COUNT_TYPECODE, values[order]),
+    )
+
+
+def _intersect(table1: ChainTable, table2: ChainTable) -> ChainTable:
+    """Return the shared nodes of two tables, with the minimum of their counts."""
+    np = _import_numpy() if get_backend() == "numpy" else None
+    if np:
+        hashes1 = np.frombuffer(table1.hashes, dtype=_HASH_TYPECODE)
+        hashes2 = np.frombuffer(table2.hashes, dtype=_HASH_TYPECODE)
+        counts1 = np.frombuffer(table1.counts, dtype=_COUNT_TYPECODE)
+        counts2 = np.frombuffer(table2.counts, dtype=_COUNT_TYPECODE)
+        common, index1, index2 = np.intersect1d(
+            hashes1, hashes2, assume_unique=True, return_indices=True
+        )
+        return ChainTable(
+            _to_array(_HASH_TYPECODE, common),
+            _to_array(_COUNT_TYPECODE, np.minimum(counts1[index1], counts2[index2])),
+        )
+
+    if len(table1) > len(table2):
+        table1, table2 = table2, table1
+    # Look up each node of the smaller table in the larger one by binary search:
+    others, other_counts = table2.hashes, table2.counts
+    size = len(others)
+    hashes = array(_HASH_TYPECODE)
+    counts = array(_COUNT_TYPECODE)
+    for key, count in zip(table1.hashes, table1.counts):
+        index = bisect.bisect_left(others, key)
+        if index < size and others[index] == key:
+            hashes.append(key)
+            counts.append(min(count, other_counts[index]))
+    return ChainTable(hashes, counts)
+
+
+def _union(tables: Iterable[ChainTable]) -> ChainTable:
+    """Return the combined nodes of several tables, with the sum of their counts."""
+    np = _import_numpy() if get_backend() == "numpy" else None
+    if np:
+        tables = list(tables)
+        if not tables:
+            return ChainTable()
+        hashes = np.concatenate(
+            [np.frombuffer(table.hashes, dtype=_HASH_TYPECODE) for table in tables]
+        )
+        counts = np.concatenate(
+            [np.frombuffer(table.counts, dtype=_COUNT_TYPECODE) for table in tables]
+        )
+        keys, inverse = np.unique(hashes, return_inverse=True)
+        totals = np.bincount(inverse, weights=counts, minlength=len(keys))
+        return ChainTable(
+            _to_array(_HASH_TYPECODE, keys), _to_array(_COUNT_TYPECODE, totals)
+        )
+
+    merged: dict[int, int] = {}
+    for table in tables:
+        for key, count in zip(table.hashes, table.counts):
+            merged[key] = merged.get(key, 0) + count
+    return ChainTable.from_dict(merged)
 
 
 class MarkovChain:
     """Implements a basic ngram Markov chain of words."""
 
     def __init__(self, text: str, degree: int = DEFAULT_DEGREE) -> None:
-        self.text = text
+        self.text: str | None = text
         self.degree = degree  # 2 for bigrams, 3 for trigrams, etc.
         self.chain = self._build()
         self.size = self._get_size()
 
-    def _build(self) -> RawChain:
-        """Build and return the Markov chain from the input text."""
-        padding = self.degree - 1
-        words = re.sub(r"[^\w\s-]", "", self.text.lower()).split()
-        words = ([Sentinel.START] * padding) + words + ([Sentinel.END] * padding)
-        chain: RawChain = {}
-
-        for i in range(len(words) - self.degree + 1):
-            phrase = tuple(words[i : i + self.degree])
-            if phrase in chain:
-                chain[phrase] += 1
-            else:
-                chain[phrase] = 1
+    @classmethod
+    def from_chunks(
+        cls,
+        chunks: Iterable[str],
+        degree: int = DEFAULT_DEGREE,
+        keep_text: bool = False,
+    ) -> MarkovChain:
+        """
+        Build a chain from an iterable of text chunks, such as parser output.
+
+        The result is the same as building a chain from the chunks joined together,
+        but the full text is never held in memory at once unless *keep_text* is
+        ``True``. Otherwise, the chain's :py:attr:`text` will be ``None``.
+        """
+        builder = MarkovChainBuilder(degree, keep_text=keep_text)
+        for chunk in chunks:
+            builder.feed(chunk)
+        return builder.build()
+
+    @classmethod
+    def _from_table(
+        cls, table: ChainTable, degree: int, text: str | None
+    ) -> MarkovChain:
+        """Create a chain directly from a prebuilt table."""
+        chain = cls.__new__(cls)
+        chain.text = text
+        chain.degree = degree
+        chain.chain = table
+        chain.size = chain._get_size()
         return chain
 
+    def _build(self) -> ChainTable:
+        """Build and return the Markov chain from the input text."""
+        assert self.text is not None
+        builder = MarkovChainBuilder(self.degree)
+        builder.feed(self.text)
+        return builder.build_table()
+
     def _get_size(self) -> int:
         """Return the size of the Markov chain: the total number of nodes."""
-        return sum(self.chain.values())
+        return sum(self.chain.counts)
+
+    def find_phrases(self, other: MarkovChain, limit: int) -> list[tuple[str, ...]]:
+        """
+        Return up to *limit* of this chain's n-grams that are also nodes of *other*.
+
+        Since chains only store hashes, the n-grams are recovered from this chain's
+        :py:attr:`text`, which must be available. They are ordered by their count in
+        *other*, most frequent first, and then by where they first appear. N-grams
+        spanning the start or end of the text are not included.
+        """
+        if self.text is None:
+            raise ValueError("Cannot find phrases in a chain without text")
+        words = _RE_NON_WORD.sub("", self.text.lower()).split()
+        hashes = _hash_ngrams(list(map(_hash_word, words)), self.degree)
+
+        found: dict[int, int] = {}
+        for index, key in enumerate(hashes):
+            if key not in found and key in other.chain:
+                found[key] = index
+        # The sort is stable and found is in order of appearance, so ties keep it:
+        best = sorted(found, key=lambda key: -other.chain.get(key))[:limit]
+        return [tuple(words[found[key] : found[key] + self.degree]) for key in best]
 
     def __repr__(self) -> str:
         """Return the canonical string representation of the MarkovChain."""
@@ -78,6 +383,160 @@ class MarkovChain:
         return f"<MarkovChain of size {self.size}>"
 
 
+class _ChainBuilderBase:
+    """Tokenizes a stream of text chunks and counts n-grams of one or more degrees."""
+
+    FEED_SIZE = 64 * 1024
+
+    def __init__(self, degrees: Iterable[int], keep_text: bool = False) -> None:
+        self._degrees = sorted(set(degrees))
+        if not self._degrees or self._degrees[0] < 1:
+            raise ValueError("Chain degrees must be positive integers")
+        self._keep_text = keep_text
+        self._padding = self._degrees[-1] - 1
+        self._text: list[str] = []
+        self._pending: list[str] = []
+        self._pending_size = 0
+        self._partial = ""
+        self._window = [_SENTINEL_HASHES[Sentinel.START]] * self._padding
+        self._counts: dict[int, Counter[int]] = {
+            degree: Counter() for degree in self._degrees
+        }
+        self._empty = True
+        self._done = False
+
+    @property
+    def empty(self) -> bool:
+        """Whether no text has been fed to the builder yet."""
+        return self._empty
+
+    def _count_ngrams(self, hashes: list[int]) -> None:
+        """Count the n-grams of each degree ending in the non-window hashes."""
+        for degree, counts in self._counts.items():
+            # The window holds enough context for the largest degree; trim it:
+            counts.update(_hash_ngrams(hashes[self._padding - degree + 1 :], degree))
+
+    def _add_words(self, text: str) -> None:
+        """Tokenize the given text and count the n-grams it completes."""
+        words = _RE_NON_WORD.sub("", text.lower()).split()
+        if not words:
+            return
+        hashes = self._window + list(map(_hash_word, words))
+        self._count_ngrams(hashes)
+        self._window = hashes[len(hashes) - self._padding :]
+
+    def _flush(self) -> None:
+        """Process buffered text, holding back a possibly incomplete last word."""
+        text = self._partial + "".join(self._pending)
+        self._pending.clear()
+        self._pending_size = 0
+        match = _RE_TRAILING_WORD.search(text)
+        split = match.start() if match else len(text)
+        self._partial = text[split:]
+        self._add_words(text[:split])
+
+    def feed(self, chunk: str) -> None:
+        """Add a chunk of text to the chain."""
+        if self._done:
+            raise ValueError("Cannot feed text to a finished chain builder")
+        if not chunk:
+            return
+        self._empty = False
+        if self._keep_text:
+            self._text.append(chunk)
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+        if self._pending_size >= self.FEED_SIZE:
+            self._flush()
+
+    def _finish(self) -> dict[int, ChainTable]:
+        """Finish building and return the table of n-gram counts for each degree."""
+        if self._done:
+            raise ValueError("Chain builder has already finished")
+        self._done = True
+        self._flush()
+        self._add_words(self._partial)
+        self._partial = ""
+
+        end = _SENTINEL_HASHES[Sentinel.END]
+        tables = {}
+        for degree, counts in self._counts.items():
+            tail = self._window[self._padding - degree + 1 :] + [end] * (degree - 1)
+            counts.update(_hash_ngrams(tail, degree))
+            tables[degree] = _table_from_counts(counts)
+            counts.clear()
+        return tables
+
+    def _finish_text(self) -> str | None:
+        """Return the full text fed to the builder, if it was kept."""
+        text = "".join(self._text) if self._keep_text else None
+        self._text.clear()
+        return text
+
+
+class MarkovChainBuilder(_ChainBuilderBase):
+    """
+    Builds a Markov chain incrementally from a stream of text chunks.
+
+    Text is tokenized as it arrives. Only a sliding window of the last few words and
+    the counts of the n-grams seen so far are kept, so memory use is proportional to
+    the number of distinct n-grams rather than the length of the text.
+    """
+
+    def __init__(self, degree: int = DEFAULT_DEGREE, keep_text: bool = False) -> None:
+        super().__init__([degree], keep_text=keep_text)
+        self.degree = degree
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the builder."""
+        return f"MarkovChainBuilder(degree={self.degree!r})"
+
+    def build_table(self) -> ChainTable:
+        """Finish building and return the chain's table of n-gram counts."""
+        return self._finish()[self.degree]
+
+    def build(self) -> MarkovChain:
+        """Finish building and return the resulting :py:class:`MarkovChain`."""
+        text = self._finish_text()
+        return MarkovChain._from_table(self.build_table(), self.degree, text)
+
+
+class MultiDegreeChainBuilder(_ChainBuilderBase):
+    """
+    Builds Markov chains of several degrees at once from a stream of text chunks.
+
+    This works like :py:class:`MarkovChainBuilder`, but the text is only tokenized
+    and hashed once, no matter how many degrees are requested.
+    """
+
+    def __init__(self, degrees: Iterable[int], keep_text: bool = False) -> None:
+        super().__init__(degrees, keep_text=keep_text)
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the builder."""
+        return f"MultiDegreeChainBuilder(degrees={self.degrees!r})"
+
+    @property
+    def degrees(self) -> list[int]:
+        """The degrees of the chains being built, in ascending order."""
+        return list(self._degrees)
+
+    def build_tables(self) -> dict[int, ChainTable]:
+        """Finish building and return the table of n-gram counts for each degree."""
+        return self._finish()
+
+    def build(self) -> dict[int, MarkovChain]:
+        """Finish building and return a :py:class:`MarkovChain` for each degree.
+
+        If the text was kept, it is shared between the chains.
+        """
+        text = self._finish_text()
+        return {
+            degree: MarkovChain._from_table(table, degree, text)
+            for degree, table in self._finish().items()
+        }
+
+
 class MarkovChainIntersection(MarkovChain):
     """Implements the intersection of two chains (i.e., their shared nodes)."""
 
@@ -86,16 +545,9 @@ class MarkovChainIntersection(MarkovChain):
         self.chain = self._build()
         self.size = self._get_size()
 
-    def _build(self) -> RawChain:
+    def _build(self) -> ChainTable:
         """Build and return the Markov chain from the input chains."""
-        c1 = self.mc1.chain
-        c2 = self.mc2.chain
-        chain: RawChain = {}
-
-        for phrase in c1:
-            if phrase in c2:
-                chain[phrase] = min(c1[phrase], c2[phrase])
-        return chain
+        return _intersect(self.mc1.chain, self.mc2.chain)
 
     def __repr__(self) -> str:
         """Return the canonical string representation of the intersection."""
@@ -116,16 +568,9 @@ class MarkovChainUnion(MarkovChain):
         self.chain = self._build()
         self.size = self._get_size()
 
-    def _build(self) -> RawChain:
+    def _build(self) -> ChainTable:
         """Build and return the Markov chain from the input chains."""
-        union: RawChain = {}
-        for chain in self.chains:
-            for phrase, count in chain.chain.items():
-                if phrase in union:
-                    union[phrase] += count
-                else:
-                    union[phrase] = count
-        return union
+        return _union(chain.chain for chain in self.chains)
 
     def __repr__(self) -> str:
         """Return the canonical string representation of the union."""
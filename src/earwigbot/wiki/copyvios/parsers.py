@@ -22,29 +22,36 @@ from __future__ import annotations
 
 __all__ = ["ArticleParser", "get_parser"]
 
-import io
+import functools
+import importlib.util
 import json
-import os.path
 import re
 import typing
 import urllib.parse
 import urllib.request
 from abc import ABC, abstractmethod
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Iterator
 from typing import Any, ClassVar, Literal, TypedDict
 
 import mwparserfromhell
 
 from earwigbot.exceptions import ParserExclusionError, ParserRedirectError
+from earwigbot.wiki.copyvios.tokenizers import get_tokenizer, warm_up_tokenizers
 
 if typing.TYPE_CHECKING:
     import bs4
+    from lxml import etree
 
     from earwigbot.wiki.copyvios.workers import OpenedURL
+    from earwigbot.wiki.page import ParseCache
 
 
 class ArticleParser:
-    """A parser that can strip and chunk wikicode article text."""
+    """A parser that can strip and chunk wikicode article text.
+
+    Given the *parse_cache* of the page the text came from, the text is parsed only
+    once for all users of the cache, and stripped text and links are shared.
+    """
 
     TEMPLATE_MERGE_THRESHOLD = 35
     NLTK_DEFAULT = "english"
@@ -68,10 +75,17 @@ class ArticleParser:
         "tr": "turkish",
     }
 
-    def __init__(self, text: str, lang: str, nltk_dir: str) -> None:
+    def __init__(
+        self,
+        text: str,
+        lang: str,
+        nltk_dir: str,
+        parse_cache: ParseCache | None = None,
+    ) -> None:
         self.text = text
         self._lang = lang
         self._nltk_dir = nltk_dir
+        self._parse_cache = parse_cache
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(text={self.text!r})"
@@ -93,19 +107,23 @@ class ArticleParser:
             else:
                 code.remove(template)
 
-    def _get_tokenizer(self) -> Any:
-        """Return a NLTK punctuation tokenizer for the article's language."""
-        os.environ["NLTK_DATA"] = self._nltk_dir  # Yuck!
+    @classmethod
+    def warm_up(cls, langs: Iterable[str], nltk_dir: str) -> list[str]:
+        """Load the sentence tokenizers for some site languages ahead of time.
 
-        import nltk
-        from nltk.tokenize import PunktTokenizer
+        Otherwise, each is loaded the first time an article in that language is
+        chunked. Return the languages that couldn't be loaded.
+        """
+        nltk_langs = {
+            lang: cls.NLTK_LANGS.get(lang, cls.NLTK_DEFAULT) for lang in langs
+        }
+        failed = warm_up_tokenizers(set(nltk_langs.values()), nltk_dir)
+        return [lang for lang, nltk_lang in nltk_langs.items() if nltk_lang in failed]
 
+    def _get_tokenizer(self) -> Any:
+        """Return a NLTK punctuation tokenizer for the article's language."""
         lang = self.NLTK_LANGS.get(self._lang, self.NLTK_DEFAULT)
-        try:
-            PunktTokenizer(lang)
-        except LookupError:
-            nltk.download("punkt_tab", self._nltk_dir)
-        return PunktTokenizer(lang)
+        return get_tokenizer(lang, self._nltk_dir)
 
     def _get_sentences(
         self, min_query: int, max_query: int, split_thresh: int
@@ -150,6 +168,14 @@ class ArticleParser:
 
         The actual stripping is handled by :py:mod:`mwparserfromhell`.
         """
+        if self._parse_cache:
+            self.clean = self._parse_cache.get_result("strip", self._strip)
+        else:
+            self.clean = self._strip()
+        return self.clean
+
+    def _strip(self) -> str:
+        """Strip the article's text, as in :py:meth:`strip`."""
 
         def remove(
             code: mwparserfromhell.wikicode.Wikicode, node: mwparserfromhell.nodes.Node
@@ -166,7 +192,13 @@ class ArticleParser:
             except ValueError:
                 pass
 
-        wikicode = mwparserfromhell.parse(self.text)
+        # We modify the tree, so it can't be the one shared by the parse cache:
+        if self._parse_cache:
+            wikicode = self._parse_cache.take()
+            # The links are gone once the tree is stripped, so find them first:
+            self._parse_cache.get_result("links", lambda: self._find_links(wikicode))
+        else:
+            wikicode = mwparserfromhell.parse(self.text)
 
         # Preemtively strip some links mwparser doesn't know about:
         bad_prefixes = ("file:", "image:", "category:")
@@ -182,8 +214,7 @@ class ArticleParser:
         self._merge_templates(wikicode)
 
         clean = wikicode.strip_code(normalize=True, collapse=True)
-        self.clean = re.sub(r"\n\n+", "\n", clean).strip()
-        return self.clean
+        return re.sub(r"\n\n+", "\n", clean).strip()
 
     def chunk(
         self,
@@ -232,14 +263,77 @@ class ArticleParser:
         The list is restricted to things that we suspect we can parse: i.e.,
         those with schemes of ``http`` and ``https``.
         """
+        if self._parse_cache:
+            cache = self._parse_cache
+            return list(
+                cache.get_result("links", lambda: self._find_links(cache.wikicode))
+            )
+        return self._find_links(mwparserfromhell.parse(self.text))
+
+    @staticmethod
+    def _find_links(wikicode: mwparserfromhell.wikicode.Wikicode) -> list[str]:
+        """Return the external links in some wikicode, as in :py:meth:`get_links`."""
         schemes = ("http://", "https://")
-        links = mwparserfromhell.parse(self.text).ifilter_external_links()
+        links = wikicode.ifilter_external_links()
         return [str(link.url) for link in links if link.url.startswith(schemes)]
 
 
+def _trie_pattern(words: Iterable[bytes]) -> bytes:
+    """Build a regex that matches any of *words*, with common prefixes merged.
+
+    Branching only where the words differ lets the regex engine match all of them
+    in one pass over the text, much like an Aho-Corasick automaton.
+    """
+    trie: dict[int, Any] = {}
+    for word in words:
+        node = trie
+        for byte in word:
+            node = node.setdefault(byte, {})
+        node[-1] = {}
+
+    def build(node: dict[int, Any]) -> bytes:
+        end = -1 in node
+        branches = [
+            re.escape(bytes([byte])) + build(child)
+            for byte, child in sorted(node.items())
+            if byte != -1
+        ]
+        if not branches:
+            return b""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        return b"(?:" + b"|".join(branches) + b")" + (b"?" if end else b"")
+
+    return build(trie)
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_mirror_hints(hints: tuple[str, ...]) -> re.Pattern[bytes] | None:
+    """Compile a check's mirror hints into one regex, or None if there are none."""
+    words = {hint.encode("utf-8") for hint in hints if hint}
+    return re.compile(_trie_pattern(words)) if words else None
+
+
+# Matches the part of a tag before a mirror hint, if the hint is in a link:
+_MIRROR_LINK_PREFIX = re.compile(
+    rb"""\s(?:href|src)\s*=\s*(?:"[^"]*|'[^']*|[^\s"'>]*)\Z""", re.IGNORECASE
+)
+# Character references that may decode to part of a hint (&amp; only gives "&"):
+_MIRROR_ENTITY = re.compile(rb"&(?:#|(?!amp;)[a-z][a-z0-9]*;)", re.IGNORECASE)
+# Elements whose content is text, so links in it are not real attributes:
+_RAW_TEXT_TAGS = (b"script", b"style", b"textarea", b"title")
+
+
+@functools.cache
+def _has_lxml() -> bool:
+    """Return whether lxml is installed, for the faster way of parsing HTML."""
+    return importlib.util.find_spec("lxml") is not None
+
+
 class ParserArgs(TypedDict, total=False):
     mirror_hints: list[str]
     open_url: Callable[[str], OpenedURL | None]
+    cancelled: Callable[[], bool]
 
 
 class SourceParser(ABC):
@@ -251,6 +345,8 @@ class SourceParser(ABC):
         self.text = text
         self.url = url
         self._args = args or {}
+        #: Why the parsed text is incomplete, if it is, once parsing is done
+        self.truncated: str | None = None
 
     def __repr__(self) -> str:
         """Return the canonical string representation of the text parser."""
@@ -263,12 +359,94 @@ class SourceParser(ABC):
     @abstractmethod
     def parse(self) -> str: ...
 
+    def iter_parse(self) -> Iterator[str]:
+        """
+        Yield the text contained within the document in chunks.
+
+        Joined together, the chunks are equal to the result of :py:meth:`parse`.
+        Parsers that can produce their output incrementally override this, so the
+        text can be fed straight into a
+        :py:class:`~earwigbot.wiki.copyvios.markov.MarkovChainBuilder`.
+        """
+        text = self.parse()
+        if text:
+            yield text
+
 
 class HTMLParser(SourceParser):
     """A parser that can extract the text from an HTML document."""
 
     TYPE = "HTML"
     hidden_tags = ["script", "style"]
+    #: Whether to extract text from an :py:mod:`lxml` tree directly, if lxml is
+    #: installed, instead of building a BeautifulSoup tree; the text is the same
+    use_lxml = True
+    # Tags whose text BeautifulSoup keeps apart from the document's strings:
+    _container_tags = ("template", "rt", "rp")
+
+    def _is_mirror_link(self, attr: str | None) -> bool:
+        """Return whether an attribute value links to a known wiki mirror."""
+        if not attr:
+            return False
+        return any(hint in attr for hint in self._args.get("mirror_hints", []))
+
+    def _scan_for_mirror(self) -> bool:
+        """
+        Look for links to known wiki mirrors in the raw document, before parsing it.
+
+        Raise ParserExclusionError if one is found. Return False if the scan can't
+        rule out a link, so the parsed tree must be checked instead: either the
+        document isn't in an ASCII-compatible encoding, a hint comes after a ``>``
+        that may be inside a quoted attribute value rather than closing a tag, a
+        hint may be inside a comment or a script, or a link contains a character
+        reference that could hide a hint.
+        """
+        hints = self._args.get("mirror_hints")
+        pattern = _compile_mirror_hints(tuple(hints)) if hints else None
+        if not pattern:
+            return True
+
+        text = self.text.encode("utf-8") if isinstance(self.text, str) else self.text
+        if b"\x00" in text[:1024]:  # UTF-16 or UTF-32
+            return False
+
+        unclear = False
+        for match in pattern.finditer(text):
+            start = match.start()
+            tag = text.rfind(b"<", 0, start)
+            if tag < 0:
+                continue
+            if text.rfind(b">", tag, start) >= 0:
+                # Without quotes, the ">" must have ended the tag before the hint:
+                if text.find(b'"', tag, start) >= 0 or text.find(b"'", tag, start) >= 0:
+                    unclear = True
+                continue
+            if _MIRROR_LINK_PREFIX.search(text, tag, start):
+                if self._in_raw_text(text, start):
+                    unclear = True
+                    continue
+                raise ParserExclusionError()
+        if unclear:
+            return False
+
+        for match in _MIRROR_ENTITY.finditer(text):
+            start = match.start()
+            tag = text.rfind(b"<", 0, start)
+            if tag >= 0 and _MIRROR_LINK_PREFIX.search(text, tag, start):
+                return False
+        return True
+
+    @staticmethod
+    def _in_raw_text(text: bytes, pos: int) -> bool:
+        """Return whether *pos* may be inside a comment or a script in raw HTML."""
+        comment = text.rfind(b"<!--", 0, pos)
+        if comment >= 0 and text.find(b"-->", comment + 4, pos) < 0:
+            return True
+        before = text[:pos].lower()
+        for name in _RAW_TEXT_TAGS:
+            if before.rfind(b"<" + name) > before.rfind(b"</" + name):
+                return True
+        return False
 
     def _fail_if_mirror(self, soup: bs4.BeautifulSoup) -> None:
         """
@@ -280,13 +458,76 @@ class HTMLParser(SourceParser):
         if "mirror_hints" not in self._args:
             return
 
-        def func(attr):
-            assert "mirror_hints" in self._args
-            return attr and any(hint in attr for hint in self._args["mirror_hints"])
-
+        func = self._is_mirror_link
         if soup.find_all(href=func) or soup.find_all(src=func):
             raise ParserExclusionError()
 
+    def _fail_if_mirror_tree(self, root: etree._Element) -> None:
+        """Like :py:meth:`_fail_if_mirror`, but for an lxml tree."""
+        if "mirror_hints" not in self._args:
+            return
+
+        from lxml import etree
+
+        for element in root.iter(etree.Element):
+            for attr in ("href", "src"):
+                if self._is_mirror_link(element.get(attr)):
+                    raise ParserExclusionError()
+
+    @staticmethod
+    def _get_tree(text: bytes | str) -> etree._Element | None:
+        """Parse some text into an lxml tree, as BeautifulSoup would with lxml.
+
+        The encoding is found the same way, and the text is fed to the parser in the
+        same way, so the trees match. Return None if the document is empty.
+        """
+        from bs4.dammit import EncodingDetector
+        from lxml import etree
+
+        candidates: Iterable[tuple[bytes | str, str | None]]
+        if isinstance(text, str):
+            candidates = [
+                (text.removeprefix("\N{BYTE ORDER MARK}"), None),
+                (text.encode("utf8"), "utf8"),
+            ]
+        else:
+            detector = EncodingDetector(text, is_html=True)
+            candidates = ((detector.markup, enc) for enc in detector.encodings)
+        for markup, encoding in candidates:
+            parser = etree.HTMLParser(recover=True, encoding=encoding)
+            try:
+                parser.feed(markup)
+                return parser.close()
+            except (UnicodeDecodeError, LookupError, etree.ParserError):
+                continue
+        return None
+
+    def _iter_tree_strings(self, body: etree._Element) -> Iterator[str]:
+        """Yield the visible text of an lxml element, as BeautifulSoup would."""
+        hidden = {*self.hidden_tags, *self._container_tags}
+
+        def strings() -> Iterator[str | None]:
+            yield body.text
+            stack = [(body, iter(body))]
+            while stack:
+                parent, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    if stack:
+                        yield parent.tail
+                elif not isinstance(child.tag, str) or child.tag in hidden:
+                    yield child.tail  # Skip comments and hidden tags, not what follows
+                else:
+                    yield child.text
+                    stack.append((child, iter(child)))
+
+        separator = ""
+        for string in strings():
+            if string and (string := string.strip()):
+                yield separator + string.replace("\n", " ")
+                separator = "\n"
+
     @staticmethod
     def _get_soup(text: bytes) -> bs4.BeautifulSoup:
         """Parse some text using BeautifulSoup."""
@@ -297,8 +538,8 @@ class HTMLParser(SourceParser):
         except ValueError:
             return bs4.BeautifulSoup(text)
 
-    def _clean_soup(self, soup: bs4.element.Tag) -> str:
-        """Clean a BeautifulSoup tree of invisible tags."""
+    def _iter_clean_soup(self, soup: bs4.element.Tag) -> Iterator[str]:
+        """Clean a BeautifulSoup tree of invisible tags and yield its text."""
         import bs4
 
         def is_comment(text: str | None) -> bool:
@@ -310,7 +551,14 @@ class HTMLParser(SourceParser):
             for element in soup.find_all(tag):
                 element.extract()
 
-        return "\n".join(s.replace("\n", " ") for s in soup.stripped_strings)
+        separator = ""
+        for string in soup.stripped_strings:
+            yield separator + string.replace("\n", " ")
+            separator = "\n"
+
+    def _clean_soup(self, soup: bs4.element.Tag) -> str:
+        """Clean a BeautifulSoup tree of invisible tags."""
+        return "".join(self._iter_clean_soup(soup))
 
     def _open(self, url: str, **kwargs: Any) -> bytes | None:
         """Try to read a URL. Return None if it couldn't be read."""
@@ -347,28 +595,32 @@ class HTMLParser(SourceParser):
             text = parsed["entry"]["content"]["$t"]
         except KeyError:
             return ""
+        if self.use_lxml and _has_lxml():
+            root = self._get_tree(text)
+            body = next(root.iter("body"), None) if root is not None else None
+            return "".join(self._iter_tree_strings(body)) if body is not None else ""
         soup = self._get_soup(text)
         if not soup.body:
             return ""
         return self._clean_soup(soup.body)
 
-    def parse(self) -> str:
-        """
-        Return the actual text contained within an HTML document.
+    def _parse_soup(
+        self, url: urllib.parse.ParseResult | None, check_mirror: bool = False
+    ) -> Iterator[str] | None:
+        """Return the text of the document in chunks, using BeautifulSoup.
 
-        Implemented using :py:mod:`BeautifulSoup <bs4>`
-        (https://pypi.org/project/beautifulsoup4/).
+        Return None if the document has no body.
         """
         import bs4
 
-        url = urllib.parse.urlparse(self.url) if self.url else None
         soup = self._get_soup(self.text)
         if not soup.body:
             # No <body> tag present in HTML -> # no scrapable content
             # (possibly JS or <iframe> magic):
-            return ""
+            return None
 
-        self._fail_if_mirror(soup)
+        if check_mirror:
+            self._fail_if_mirror(soup)
         body = soup.body
 
         if url and url.netloc == "web.archive.org" and url.path.endswith(".pdf"):
@@ -376,12 +628,64 @@ class HTMLParser(SourceParser):
             if isinstance(playback, bs4.element.Tag) and "src" in playback.attrs:
                 raise ParserRedirectError(playback.attrs["src"])
 
-        content = self._clean_soup(body)
+        return self._iter_clean_soup(body)
 
-        if url and url.netloc.endswith(".blogspot.com") and not content:
-            content = self._load_from_blogspot(url)
+    def _parse_tree(
+        self, url: urllib.parse.ParseResult | None, check_mirror: bool = False
+    ) -> Iterator[str] | None:
+        """Return the text of the document in chunks, using lxml directly.
+
+        Return None if the document has no body.
+        """
+        try:
+            root = self._get_tree(self.text)
+        except ValueError:  # BeautifulSoup would fall back to html.parser here
+            return self._parse_soup(url, check_mirror)
+        body = next(root.iter("body"), None) if root is not None else None
+        if body is None:
+            return None
 
-        return content
+        if check_mirror:
+            self._fail_if_mirror_tree(root)
+
+        if url and url.netloc == "web.archive.org" and url.path.endswith(".pdf"):
+            for element in body.iterdescendants():
+                if element.get("id") == "playback":
+                    if element.get("src") is not None:
+                        raise ParserRedirectError(element.get("src"))
+                    break
+
+        return self._iter_tree_strings(body)
+
+    def parse(self) -> str:
+        """
+        Return the actual text contained within an HTML document.
+
+        Implemented using :py:mod:`lxml` (https://lxml.de/) if it is installed, or
+        else :py:mod:`BeautifulSoup <bs4>` (https://pypi.org/project/beautifulsoup4/).
+        """
+        return "".join(self.iter_parse())
+
+    def iter_parse(self) -> Iterator[str]:
+        """Yield the text contained within an HTML document in chunks."""
+        url = urllib.parse.urlparse(self.url) if self.url else None
+        check_mirror = not self._scan_for_mirror()
+        if self.use_lxml and _has_lxml():
+            chunks = self._parse_tree(url, check_mirror)
+        else:
+            chunks = self._parse_soup(url, check_mirror)
+        if chunks is None:
+            return
+
+        empty = True
+        for chunk in chunks:
+            empty = False
+            yield chunk
+
+        if url and url.netloc.endswith(".blogspot.com") and empty:
+            content = self._load_from_blogspot(url)
+            if content:
+                yield content
 
 
 class PDFParser(SourceParser):
@@ -393,28 +697,37 @@ class PDFParser(SourceParser):
         ("\u2022", " "),
     ]
 
-    def parse(self) -> str:
-        """Return extracted text from the PDF."""
-        from pdfminer import converter, pdfinterp, pdfpage
+    def _iter_pages(self) -> Iterator[str]:
+        """Yield the raw text of each page in the PDF, stopping at any error.
 
-        output = io.StringIO()
-        manager = pdfinterp.PDFResourceManager()
-        conv = converter.TextConverter(manager, output)
-        interp = pdfinterp.PDFPageInterpreter(manager, conv)
+        Text is extracted in the PDF pool, unless it is disabled; see
+        :py:class:`~earwigbot.wiki.copyvios.pdfpool.PDFPool`.
+        """
+        from earwigbot.wiki.copyvios.pdfpool import extract_pdf
 
-        try:
-            pages = pdfpage.PDFPage.get_pages(io.BytesIO(self.text))
-            for page in pages:
-                interp.process_page(page)
-        except Exception:  # pylint: disable=broad-except
-            return output.getvalue()
-        finally:
-            conv.close()
-
-        value = output.getvalue()
-        for orig, new in self.substitutions:
-            value = value.replace(orig, new)
-        return re.sub(r"\n\n+", "\n", value).strip()
+        extraction = extract_pdf(self.text, self._args.get("cancelled"))
+        yield from extraction
+        self.truncated = extraction.truncated
+
+    def parse(self) -> str:
+        """Return extracted text from the PDF."""
+        return "".join(self.iter_parse())
+
+    def iter_parse(self) -> Iterator[str]:
+        """Yield extracted text from the PDF one page at a time."""
+        pending = ""  # Whitespace held back until we know more text follows it
+        started = False
+        for value in self._iter_pages():
+            for orig, new in self.substitutions:
+                value = value.replace(orig, new)
+            value = re.sub(r"\n\n+", "\n", pending + value)
+            if not started:
+                value = value.lstrip()
+            split = len(value.rstrip())
+            pending = value[split:]
+            if split:
+                started = True
+                yield value[:split]
 
 
 class PlainTextParser(SourceParser):
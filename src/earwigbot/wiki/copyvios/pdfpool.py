@@ -0,0 +1,383 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import annotations
+
+__all__ = ["PDFExtraction", "PDFPool", "get_pdf_pool", "set_pdf_pool"]
+
+import io
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable, Generator, Iterator
+
+# Reasons why the text extracted from a PDF may be incomplete:
+TRUNCATED_PAGES = "pages"
+TRUNCATED_TIMEOUT = "timeout"
+TRUNCATED_MEMORY = "memory"
+TRUNCATED_CRASHED = "crashed"
+TRUNCATED_CANCELLED = "cancelled"
+
+_POLL_INTERVAL = 0.1  # How often to check whether an extraction was cancelled
+
+
+def extract_pages(
+    content: bytes, max_pages: int | None = None
+) -> Generator[str, None, str | None]:
+    """Yield the raw text of each page in a PDF, stopping at any error.
+
+    At most *max_pages* pages are read. Return why the text is incomplete, which can
+    only be :py:data:`TRUNCATED_PAGES`, or ``None``.
+    """
+    from pdfminer import converter, pdfinterp, pdfpage
+
+    output = io.StringIO()
+    manager = pdfinterp.PDFResourceManager()
+    conv = converter.TextConverter(manager, output)
+    interp = pdfinterp.PDFPageInterpreter(manager, conv)
+    truncated = None
+
+    try:
+        pages = pdfpage.PDFPage.get_pages(io.BytesIO(content))
+        count = 0
+        while True:
+            try:
+                page = next(pages)
+                if max_pages is not None and count >= max_pages:
+                    truncated = TRUNCATED_PAGES
+                    break
+                interp.process_page(page)
+            except StopIteration:
+                break
+            except MemoryError:
+                raise
+            except Exception:  # pylint: disable=broad-except
+                break
+            count += 1
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    finally:
+        conv.close()
+    if output.tell():
+        yield output.getvalue()
+    return truncated
+
+
+def _limit_memory(limit: int | None) -> None:
+    """Cap the address space of the current process, where the OS supports it."""
+    if not limit:
+        return
+    try:
+        import resource
+    except ModuleNotFoundError:  # Not on Unix
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _serve(
+    conn: multiprocessing.connection.Connection, memory_limit: int | None
+) -> None:
+    """Extract text from the PDFs sent over *conn*, until it is closed.
+
+    Each job is a PDF and a page limit. The text of each page is sent back as soon
+    as it is extracted, so whatever was read survives if we are killed, followed by
+    the reason the text is incomplete, if it is.
+    """
+    _limit_memory(memory_limit)
+    while True:
+        try:
+            content, max_pages = conn.recv()
+        except EOFError:
+            return
+
+        pages = extract_pages(content, max_pages)
+        del content
+        try:
+            while True:
+                conn.send(("page", next(pages)))
+        except StopIteration as exc:
+            truncated = exc.value
+        except MemoryError:
+            pages.close()
+            truncated = TRUNCATED_MEMORY
+        conn.send(("done", truncated))
+
+
+def _main() -> None:
+    """Run a process in the PDF pool, which is started by :py:class:`_Process`."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent deals with Ctrl+C
+    logging.disable(logging.CRITICAL)  # pdfminer complains about any odd PDF
+    conn = multiprocessing.connection.Connection(int(sys.argv[1]))
+    _serve(conn, int(sys.argv[2]) or None)
+
+
+class _Process:
+    """A process in the PDF pool, and our end of the pipe to it."""
+
+    # multiprocessing would import the parent's __main__ module in the process,
+    # which is slow at best, and runs the whole script again if it isn't guarded by
+    # "if __name__ == '__main__'"; so we start a clean interpreter ourselves:
+    _SCRIPT = "from earwigbot.wiki.copyvios.pdfpool import _main; _main()"
+
+    def __init__(self, memory_limit: int | None) -> None:
+        self.conn, child = multiprocessing.Pipe()
+        path = os.pathsep.join(entry for entry in sys.path if entry)
+        try:
+            self.process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    self._SCRIPT,
+                    str(child.fileno()),
+                    str(memory_limit or 0),
+                ],
+                stdin=subprocess.DEVNULL,
+                pass_fds=(child.fileno(),),
+                env={**os.environ, "PYTHONPATH": path},
+            )
+        finally:
+            child.close()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the process is still running."""
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        """Stop the process right away and clean up after it."""
+        self.process.kill()
+        self.process.wait()
+        self.conn.close()
+
+
+class PDFExtraction:
+    """
+    **EarwigBot: Wiki Toolset: PDF Extraction**
+
+    The text of a PDF's pages, produced as they are extracted when iterated over.
+
+    Once iteration is over, :py:attr:`pages` is the number of pages read,
+    :py:attr:`elapsed` is the time it took in seconds, and :py:attr:`truncated` is
+    why the text is incomplete, if it is: the PDF had more than the allowed number
+    of pages (``"pages"``), extraction ran out of time (``"timeout"``) or memory
+    (``"memory"``), its process died (``"crashed"``), or it was no longer needed
+    (``"cancelled"``).
+    """
+
+    def __init__(self, pages: Generator[str, None, str | None]) -> None:
+        self._pages = pages
+        self.pages = 0
+        self.elapsed = 0.0
+        self.truncated: str | None = None
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    text = next(self._pages)
+                except StopIteration as exc:
+                    self.truncated = exc.value
+                    return
+                except MemoryError:
+                    self.truncated = TRUNCATED_MEMORY
+                    return
+                self.pages += 1
+                yield text
+        finally:
+            self._pages.close()
+            self.elapsed = time.perf_counter() - start
+
+
+class PDFPool:
+    """
+    **EarwigBot: Wiki Toolset: PDF Pool**
+
+    Extracts text from PDFs in a pool of up to *num_processes* separate processes,
+    so a pathological PDF can't pin a copyvio worker, or the bot, for minutes.
+
+    A PDF gets *timeout* seconds to be extracted, after which its process is killed.
+    Only its first *max_pages* pages are read, and each process's address space is
+    limited to *memory_limit* bytes. When a limit is hit, the text of the pages
+    read so far is kept, and the extraction is marked as truncated.
+
+    Processes are started the first time they are needed, and are reused. An
+    extraction can be given a function that says whether it is still wanted; once
+    it isn't, its process is killed within a tenth of a second. The pool is only
+    supported on Unix; elsewhere, text is extracted in the calling thread.
+    """
+
+    DEFAULT_TIMEOUT = 20
+    DEFAULT_MAX_PAGES = 200
+    DEFAULT_MEMORY_LIMIT = 1024**3
+
+    def __init__(
+        self,
+        num_processes: int = 2,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_pages: int | None = DEFAULT_MAX_PAGES,
+        memory_limit: int | None = DEFAULT_MEMORY_LIMIT,
+    ) -> None:
+        self._num_processes = num_processes
+        self._timeout = timeout
+        self._max_pages = max_pages
+        self._memory_limit = memory_limit
+        self._slots = threading.BoundedSemaphore(num_processes)
+        self._idle: list[_Process] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the PDFPool."""
+        return (
+            f"PDFPool(num_processes={self._num_processes!r}, "
+            f"timeout={self._timeout!r}, max_pages={self._max_pages!r}, "
+            f"memory_limit={self._memory_limit!r})"
+        )
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the PDFPool."""
+        return f"<PDFPool of {self._num_processes} processes>"
+
+    def _checkout(self) -> _Process:
+        """Return an idle process, starting a new one if there are none."""
+        with self._lock:
+            while self._idle:
+                proc = self._idle.pop()
+                if proc.alive:
+                    return proc
+                proc.kill()
+        return _Process(self._memory_limit)
+
+    def _checkin(self, proc: _Process) -> None:
+        """Return a process to the pool once it has finished a job."""
+        with self._lock:
+            if not self._closed:
+                self._idle.append(proc)
+                return
+        proc.kill()
+
+    def _acquire(self, cancelled: Callable[[], bool] | None) -> bool:
+        """Wait for a free process. Return False if cancelled first."""
+        while not self._slots.acquire(timeout=_POLL_INTERVAL):
+            if cancelled and cancelled():
+                return False
+        return True
+
+    def _run(
+        self, content: bytes, cancelled: Callable[[], bool] | None
+    ) -> Generator[str, None, str | None]:
+        """Extract text from a PDF in one of the processes."""
+        if not self._acquire(cancelled):
+            return TRUNCATED_CANCELLED
+        proc = None
+        try:
+            proc = self._checkout()
+            deadline = time.monotonic() + self._timeout
+            try:
+                proc.conn.send((content, self._max_pages))
+            except OSError:
+                return TRUNCATED_CRASHED
+            while True:
+                try:
+                    # Wait in short slices, so we notice if we are cancelled:
+                    while not proc.conn.poll(_POLL_INTERVAL):
+                        if cancelled and cancelled():
+                            return TRUNCATED_CANCELLED
+                        if time.monotonic() >= deadline:
+                            return TRUNCATED_TIMEOUT
+                    kind, value = proc.conn.recv()
+                except (EOFError, OSError):  # The process died
+                    return TRUNCATED_CRASHED
+                if kind == "done":
+                    self._checkin(proc)
+                    proc = None
+                    return value
+                yield value
+        finally:
+            # The job didn't finish, or we stopped reading it part way through:
+            if proc:
+                proc.kill()
+            self._slots.release()
+
+    def extract(
+        self, content: bytes, cancelled: Callable[[], bool] | None = None
+    ) -> PDFExtraction:
+        """Return the text of a PDF, to be extracted by iterating over it.
+
+        If all of the processes are busy, this waits for one to become free once
+        iteration starts. If *cancelled* is given, it is called regularly while we
+        wait, and extraction stops once it returns True.
+        """
+        return PDFExtraction(self._run(content, cancelled))
+
+    def close(self) -> None:
+        """Stop the idle processes, and the others as soon as they are done."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for proc in idle:
+            proc.kill()
+
+
+# The processes are passed their end of the pipe as a file descriptor, which
+# subprocess can't do on Windows:
+_pdf_pool: PDFPool | None = PDFPool() if os.name == "posix" else None
+
+
+def get_pdf_pool() -> PDFPool | None:
+    """Return the process-wide PDF pool, or ``None`` if disabled."""
+    return _pdf_pool
+
+
+def set_pdf_pool(pool: PDFPool | None) -> None:
+    """
+    Replace the process-wide PDF pool.
+
+    Pass a new :py:class:`PDFPool` to change its limits, or ``None`` to extract
+    text from PDFs in the calling thread, without limits. The old pool is closed.
+    """
+    global _pdf_pool
+    if _pdf_pool and _pdf_pool is not pool:
+        _pdf_pool.close()
+    _pdf_pool = pool
+
+
+def extract_pdf(
+    content: bytes, cancelled: Callable[[], bool] | None = None
+) -> PDFExtraction:
+    """Return the text of a PDF, extracted in the PDF pool if it is enabled.
+
+    See :py:meth:`PDFPool.extract` for *cancelled*.
+    """
+    pool = _pdf_pool
+    if pool:
+        return pool.extract(content, cancelled)
+    return PDFExtraction(extract_pages(content))
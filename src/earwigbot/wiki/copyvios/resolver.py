@@ -0,0 +1,266 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import annotations
+
+__all__ = ["DNSCache", "get_dns_cache", "set_dns_cache"]
+
+import collections
+import concurrent.futures
+import ipaddress
+import socket
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+AddrInfo = tuple[
+    socket.AddressFamily, socket.SocketKind, int, str, tuple[str, int] | tuple[Any, ...]
+]
+
+
+@dataclass
+class _Lookup:
+    """The result of resolving a hostname, or the error we got trying to."""
+
+    addresses: list[AddrInfo] | None
+    error: socket.gaierror | None
+    expires: float
+
+
+class DNSCache:
+    """
+    **EarwigBot: Wiki Toolset: DNS Cache**
+
+    Remembers the addresses of the hosts that copyvio sources are downloaded from,
+    so each one is only looked up once in a while instead of on every connection.
+    Both the worker threads and the asyncio fetcher use it.
+
+    Lookups go through the system resolver, which doesn't tell us how long records
+    may be kept, so successful lookups are kept for at most *ttl* seconds and failed
+    ones for *error_ttl* seconds. Only the *max_size* most recently used hosts are
+    remembered.
+
+    Hosts can be looked up ahead of time with :py:meth:`prefetch`, which uses up to
+    *num_threads* background threads. Anything that needs a host while it is being
+    looked up waits for that lookup instead of starting another.
+    """
+
+    DEFAULT_TTL = 5 * 60
+    DEFAULT_ERROR_TTL = 30
+    DEFAULT_MAX_SIZE = 4096
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        error_ttl: float = DEFAULT_ERROR_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+        num_threads: int = 4,
+    ) -> None:
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._max_size = max_size
+        self._num_threads = num_threads
+        self._entries: collections.OrderedDict[str, _Lookup] = collections.OrderedDict()
+        self._pending: dict[str, concurrent.futures.Future[_Lookup]] = {}
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the DNSCache."""
+        return (
+            f"DNSCache(ttl={self._ttl!r}, error_ttl={self._error_ttl!r}, "
+            f"max_size={self._max_size!r}, num_threads={self._num_threads!r})"
+        )
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the DNSCache."""
+        return f"<DNSCache of {len(self)} hosts>"
+
+    def __len__(self) -> int:
+        """Return the number of hosts in the cache."""
+        return len(self._entries)
+
+    @staticmethod
+    def _is_address(host: str) -> bool:
+        """Return whether *host* is an IP address, which needs no lookup."""
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return True
+
+    def _lookup(self, host: str) -> _Lookup:
+        """Ask the system resolver for the addresses of *host*."""
+        try:
+            addresses = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as exc:
+            return _Lookup(None, exc, time.monotonic() + self._error_ttl)
+        return _Lookup(addresses, None, time.monotonic() + self._ttl)
+
+    def _get(self, host: str) -> _Lookup | None:
+        """Return the unexpired lookup of *host*, if any. The lock must be held."""
+        entry = self._entries.get(host)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self._entries[host]
+            return None
+        self._entries.move_to_end(host)
+        return entry
+
+    def _run(self, host: str, future: concurrent.futures.Future[_Lookup]) -> _Lookup:
+        """Look up a host we have claimed, and share the result with any waiters."""
+        try:
+            entry = self._lookup(host)
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[host]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._pending[host]
+            self._entries[host] = entry
+            self._entries.move_to_end(host)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        future.set_result(entry)
+        return entry
+
+    def _claim(
+        self, host: str
+    ) -> tuple[_Lookup | concurrent.futures.Future[_Lookup], bool]:
+        """Find a lookup of *host*, or claim it so we can do it ourselves.
+
+        Return the cached lookup or the future of one already in progress, or a new
+        future that the caller must complete with :py:meth:`_run`, with True.
+        """
+        with self._lock:
+            entry = self._get(host)
+            if entry:
+                return entry, False
+            if host in self._pending:
+                return self._pending[host], False
+            future: concurrent.futures.Future[_Lookup] = concurrent.futures.Future()
+            self._pending[host] = future
+            return future, True
+
+    @staticmethod
+    def _with_port(
+        entry: _Lookup, port: int, family: int = socket.AF_UNSPEC
+    ) -> list[AddrInfo]:
+        """Return the addresses of a lookup with the given port filled in."""
+        if entry.error:
+            raise socket.gaierror(*entry.error.args)
+        assert entry.addresses is not None
+        return [
+            (fam, kind, proto, canon, (addr[0], port, *addr[2:]))
+            for fam, kind, proto, canon, addr in entry.addresses
+            if family == socket.AF_UNSPEC or fam == family
+        ]
+
+    def get(
+        self, host: str, port: int, family: int = socket.AF_UNSPEC
+    ) -> list[AddrInfo] | None:
+        """Return the cached addresses of *host*, or ``None`` if it isn't cached.
+
+        Raise :py:exc:`socket.gaierror` if the host recently failed to resolve.
+        """
+        with self._lock:
+            entry = self._get(host)
+        return self._with_port(entry, port, family) if entry else None
+
+    def resolve(
+        self, host: str, port: int, family: int = socket.AF_UNSPEC
+    ) -> list[AddrInfo]:
+        """Return the addresses of *host*, in the same form as getaddrinfo().
+
+        If the host isn't cached, it is looked up now, which may block. Raise
+        :py:exc:`socket.gaierror` if it can't be resolved.
+        """
+        if self._is_address(host):
+            return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        found, claimed = self._claim(host)
+        if claimed:
+            assert isinstance(found, concurrent.futures.Future)
+            entry = self._run(host, found)
+        elif isinstance(found, concurrent.futures.Future):
+            entry = found.result()
+        else:
+            entry = found
+        return self._with_port(entry, port, family)
+
+    def prefetch(self, hosts: Iterable[str]) -> None:
+        """Start looking up the given hosts in the background, if not cached."""
+        for host in hosts:
+            if not host or self._is_address(host):
+                continue
+            found, claimed = self._claim(host)
+            if not claimed:
+                continue
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        self._num_threads, thread_name_prefix="cvdns"
+                    )
+                executor = self._executor
+            executor.submit(self._run, host, found)
+
+    def create_connection(self, address: tuple[str, int], *args: Any) -> socket.socket:
+        """Connect to a host using its cached addresses.
+
+        This takes the same arguments as :py:func:`socket.create_connection`, and
+        tries each address in turn like it does.
+        """
+        host, port = address
+        error: OSError | None = None
+        for *_, sockaddr in self.resolve(host, port):
+            try:
+                return socket.create_connection(sockaddr[:2], *args)
+            except OSError as exc:
+                error = exc
+        if error:
+            raise error
+        raise OSError(f"No addresses found for {host}")
+
+    def clear(self) -> None:
+        """Forget all cached lookups."""
+        with self._lock:
+            self._entries.clear()
+
+
+_dns_cache: DNSCache | None = DNSCache()
+
+
+def get_dns_cache() -> DNSCache | None:
+    """Return the process-wide DNS cache, or ``None`` if disabled."""
+    return _dns_cache
+
+
+def set_dns_cache(cache: DNSCache | None) -> None:
+    """
+    Replace the process-wide DNS cache.
+
+    Pass a new :py:class:`DNSCache` to change its TTLs or size, or ``None`` to look
+    up hosts normally on every connection.
+    """
+    global _dns_cache
+    _dns_cache = cache
@@ -20,7 +20,7 @@
 
 from __future__ import annotations
 
-__all__ = ["CopyvioSource", "CopyvioCheckResult"]
+__all__ = ["CopyvioSource", "CopyvioCheckResult", "PHASES"]
 
 import time
 import typing
@@ -39,6 +39,20 @@ if typing.TYPE_CHECKING:
     from earwigbot.wiki.copyvios.parsers import ParserArgs
     from earwigbot.wiki.copyvios.workers import CopyvioWorkspace
 
+#: The phases of a check that are timed: searching (for the whole check), then for
+#: each source, looking up its host, connecting and waiting for the response
+#: headers, downloading, decompressing, parsing, building chains, and comparing
+PHASES = (
+    "search",
+    "dns",
+    "connect",
+    "download",
+    "decode",
+    "parse",
+    "chain",
+    "compare",
+)
+
 
 class CopyvioSource:
     """
@@ -51,9 +65,29 @@ class CopyvioSource:
 
     - :py:attr:`url`:        the URL of the source
     - :py:attr:`confidence`: the confidence of a violation, between 0 and 1
+    - :py:attr:`degree_confidences`: the confidence at each chain degree scored
     - :py:attr:`chains`:     a 2-tuple of the source chain and the delta chain
+    - :py:attr:`source_size`: the size of the source chain
+    - :py:attr:`delta_size`: the size of the delta chain
+    - :py:attr:`phrases`:    in compact mode, the most frequent phrases shared by the
+      source and the article, if requested
     - :py:attr:`skipped`:    whether this URL was skipped during the check
     - :py:attr:`excluded`:   whether this URL was in the exclusions list
+    - :py:attr:`queue_time`: how long the source waited for a worker, in seconds,
+      or ``None`` if it was never queued
+    - :py:attr:`priority`:   how likely the source seemed to be a match before it
+      was fetched; higher-priority sources are fetched first
+    - :py:attr:`timings`:    the seconds spent on each phase of handling the source
+      (see :py:data:`PHASES`), for those it went through
+    - :py:attr:`bytes_received`: the number of bytes downloaded for the source
+    - :py:attr:`bytes_decoded`: the number of bytes after decompressing them
+    - :py:attr:`truncated`:  why only part of the source's text was used, if it
+      was; for PDFs, the reasons are those of
+      :py:class:`~earwigbot.wiki.copyvios.pdfpool.PDFExtraction`, and the time taken
+      to extract the text is the ``"parse"`` timing
+
+    In compact mode, the chains are discarded once the confidence is known, leaving
+    only their sizes.
     """
 
     def __init__(
@@ -74,8 +108,18 @@ class CopyvioSource:
 
         self.confidence = 0.0
         self.chains = (EMPTY, EMPTY_INTERSECTION)
+        self.source_size = 0
+        self.delta_size = 0
+        self.phrases: list[tuple[str, ...]] = []
+        self.degree_confidences: dict[int, float] = {}
         self.skipped = False
         self.excluded = False
+        self.queue_time: float | None = None
+        self.priority = 0.0
+        self.timings: dict[str, float] = {}
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.truncated: str | None = None
 
         self._event1 = Event()
         self._event2 = Event()
@@ -101,6 +145,11 @@ class CopyvioSource:
         """The source URL's domain name, or None."""
         return urllib.parse.urlparse(self.url).netloc or None
 
+    @property
+    def active(self) -> bool:
+        """Whether this source is being worked on right now."""
+        return self._event1.is_set() and not self._event2.is_set()
+
     def start_work(self) -> None:
         """Mark this source as being worked on right now."""
         self._event2.clear()
@@ -111,10 +160,25 @@ class CopyvioSource:
         confidence: float,
         source_chain: MarkovChain,
         delta_chain: MarkovChainIntersection,
+        degree_confidences: dict[int, float] | None = None,
     ) -> None:
         """Fill out the confidence and chain information inside this source."""
         self.confidence = confidence
+        self.degree_confidences = {source_chain.degree: confidence}
+        if degree_confidences:
+            self.degree_confidences.update(degree_confidences)
         self.chains = (source_chain, delta_chain)
+        self.source_size = source_chain.size
+        self.delta_size = delta_chain.size
+
+    def compact(self, phrases: list[tuple[str, ...]] | None = None) -> None:
+        """Discard this source's chains, keeping only their sizes and *phrases*."""
+        self.chains = (EMPTY, EMPTY_INTERSECTION)
+        self.phrases = phrases or []
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        """Add to the time spent on one phase of handling this source."""
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
 
     def finish_work(self) -> None:
         """Mark this source as finished."""
@@ -170,6 +234,8 @@ class CopyvioCheckResult:
     - :py:attr:`time`:          the amount of time the check took to complete
     - :py:attr:`article_chain`: the MarkovChain of the article text
     - :py:attr:`possible_miss`: whether some URLs might have been missed
+    - :py:attr:`degree_confidences`: the confidence at each chain degree scored, found
+      like :py:attr:`confidence`
     """
 
     def __init__(
@@ -182,6 +248,7 @@ class CopyvioCheckResult:
         possible_miss: bool,
         included_sources: list[CopyvioSource] | None = None,
         unified_confidence: float | None = None,
+        degree_confidences: dict[int, float] | None = None,
     ):
         self.violation = violation
         self.sources = sources
@@ -191,6 +258,7 @@ class CopyvioCheckResult:
         self.possible_miss = possible_miss
         self.included_sources = included_sources if included_sources else []
         self.unified_confidence = unified_confidence
+        self.degree_confidences = degree_confidences or {}
         self.metadata = CheckResultMetadata()  # Additional metadata for web tool
 
     def __repr__(self) -> str:
@@ -223,17 +291,28 @@ class CopyvioCheckResult:
         """The URL of the best source, or None if no sources exist."""
         return self.best.url if self.best else None
 
+    def _get_timing_summary(self) -> str:
+        """Summarize where the check spent its time, for the log message."""
+        timings: dict[str, float] = getattr(self.metadata, "timings", {})
+        slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)
+        phases = [f"{phase} {seconds:.2f}s" for phase, seconds in slowest[:3]]
+        if not phases:
+            return ""
+        received = getattr(self.metadata, "bytes_received", 0)
+        return f"; most time in {', '.join(phases)}; {received // 1024} KiB received"
+
     def get_log_message(self, title: str) -> str:
         """Build a relevant log message for this copyvio check result."""
+        summary = self._get_timing_summary()
         if not self.sources:
             return (
                 f"No violation for [[{title}]] (no sources; {self.queries} queries; "
-                f"{self.time} seconds)"
+                f"{self.time} seconds{summary})"
             )
 
         is_vio = "Violation detected" if self.violation else "No violation"
         return (
             f"{is_vio} for [[{title}]] (best: {self.url} ({self.confidence} "
             f"confidence); {len(self.sources)} sources; {self.queries} queries; "
-            f"{self.time} seconds)"
+            f"{self.time} seconds{summary})"
         )
@@ -0,0 +1,227 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import annotations
+
+__all__ = [
+    "TokenizerRegistry",
+    "get_tokenizer",
+    "load_tokenizer",
+    "save_tokenizer",
+    "warm_up_tokenizers",
+]
+
+import json
+import os
+import tempfile
+import threading
+import typing
+from collections.abc import Iterable
+
+if typing.TYPE_CHECKING:
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+_PARAM_FILES = (
+    "abbrev_types.txt",
+    "collocations.tab",
+    "ortho_context.tab",
+    "sent_starters.txt",
+)
+_FORMAT = 1
+
+
+def save_tokenizer(tokenizer: PunktSentenceTokenizer, path: str) -> None:
+    """Save a Punkt tokenizer's parameters to *path*, for :py:func:`load_tokenizer`.
+
+    They are saved as JSON, which loads several times faster than the tab-separated
+    files NLTK distributes them as (and, unlike pickle, is safe to load).
+    """
+    params = tokenizer._params
+    data = {
+        "format": _FORMAT,
+        "abbrev_types": sorted(params.abbrev_types),
+        "collocations": sorted(params.collocations),
+        "sent_starters": sorted(params.sent_starters),
+        "ortho_context": dict(params.ortho_context),
+    }
+    dirname = os.path.dirname(path) or "."
+    os.makedirs(dirname, exist_ok=True)
+    # Write to a temporary file first, so other processes never see half of it:
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            json.dump(data, fp, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_tokenizer(path: str) -> PunktSentenceTokenizer:
+    """Load a Punkt tokenizer saved by :py:func:`save_tokenizer`.
+
+    Raise :py:exc:`ValueError` if the file isn't one.
+    """
+    from nltk.tokenize.punkt import PunktParameters, PunktSentenceTokenizer
+
+    with open(path, encoding="utf-8") as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict) or data.get("format") != _FORMAT:
+        raise ValueError(f"Not a saved tokenizer: {path}")
+
+    params = PunktParameters()
+    params.abbrev_types = set(data["abbrev_types"])
+    params.collocations = {tuple(pair) for pair in data["collocations"]}
+    params.sent_starters = set(data["sent_starters"])
+    params.ortho_context.update(data["ortho_context"])
+    return PunktSentenceTokenizer(params)
+
+
+class TokenizerRegistry:
+    """
+    **EarwigBot: Wiki Toolset: Tokenizer Registry**
+
+    Keeps the NLTK Punkt sentence tokenizers used to chunk articles into search
+    queries, loading each language's model only once per process. It is safe to use
+    from multiple threads; while a language is being loaded, other threads that want
+    it wait, but threads that want other languages don't.
+
+    Models are read from, and if missing downloaded to, the given NLTK data
+    directory. NLTK's tab-separated format is slow to parse, so the first time a
+    language is loaded, its model is also saved in a faster form (see
+    :py:func:`save_tokenizer`) under ``tokenizers/punkt_json`` in the directory,
+    which is loaded instead from then on, as long as it is newer than the original.
+    """
+
+    def __init__(self) -> None:
+        self._tokenizers: dict[tuple[str, str], PunktSentenceTokenizer] = {}
+        self._loading: dict[tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the TokenizerRegistry."""
+        return "TokenizerRegistry()"
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the TokenizerRegistry."""
+        langs = ", ".join(sorted(lang for _, lang in self._tokenizers))
+        return f"<TokenizerRegistry of [{langs}]>"
+
+    def _find_params(self, lang: str, nltk_dir: str) -> str | None:
+        """Return the directory of a language's model, downloading it if needed.
+
+        Return None if it was found but isn't a plain directory (e.g. a zip file).
+        """
+        import nltk
+
+        with self._lock:
+            # nltk.data.find() only looks in these, and NLTK refuses to open files
+            # anywhere else:
+            if nltk_dir not in nltk.data.path:
+                nltk.data.path.insert(0, nltk_dir)
+
+        resource = f"tokenizers/punkt_tab/{lang}/"
+        try:
+            found = nltk.data.find(resource)
+        except LookupError:
+            nltk.download("punkt_tab", nltk_dir)
+            found = nltk.data.find(resource)
+        return getattr(found, "path", None)
+
+    def _load(self, lang: str, nltk_dir: str) -> PunktSentenceTokenizer:
+        """Load a language's tokenizer, from the faster form if it is current."""
+        from nltk.tokenize import PunktTokenizer
+
+        params_dir = self._find_params(lang, nltk_dir)
+        if not params_dir:
+            return PunktTokenizer(lang)
+
+        saved = os.path.join(nltk_dir, "tokenizers", "punkt_json", f"{lang}.json")
+        try:
+            updated = max(
+                os.stat(os.path.join(params_dir, name)).st_mtime
+                for name in _PARAM_FILES
+            )
+            if os.stat(saved).st_mtime >= updated:
+                return load_tokenizer(saved)
+        except (OSError, ValueError):
+            pass
+
+        tokenizer = PunktTokenizer(lang)
+        try:
+            save_tokenizer(tokenizer, saved)
+        except OSError:
+            pass  # We'll just be slower to load next time
+        return tokenizer
+
+    def get(self, lang: str, nltk_dir: str) -> PunktSentenceTokenizer:
+        """Return the tokenizer for an NLTK language name, like ``"english"``.
+
+        Raise :py:exc:`LookupError` if its model can't be found or downloaded.
+        """
+        key = (nltk_dir, lang)
+        tokenizer = self._tokenizers.get(key)
+        if tokenizer is not None:
+            return tokenizer
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            tokenizer = self._tokenizers.get(key)
+            if tokenizer is None:
+                tokenizer = self._tokenizers[key] = self._load(lang, nltk_dir)
+        return tokenizer
+
+    def warm_up(self, langs: Iterable[str], nltk_dir: str) -> list[str]:
+        """Load the tokenizers for the given languages ahead of time.
+
+        Return the languages that couldn't be loaded.
+        """
+        failed = []
+        for lang in langs:
+            try:
+                self.get(lang, nltk_dir)
+            except LookupError:
+                failed.append(lang)
+        return failed
+
+    def clear(self) -> None:
+        """Forget all loaded tokenizers."""
+        with self._lock:
+            self._tokenizers.clear()
+            self._loading.clear()
+
+
+_registry = TokenizerRegistry()
+
+
+def get_tokenizer(lang: str, nltk_dir: str) -> PunktSentenceTokenizer:
+    """Return a sentence tokenizer from the process-wide registry.
+
+    See :py:meth:`TokenizerRegistry.get`.
+    """
+    return _registry.get(lang, nltk_dir)
+
+
+def warm_up_tokenizers(langs: Iterable[str], nltk_dir: str) -> list[str]:
+    """Load sentence tokenizers into the process-wide registry ahead of time.
+
+    See :py:meth:`TokenizerRegistry.warm_up`.
+    """
+    return _registry.warm_up(langs, nltk_dir)
@@ -20,49 +20,101 @@
 
 from __future__ import annotations
 
-__all__ = ["globalize", "localize", "CopyvioWorkspace"]
+__all__ = [
+    "globalize",
+    "localize",
+    "get_pool_stats",
+    "get_timing_stats",
+    "start_parse_pool",
+    "stop_parse_pool",
+    "CopyvioWorkspace",
+    "TimingStats",
+    "WorkerPoolStats",
+]
 
 import base64
 import collections
+import contextlib
 import dataclasses
 import functools
-import gzip
-import io
+import http.client
+import importlib
 import logging
 import math
+import multiprocessing
+import multiprocessing.connection
+import os
 import queue
-import struct
+import signal
 import threading
 import time
+import typing
 import urllib.parse
 import urllib.request
-from collections.abc import Callable, Container
+import zlib
+from collections.abc import Callable, Container, Hashable, Iterator, Mapping
 from dataclasses import dataclass
 from http.client import HTTPException
+from types import ModuleType
 from typing import Any
-from urllib.error import URLError
+from urllib.error import HTTPError, URLError
 
 from earwigbot.exceptions import ParserExclusionError, ParserRedirectError
+from earwigbot.wiki.copyvios.cache import (
+    CachedResponse,
+    CachedSource,
+    HTTPCache,
+    get_source_cache,
+)
 from earwigbot.wiki.copyvios.markov import (
     DEFAULT_DEGREE,
     MarkovChain,
     MarkovChainIntersection,
     MarkovChainUnion,
+    MultiDegreeChainBuilder,
 )
 from earwigbot.wiki.copyvios.parsers import ParserArgs, SourceParser, get_parser
-from earwigbot.wiki.copyvios.result import CopyvioCheckResult, CopyvioSource
+from earwigbot.wiki.copyvios.pdfpool import (
+    TRUNCATED_CANCELLED,
+    TRUNCATED_CRASHED,
+    TRUNCATED_TIMEOUT,
+)
+from earwigbot.wiki.copyvios.resolver import get_dns_cache
+from earwigbot.wiki.copyvios.result import PHASES, CopyvioCheckResult, CopyvioSource
+
+if typing.TYPE_CHECKING:
+    from earwigbot.wiki.copyvios.fetcher import AsyncFetcher
 
 INCLUDE_THRESHOLD = 0.15
 
+# Weights used to decide which sources to fetch first; see CopyvioWorkspace.enqueue:
+PRIORITY_ORIGINS = {"search": 2.0, "link": 1.0}
+PRIORITY_RANK = 1.0
+PRIORITY_REPEAT = 1.5
+PRIORITY_DOMAIN = 2.0
+
 _MAX_REDIRECTS = 3
 _MAX_RAW_SIZE = 20 * 1024**2
+_CHUNK_SIZE = 64 * 1024
 
 _is_globalized = False
-_global_queues: _CopyvioQueues | None = None
-_global_workers: list[_CopyvioWorker] = []
-
-
-def globalize(num_workers: int = 8) -> None:
+_global_scheduler: _SourceScheduler | None = None
+_global_pool: _WorkerPool | None = None
+_local_pool: _WorkerPool | None = None
+_local_pool_lock = threading.Lock()
+_domain_stats: _DomainStats | None = None
+_timing_stats: _TimingStats | None = None
+
+_parse_pool: _ParsePool | None = None
+_PARSE_POLL_INTERVAL = 0.1  # How often to check for cancellation while parsing
+
+
+def globalize(
+    num_workers: int = 8,
+    max_per_site: int = 1,
+    site_interval: float = 0,
+    max_workers: int | None = None,
+) -> None:
     """
     Cause all copyvio checks to be done by one global set of workers.
 
@@ -71,18 +123,29 @@ def globalize(num_workers: int = 8) -> None:
     spawned when the function is called, run continuously, and intelligently handle
     multiple checks.
 
-    This function is not thread-safe and should only be called when no checks are being
-    done. It has no effect if it has already been called.
+    Workers take turns between the checks in progress, so a check with many sources
+    cannot hold up the others. At most *max_per_site* sources from the same site
+    (registered domain) are fetched at once across all checks, and requests to a
+    site are started at least *site_interval* seconds apart.
+
+    *num_workers* threads are always kept running. If *max_workers* is larger, more
+    are started whenever sources that could be fetched are waiting for a free
+    worker, up to that many in total; the extra threads exit again once they have
+    been idle for a while (longer if fetches have been slow).
+    :py:func:`get_pool_stats` reports on the pool.
+
+    This function is not thread-safe and should only be called when no checks are
+    being done. It has no effect if it has already been called.
     """
-    global _is_globalized, _global_queues
+    global _is_globalized, _global_scheduler, _global_pool
     if _is_globalized:
         return
 
-    _global_queues = _CopyvioQueues()
-    for i in range(num_workers):
-        worker = _CopyvioWorker(f"global-{i}", _global_queues)
-        worker.start()
-        _global_workers.append(worker)
+    _global_pool = _WorkerPool(
+        num_workers, max(num_workers, max_workers or 0), max_per_site, site_interval
+    )
+    _global_pool.start()
+    _global_scheduler = _global_pool.scheduler
     _is_globalized = True
 
 
@@ -95,270 +158,1635 @@ def localize() -> None:
     This function is not thread-safe and should only be called when no checks are
     being done.
     """
-    global _is_globalized, _global_queues, _global_workers
+    global _is_globalized, _global_scheduler, _global_pool
     if not _is_globalized:
         return
 
-    assert _global_queues is not None
-    for i in range(len(_global_workers)):
-        _global_queues.unassigned.put((StopIteration, None))
-    _global_queues = None
-    _global_workers = []
+    assert _global_pool is not None
+    _global_pool.stop()
+    _global_scheduler = None
+    _global_pool = None
     _is_globalized = False
 
 
+def get_pool_stats() -> WorkerPoolStats | None:
+    """Return the state of the global worker pool, or None if it isn't running."""
+    return _global_pool.get_stats() if _global_pool else None
+
+
+def get_timing_stats() -> dict[str, TimingStats]:
+    """Return statistics on how long each phase of recent checks took.
+
+    They cover all checks run in this process, up to a limit of recent samples per
+    phase, and are keyed by the names in :py:data:`~.result.PHASES`.
+    """
+    return _get_timing_stats().get_stats()
+
+
+def _get_local_pool() -> _WorkerPool:
+    """Return the pool of workers shared by checks when not globalized.
+
+    It is started the first time it is needed. It grows to as many threads as the
+    checks with sources in progress have asked for in total, so each check still
+    gets its own ``num_workers``; the threads exit when idle, and are started again
+    as checks need them.
+    """
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = _WorkerPool(0, None, isolated=True, name="local")
+            _local_pool.start()
+        return _local_pool
+
+
+def start_parse_pool(num_processes: int | None = None, timeout: float = 30) -> None:
+    """
+    Parse sources and build their Markov chains in a pool of separate processes.
+
+    Worker threads normally download, parse, and build chains for sources on their
+    own, but the CPU-heavy parts hold the GIL, so the threads rarely use more than
+    one core between them. With a pool, threads only download the source and hand
+    its content off to a process, which sends back just the chains (and the text,
+    unless the check is compact).
+
+    *num_processes* defaults to the number of CPUs. A source that takes longer than
+    *timeout* seconds to parse is skipped, and its process is killed and replaced.
+
+    This function is not thread-safe and should only be called when no checks are
+    being done. If the pool is already running, it is replaced.
+    """
+    global _parse_pool
+    stop_parse_pool()
+    _parse_pool = _ParsePool(num_processes, timeout)
+
+
+def stop_parse_pool() -> None:
+    """
+    Go back to parsing sources in the worker threads themselves.
+
+    This undoes :func:`start_parse_pool` and shuts down its processes.
+
+    This function is not thread-safe and should only be called when no checks are
+    being done.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        return
+    _parse_pool.close()
+    _parse_pool = None
+
+
 @dataclass(frozen=True)
 class OpenedURL:
     content: bytes
     parser_class: type[SourceParser]
+    etag: str | None = None
+    last_modified: str | None = None
+    cacheable: bool = True
 
 
-SourceQueue = collections.deque[CopyvioSource]
-UnassignedQueue = queue.Queue[
-    tuple[str, SourceQueue] | tuple[type[StopIteration], None]
-]
+class _NotModifiedError(Exception):
+    """Raised when a conditional request finds that our cached copy is current."""
+
+
+class _SourceCancelledError(Exception):
+    """Raised to abandon work on a source once its check no longer needs it."""
+
+
+class _CancellationToken:
+    """Tells the work started for a check to stop, once the check is over.
+
+    Long-running work should check :py:attr:`cancelled` regularly, or call
+    :py:meth:`check`. Anything blocked on something else can :py:meth:`register`
+    a callback to wake it up.
+    """
+
+    def __init__(self) -> None:
+        self.cancelled = False
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        """Cancel the work, calling any registered callbacks."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def check(self) -> None:
+        """Raise _SourceCancelledError if the work has been cancelled."""
+        if self.cancelled:
+            raise _SourceCancelledError()
+
+    def register(self, callback: Callable[[], None]) -> None:
+        """Call *callback* when the work is cancelled, or now if it already is."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback: Callable[[], None]) -> None:
+        """Stop calling a callback given to :py:meth:`register`."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+@contextlib.contextmanager
+def _timed(source: CopyvioSource | None, phase: str) -> Iterator[None]:
+    """Add the time spent in the block to one of a source's phases, if given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if source:
+            source.add_time(phase, time.perf_counter() - start)
+
+
+def _resolve_host(url: str) -> None:
+    """Look up a URL's host in the DNS cache, if there is one.
+
+    This is done just before connecting, so the lookup can be timed on its own; the
+    connection then finds the address already cached. Errors are left for the
+    connection to report.
+    """
+    dns_cache = get_dns_cache()
+    if dns_cache is None:
+        return
+    try:
+        parsed = urllib.parse.urlparse(url)
+        if parsed.hostname:
+            default_port = 443 if parsed.scheme == "https" else 80
+            dns_cache.resolve(parsed.hostname, parsed.port or default_port)
+    except (OSError, ValueError):
+        pass
 
 
 @dataclass(frozen=True)
-class _CopyvioQueues:
-    """Stores data necessary to maintain the various queues during a check."""
+class _ParsedSource:
+    """The result of parsing a source: either its chains or a URL to follow."""
+
+    chains: dict[int, MarkovChain] | None = None
+    redirect: str | None = None
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    truncated: str | None = None
+
+
+_ParseJob = tuple[bytes, type[SourceParser], str, ParserArgs, list[int], bool]
+
+
+def _parse_source(
+    content: bytes,
+    parser_class: type[SourceParser],
+    url: str,
+    args: ParserArgs,
+    degrees: list[int],
+    keep_text: bool,
+    cancellation: _CancellationToken | None = None,
+) -> _ParsedSource:
+    """Parse a source's content and build its chains at each of the given degrees.
+
+    This may be run in a separate process, so it must not raise exceptions that
+    cannot be pickled. *cancellation* can only be given when it is not.
+    """
+    # The parser hands us text as it goes, so time it and the builder separately:
+    parse_time = chain_time = 0.0
+    last = time.perf_counter()
+    parser = parser_class(content, url, args=args)
+    builder = MultiDegreeChainBuilder(degrees, keep_text=keep_text)
+    try:
+        for chunk in parser.iter_parse():
+            now = time.perf_counter()
+            parse_time += now - last
+            if cancellation:
+                cancellation.check()
+            builder.feed(chunk)
+            last = time.perf_counter()
+            chain_time += last - now
+    except ParserRedirectError as exc:
+        redirect = exc.url
+        if isinstance(redirect, bytes):
+            redirect = redirect.decode("utf8")
+        return _ParsedSource(redirect=redirect)
+    if cancellation:
+        cancellation.check()  # The parser may have stopped early because of it
+    now = time.perf_counter()
+    parse_time += now - last
+    chains = None if builder.empty else builder.build()
+    chain_time += time.perf_counter() - now
+    return _ParsedSource(
+        chains,
+        timings={"parse": parse_time, "chain": chain_time},
+        truncated=parser.truncated,
+    )
+
+
+def _try_map_proxy_url(
+    search_config: dict[str, Any] | None,
+    url: str,
+    parsed: urllib.parse.ParseResult,
+    extra_headers: dict[str, str],
+    is_error: bool = False,
+) -> tuple[str, bool]:
+    """Rewrite a URL according to the "proxies" search config option.
+
+    Return the new URL and whether it was remapped. Any headers needed by the proxy
+    are added to *extra_headers*.
+    """
+    if not search_config or "proxies" not in search_config:
+        return url, False
+    for proxy_info in search_config["proxies"]:
+        if parsed.netloc != proxy_info["netloc"]:
+            continue
+        if "onerr" in proxy_info:
+            if proxy_info["onerr"] and not is_error:
+                continue
+            if not proxy_info["onerr"] and is_error:
+                continue
+        path = parsed.path
+        if "path" in proxy_info:
+            if not parsed.path.startswith(proxy_info["path"]):
+                continue
+            path = path[len(proxy_info["path"]) :]
+        url = proxy_info["target"] + path
+        if parsed.query:
+            url += "?" + parsed.query
+        if "auth" in proxy_info:
+            auth_hash = base64.b64encode(proxy_info["auth"].encode()).decode()
+            extra_headers["Authorization"] = f"Basic {auth_hash}"
+        return url, True
+    return url, False
+
+
+def _get_response_parser(
+    headers: Mapping[str, str], allow_content_types: Container[str] | None
+) -> type[SourceParser] | None:
+    """Return the parser for a response given its headers, if we can handle it.
+
+    None is returned for unknown content types and for responses that are too large.
+    """
+    try:
+        size = int(headers.get("Content-Length", 0))
+    except ValueError:
+        return None
+
+    content_type = headers.get("Content-Type", "text/plain")
+    content_type = content_type.split(";", 1)[0]
+    parser_class = get_parser(content_type)
+    if not parser_class and (
+        not allow_content_types or content_type not in allow_content_types
+    ):
+        return None
+    if not parser_class:
+        parser_class = get_parser()
+    if size > _get_size_limit(parser_class):
+        return None
+    return parser_class
+
+
+def _get_size_limit(parser_class: type[SourceParser]) -> int:
+    """Return the largest document, in bytes, we will give to the given parser."""
+    return (15 if parser_class.TYPE == "PDF" else 2) * 1024**2
+
+
+def _import_brotli() -> ModuleType | None:
+    """Return a module that can decompress Brotli data, if one is installed."""
+    for name in ("brotli", "brotlicffi"):
+        try:
+            return importlib.import_module(name)
+        except ModuleNotFoundError:
+            pass
+    return None
+
+
+@functools.cache
+def _get_accept_encoding() -> str:
+    """Return the Accept-Encoding header to send when opening sources."""
+    return "gzip, deflate, br" if _import_brotli() else "gzip, deflate"
+
+
+def _add_cache_headers(
+    opened: OpenedURL | None, headers: Mapping[str, str]
+) -> OpenedURL | None:
+    """Attach the caching-related headers of a response to its content."""
+    if opened is None:
+        return None
+    if "no-store" in headers.get("Cache-Control", "").lower():
+        return dataclasses.replace(opened, cacheable=False)
+    return dataclasses.replace(
+        opened, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified")
+    )
+
+
+class _ContentDecoder:
+    """Decompresses a response body as it is read, enforcing our size limits.
+
+    The body is fed in chunks with :py:meth:`feed`, which returns ``False`` as soon as
+    the body is found to be too large or corrupt, so the download can be abandoned.
+    Only the decoded content is kept.
+    """
+
+    def __init__(self, encoding: str | None, parser_class: type[SourceParser]) -> None:
+        self._parser_class = parser_class
+        self._limit = _get_size_limit(parser_class)
+        self._raw_size = 0
+        self._size = 0
+        self._chunks: list[bytes] = []
+        self._first: bytes | None = None  # Kept to retry raw deflate
+        self._time = 0.0
+        self._zlib: Any = None
+        self._gzip = False
+        self._brotli: Any = None
+
+        encoding = (encoding or "identity").strip().lower()
+        self.supported = True
+        if encoding in ("gzip", "x-gzip"):
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self._gzip = True
+        elif encoding == "deflate":
+            self._zlib = zlib.decompressobj()
+            self._first = b""
+        elif encoding == "br":
+            brotli = _import_brotli()
+            if brotli:
+                self._brotli = brotli.Decompressor()
+            else:
+                self.supported = False
+        elif encoding != "identity":
+            self.supported = False
+
+    def _add(self, data: bytes) -> bool:
+        """Keep some decoded data, or return False if it puts us over the limit."""
+        self._size += len(data)
+        if self._size > self._limit:
+            return False
+        if data:
+            self._chunks.append(data)
+        return True
+
+    def _inflate(self, data: bytes) -> bool:
+        """Decompress zlib data without producing more output than we can keep."""
+        while data:
+            out = self._zlib.decompress(data, self._limit - self._size + 1)
+            if not self._add(out):
+                return False
+            data = self._zlib.unconsumed_tail
+            if not data and self._gzip and self._zlib.eof:
+                # A gzip body may hold several members, which decode to one stream;
+                # like the gzip module, skip any null padding between them
+                data = self._zlib.unused_data.lstrip(b"\x00")
+                if data:
+                    self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return True
+
+    def feed(self, data: bytes) -> bool:
+        """Decode the next chunk of the body. Return whether we should continue."""
+        start = time.perf_counter()
+        try:
+            return self._feed(data)
+        finally:
+            self._time += time.perf_counter() - start
+
+    def _feed(self, data: bytes) -> bool:
+        """Decode the next chunk of the body, as in :py:meth:`feed`."""
+        if not self.supported:
+            return False
+        self._raw_size += len(data)
+        if self._raw_size > _MAX_RAW_SIZE:
+            return False
+        if self._brotli:
+            try:
+                return self._add(self._brotli.process(data))
+            except Exception:  # The brotli modules raise their own error types
+                return False
+        if not self._zlib:
+            return self._add(data)
+
+        if self._first is not None:
+            self._first += data
+        try:
+            if not self._inflate(data):
+                return False
+        except zlib.error:
+            if self._first is None or self._size:
+                return False
+            # Some servers send raw deflate data without the zlib wrapper:
+            self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+            data, self._first = self._first, None
+            try:
+                return self._inflate(data)
+            except zlib.error:
+                return False
+        if self._size:
+            self._first = None
+        return True
+
+    def add_stats(self, source: CopyvioSource | None, elapsed: float) -> None:
+        """Record the body's sizes on a source, and the time spent on it.
+
+        *elapsed* is the total time taken to read and decode the body.
+        """
+        if source:
+            source.bytes_received += self._raw_size
+            source.bytes_decoded += self._size
+            source.add_time("download", elapsed - self._time)
+            source.add_time("decode", self._time)
+
+    def finish(self) -> OpenedURL | None:
+        """Return the decoded content, or None if it was incomplete or too large."""
+        start = time.perf_counter()
+        try:
+            return self._finish()
+        finally:
+            self._time += time.perf_counter() - start
+
+    def _finish(self) -> OpenedURL | None:
+        """Return the decoded content, as in :py:meth:`finish`."""
+        if not self.supported:
+            return None
+        if self._zlib:
+            try:
+                if not self._add(self._zlib.flush()):
+                    return None
+            except zlib.error:
+                return None
+            if not self._zlib.eof and self._raw_size:
+                return None  # Truncated stream
+        return OpenedURL(b"".join(self._chunks), self._parser_class)
+
+
+def _needs_local_parse(url: str) -> bool:
+    """Return whether parsing a URL's content may require opening other URLs.
+
+    Only the thread that parses the source can do this, so these sources cannot be
+    sent to the parse pool.
+    """
+    return urllib.parse.urlparse(url).netloc.endswith(".blogspot.com")
+
+
+def _serve_parse_jobs(conn: multiprocessing.connection.Connection) -> None:
+    """Parse the sources sent over *conn* in a parse pool process, until it closes.
+
+    Each job is sent back as ``("done", parsed)``, or ``("error", exc)`` if the parser
+    raised an exception.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent deals with Ctrl+C
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        try:
+            result: tuple[str, Any] = ("done", _parse_source(*job))
+        except Exception as exc:  # pylint: disable=broad-except
+            result = ("error", exc)
+        try:
+            conn.send(result)
+        except Exception:  # Probably an exception that can't be pickled
+            conn.send(("error", RuntimeError(repr(result[1]))))
+
+
+class _ParseProcess:
+    """A process in the parse pool, and our end of the pipe to it."""
+
+    def __init__(self) -> None:
+        # Forking a process full of worker threads can copy held locks; spawn instead:
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_parse_jobs, args=(child,), name="cvparse", daemon=True
+        )
+        try:
+            self.process.start()
+        finally:
+            child.close()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the process is still running."""
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        """Stop the process right away and clean up after it."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _ParsePool:
+    """Parses sources in a pool of up to *num_processes* separate processes.
+
+    A source gets *timeout* seconds to be parsed, after which its process is killed
+    and replaced, so a pathological source can't hold up the ones queued behind it.
+    Processes are started the first time they are needed, and are reused.
+    """
+
+    def __init__(self, num_processes: int | None, timeout: float) -> None:
+        self._num_processes = num_processes or os.cpu_count() or 1
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(self._num_processes)
+        self._idle: list[_ParseProcess] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _checkout(self) -> _ParseProcess:
+        """Return an idle process, starting a new one if there are none."""
+        with self._lock:
+            while self._idle:
+                proc = self._idle.pop()
+                if proc.alive:
+                    return proc
+                proc.kill()
+        return _ParseProcess()
+
+    def _checkin(self, proc: _ParseProcess) -> None:
+        """Return a process to the pool once it has finished a job."""
+        with self._lock:
+            if not self._closed:
+                self._idle.append(proc)
+                return
+        proc.kill()
+
+    def _acquire(self, cancellation: _CancellationToken | None) -> None:
+        """Wait for a free process, unless the work is cancelled first."""
+        while not self._slots.acquire(timeout=_PARSE_POLL_INTERVAL):
+            if cancellation:
+                cancellation.check()
+
+    def parse(
+        self, job: _ParseJob, cancellation: _CancellationToken | None = None
+    ) -> tuple[str, Any]:
+        """Parse a source in one of the processes.
+
+        Return ``("done", parsed)``, ``("error", exc)`` if the parser raised an
+        exception, or ``("timeout", None)`` or ``("crashed", None)`` if the process
+        took too long or died. If *cancellation* is cancelled first, the process is
+        killed and _SourceCancelledError is raised.
+        """
+        self._acquire(cancellation)
+        proc = None
+        try:
+            proc = self._checkout()
+            deadline = time.monotonic() + self._timeout
+            try:
+                proc.conn.send(job)
+                while not proc.conn.poll(_PARSE_POLL_INTERVAL):
+                    if cancellation:
+                        cancellation.check()
+                    if time.monotonic() >= deadline:
+                        return "timeout", None
+                result = proc.conn.recv()
+            except (EOFError, OSError):  # The process died
+                return "crashed", None
+            self._checkin(proc)
+            proc = None
+            return result
+        finally:
+            # The job didn't finish, so stop it from holding up the next one:
+            if proc:
+                proc.kill()
+            self._slots.release()
+
+    def close(self) -> None:
+        """Stop the idle processes, and the others as soon as they are done."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for proc in idle:
+            proc.kill()
+
+
+def _parse_in_pool(
+    pool: _ParsePool,
+    job: _ParseJob,
+    logger: logging.Logger,
+    cancellation: _CancellationToken | None = None,
+) -> _ParsedSource | None:
+    """Parse a source in the parse pool, or return None if it didn't work out.
+
+    Exceptions raised by the parser itself are re-raised here. If *cancellation* is
+    cancelled first, we stop the parse and raise _SourceCancelledError.
+    """
+    url = job[2]
+    kind, value = pool.parse(job, cancellation)
+    if kind == "done":
+        return value
+    if kind == "error":
+        raise value
+    if kind == "timeout":
+        logger.warning(f"Timed out parsing URL in process pool: {url}")
+    else:
+        logger.error(f"Process died while parsing URL in process pool: {url}")
+    return None
+
+
+def _parse_opened(
+    source: CopyvioSource,
+    opened: OpenedURL,
+    open_url: Callable[..., OpenedURL | None],
+    logger: logging.Logger,
+    keep_text: bool = False,
+) -> _ParsedSource | None:
+    """Parse an opened source, in the parse pool if there is one.
+
+    *open_url* is given to parsers that need to open more URLs. The parsed text is
+    kept in the chains if *keep_text* is set or the check is not compact. Return
+    None if the source could not be parsed in the pool.
+    """
+    args: ParserArgs = source.parser_args.copy() if source.parser_args else {}
+    degrees = list(source.workspace._articles)
+    keep_text = keep_text or not source.workspace._compact
+    cancellation = source.workspace._cancellation
+    pool = _parse_pool
+    job = (opened.content, opened.parser_class, source.url, args, degrees, keep_text)
+    if pool and not _needs_local_parse(source.url):
+        parsed = _parse_in_pool(pool, job, logger, cancellation)
+    else:
+        args["open_url"] = open_url
+        if cancellation:
+            args["cancelled"] = lambda: cancellation.cancelled
+        parsed = _parse_source(*job, cancellation=cancellation)
+    if parsed:
+        for phase, seconds in parsed.timings.items():
+            source.add_time(phase, seconds)
+        source.truncated = parsed.truncated
+    return parsed
+
+
+@dataclass
+class _CacheLookup:
+    """A source's entry in the HTTP cache, if it has one yet."""
+
+    cache: HTTPCache
+    source: CopyvioSource
+    url: str
+    variant: str
+    response: CachedResponse | None
+
+    @classmethod
+    def find(cls, source: CopyvioSource) -> _CacheLookup | None:
+        """Look up a source in the HTTP cache, or return None if it is disabled."""
+        config = source.search_config
+        cache = config.get("http_cache") if config else None
+        if not isinstance(cache, HTTPCache):
+            return None
+        args = source.parser_args or {}
+        variant = "\n".join(sorted(args.get("mirror_hints", [])))
+        response = cache.get(source.url, variant)
+        return cls(cache, source, source.url, variant, response)
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the cached response can be used without asking the server."""
+        if self.response is None or self.source.workspace._revalidate:
+            return False
+        return self.cache.is_fresh(self.response)
+
+    @property
+    def validators(self) -> dict[str, str] | None:
+        """Headers for a conditional request, if we have a response to validate."""
+        return self.response.validators if self.response else None
+
+    def load(self, revalidated: bool = False) -> dict[int, MarkovChain] | None:
+        """Build the source's chains from the cached response.
+
+        If *revalidated*, the server just told us the response is still current.
+        """
+        assert self.response is not None
+        if revalidated:
+            self.cache.refresh(self.url, self.variant)
+        if not self.response.text:
+            return None
+        workspace = self.source.workspace
+        with _timed(self.source, "chain"):
+            builder = MultiDegreeChainBuilder(
+                workspace._articles, keep_text=not workspace._compact
+            )
+            builder.feed(self.response.text)
+            return builder.build()
+
+    def store(
+        self, opened: OpenedURL, chains: dict[int, MarkovChain] | None
+    ) -> dict[int, MarkovChain] | None:
+        """Save a freshly parsed source and return its chains.
+
+        The chains must have been built with their text, which is dropped again
+        afterwards if the check is compact.
+        """
+        text = next(iter(chains.values())).text if chains else ""
+        # Text cut short by a timeout or crash might be complete next time:
+        transient = self.source.truncated in (
+            TRUNCATED_TIMEOUT,
+            TRUNCATED_CRASHED,
+            TRUNCATED_CANCELLED,
+        )
+        if opened.cacheable and text is not None and not transient:
+            response = CachedResponse(
+                text, opened.etag, opened.last_modified, time.time()
+            )
+            self.cache.put(self.url, response, self.variant)
+        if chains and self.source.workspace._compact:
+            chains = {
+                degree: MarkovChain._from_table(chain.chain, degree, None)
+                for degree, chain in chains.items()
+            }
+        return chains
+
+
+def _compare_source(
+    source: CopyvioSource, url: str, chains: dict[int, MarkovChain] | None
+) -> None:
+    """Cache and score a source that was opened from *url*."""
+    workspace = source.workspace
+    with _timed(source, "compare"):
+        if chains:
+            workspace.cache_source(url, source.url, chains)
+            workspace.compare(source, chains[workspace._degree], chains)
+        else:
+            workspace.compare(source, None)
+    _get_timing_stats().record(source.timings)
+
+
+def _get_site(url: str) -> str:
+    """Return the site a URL belongs to, for scheduling and statistics."""
+    netloc = urllib.parse.urlparse(url).netloc
+    try:
+        import tldextract
+
+        extracted = tldextract.extract(url)
+        # Newer versions of tldextract deprecate registered_domain in favor of this:
+        key = getattr(extracted, "top_domain_under_public_suffix", None)
+        if key is None:
+            key = extracted.registered_domain
+    except ModuleNotFoundError:  # Fall back on very naive method
+        key = ".".join(netloc.split(".")[-2:])
+    return key or netloc  # IP addresses, localhost, etc. have no domain
+
+
+class _DomainStats:
+    """Remembers how often sources from each site turned out to be matches.
+
+    This is shared by all checks in the process. Only the most recently seen
+    *max_sites* sites are kept.
+    """
+
+    def __init__(self, max_sites: int = 10000) -> None:
+        self._max_sites = max_sites
+        self._stats: collections.OrderedDict[str, tuple[int, int]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def record(self, site: str, hit: bool) -> None:
+        """Record whether a source from the given site was a match."""
+        with self._lock:
+            seen, hits = self._stats.pop(site, (0, 0))
+            self._stats[site] = (seen + 1, hits + hit)
+            if len(self._stats) > self._max_sites:
+                self._stats.popitem(last=False)
+
+    def get_rate(self, site: str) -> float:
+        """Return the smoothed fraction of the site's sources that were matches.
+
+        Sites we know nothing about get 0.5.
+        """
+        with self._lock:
+            seen, hits = self._stats.get(site, (0, 0))
+        return (hits + 1) / (seen + 2)
+
+
+def _get_domain_stats() -> _DomainStats:
+    """Return the process-wide domain statistics, creating them if necessary."""
+    global _domain_stats
+    if _domain_stats is None:
+        _domain_stats = _DomainStats()
+    return _domain_stats
+
+
+@dataclass(frozen=True)
+class TimingStats:
+    """How long one phase of recent checks took, from :py:func:`get_timing_stats`.
+
+    Each sample is one source, except for searches, where it is one check.
+    """
+
+    #: The number of samples these figures are taken from
+    count: int
+    #: The average time taken, in seconds
+    mean: float
+    #: The median time taken, in seconds
+    p50: float
+    #: The 90th percentile of the time taken, in seconds
+    p90: float
+    #: The 99th percentile of the time taken, in seconds
+    p99: float
+
+
+class _TimingStats:
+    """Keeps the most recent timings of each phase, for percentiles across checks."""
+
+    def __init__(self, max_samples: int = 1000) -> None:
+        self._max_samples = max_samples
+        self._samples: dict[str, collections.deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings: Mapping[str, float]) -> None:
+        """Add a sample of each phase given."""
+        with self._lock:
+            for phase, seconds in timings.items():
+                samples = self._samples.get(phase)
+                if samples is None:
+                    samples = collections.deque(maxlen=self._max_samples)
+                    self._samples[phase] = samples
+                samples.append(seconds)
+
+    def get_stats(self) -> dict[str, TimingStats]:
+        """Return statistics for each phase with samples."""
+        with self._lock:
+            samples = {phase: sorted(values) for phase, values in self._samples.items()}
+
+        def percentile(values: list[float], pct: int) -> float:
+            return values[max(0, math.ceil(len(values) * pct / 100) - 1)]
+
+        return {
+            phase: TimingStats(
+                count=len(values),
+                mean=sum(values) / len(values),
+                p50=percentile(values, 50),
+                p90=percentile(values, 90),
+                p99=percentile(values, 99),
+            )
+            for phase, values in samples.items()
+        }
+
+
+def _get_timing_stats() -> _TimingStats:
+    """Return the process-wide phase timings, creating them if necessary."""
+    global _timing_stats
+    if _timing_stats is None:
+        _timing_stats = _TimingStats()
+    return _timing_stats
+
+
+@dataclass
+class _SiteState:
+    """Tracks the sources being fetched from a single site."""
+
+    active: int = 0
+    next_start: float = 0
+
+
+@dataclass(frozen=True)
+class _QueuedSource:
+    """A source waiting in the scheduler, along with its site."""
+
+    source: CopyvioSource
+    site: str
+    queued: float = dataclasses.field(default_factory=time.monotonic)
+
+
+SiteQueues = collections.OrderedDict[str, list[_QueuedSource]]
 
-    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
-    sites: dict[str, SourceQueue] = dataclasses.field(default_factory=dict)
-    unassigned: UnassignedQueue = dataclasses.field(default_factory=queue.Queue)
+
+class _SourceScheduler:
+    """Hands out queued sources to workers, politely and fairly.
+
+    Sources are grouped by check and then by site. Workers get sources from each
+    check with queued work in turn, so a busy check can't hold up the rest. Within a
+    check, the source with the highest :py:attr:`~.CopyvioSource.priority` that is
+    ready goes first, with ties broken by taking the check's sites in turn. At most
+    *max_per_site* sources from a site are worked on at once, across all checks
+    sharing the scheduler, and new ones are started at least *site_interval*
+    seconds apart.
+
+    If *isolated*, checks don't affect each other beyond taking turns: the site
+    limits apply to each check separately, and each check only has up to its
+    ``num_workers`` sources worked on at once, as if it had its own workers.
+
+    *wakeup* is called whenever a source may have become ready, for consumers that
+    can't block on :py:attr:`lock`.
+    """
+
+    _PRUNE_THRESHOLD = 1024
+
+    def __init__(
+        self,
+        max_per_site: int = 1,
+        site_interval: float = 0,
+        wakeup: Callable[[], None] | None = None,
+        isolated: bool = False,
+    ) -> None:
+        self.lock = threading.Condition()
+        self._max_per_site = max_per_site
+        self._site_interval = site_interval
+        self._wakeup = wakeup
+        self._isolated = isolated
+        self._checks: collections.OrderedDict[CopyvioWorkspace, SiteQueues] = (
+            collections.OrderedDict()
+        )
+        self._sites: dict[Hashable, _SiteState] = {}
+        self._active: collections.Counter[CopyvioWorkspace] = collections.Counter()
+        self._stopped = False
+
+    def _get_site_key(self, workspace: CopyvioWorkspace, site: str) -> Hashable:
+        """Return the key that a site's limits are tracked under."""
+        return (workspace, site) if self._isolated else site
+
+    def _get_check_slots(self, workspace: CopyvioWorkspace) -> int | None:
+        """Return how many more of a check's sources can be started, if limited."""
+        if not self._isolated:
+            return None
+        return workspace._num_workers - self._active[workspace]
+
+    def get_capacity(self) -> int:
+        """Return how many workers the checks in progress have asked for in total.
+
+        Only isolated schedulers limit each check's workers, so this is only
+        meaningful for them.
+        """
+        with self.lock:
+            checks = set(self._checks) | set(self._active)
+            return sum(workspace._num_workers for workspace in checks)
+
+    def _notify(self) -> None:
+        """Wake up anything waiting for a source. The lock must be held."""
+        self.lock.notify_all()
+        if self._wakeup:
+            self._wakeup()
+
+    def _prune(self, now: float) -> None:
+        """Forget about idle sites that are no longer rate-limited."""
+        for site, state in list(self._sites.items()):
+            if not state.active and state.next_start <= now:
+                del self._sites[site]
+
+    def put(self, source: CopyvioSource, site: str) -> None:
+        """Queue a source from the given site. The lock must be held."""
+        queues = self._checks.setdefault(source.workspace, collections.OrderedDict())
+        queues.setdefault(site, []).append(_QueuedSource(source, site))
+        if len(self._sites) > self._PRUNE_THRESHOLD:
+            self._prune(time.monotonic())
+        self._notify()
+
+    def _get_delay(self, site: Hashable, now: float) -> float | None:
+        """Return how long until a source from *site* can be started.
+
+        Return None if the site is at its concurrency limit, so only a finished
+        source can free it up.
+        """
+        state = self._sites.get(site)
+        if not state:
+            return 0
+        if state.active >= self._max_per_site:
+            return None
+        return max(0, state.next_start - now)
+
+    def _pop(self, now: float) -> tuple[_QueuedSource | None, float | None]:
+        """Remove and start the next source that is ready. The lock must be held.
+
+        If no source is ready, return None along with how long until one may be
+        (or None if we must wait for a source to finish or be queued).
+        """
+        delay: float | None = None
+        for workspace, queues in list(self._checks.items()):
+            until = workspace._until
+            if until and time.time() >= until:
+                del self._checks[workspace]  # The check has run out of time
+                continue
+            slots = self._get_check_slots(workspace)
+            if slots is not None and slots <= 0:
+                continue
+            best: tuple[str, int] | None = None
+            best_priority = 0.0
+            for site, pending in list(queues.items()):
+                pending[:] = [item for item in pending if not item.source.skipped]
+                if not pending:
+                    del queues[site]
+                    continue
+                wait = self._get_delay(self._get_site_key(workspace, site), now)
+                if wait is None or wait > 0:
+                    if wait is not None:
+                        delay = wait if delay is None else min(delay, wait)
+                    continue
+                # max() picks the earliest of equals, so ties are first come first
+                # served within a site:
+                index = max(
+                    range(len(pending)), key=lambda i: pending[i].source.priority
+                )
+                priority = pending[index].source.priority
+                if best is None or priority > best_priority:
+                    best, best_priority = (site, index), priority
+            if best is None:
+                if not queues:
+                    del self._checks[workspace]
+                continue
+
+            site, index = best
+            pending = queues[site]
+            item = pending.pop(index)
+            if pending:
+                queues.move_to_end(site)
+            else:
+                del queues[site]
+            if queues:
+                self._checks.move_to_end(workspace)
+            else:
+                del self._checks[workspace]
+            state = self._sites.setdefault(
+                self._get_site_key(workspace, site), _SiteState()
+            )
+            state.active += 1
+            state.next_start = now + self._site_interval
+            self._active[workspace] += 1
+            item.source.queue_time = now - item.queued
+            item.source.start_work()
+            return item, None
+        return None, delay
+
+    def get(self, until: float | None = None) -> _QueuedSource:
+        """Block until a source is ready to be worked on, then return it.
+
+        Raise :py:exc:`queue.Empty` if none is ready by the time *until*, or
+        :py:exc:`StopIteration` if the scheduler has been stopped.
+        """
+        with self.lock:
+            while True:
+                if self._stopped:
+                    raise StopIteration
+                item, timeout = self._pop(time.monotonic())
+                if item:
+                    return item
+                if until:
+                    remaining = until - time.time()
+                    if remaining <= 0:
+                        raise queue.Empty()
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self.lock.wait(timeout)
+
+    def get_ready(self) -> tuple[list[_QueuedSource], float | None]:
+        """Return all sources that are ready to be worked on, without blocking.
+
+        Also return how long until more may be ready, as with :py:meth:`_pop`.
+        """
+        items = []
+        with self.lock:
+            while True:
+                item, delay = self._pop(time.monotonic())
+                if not item:
+                    return items, delay
+                items.append(item)
+
+    def _count_ready(self, site: Hashable, queued: int, now: float) -> int:
+        """Return how many of a site's queued sources could be started now."""
+        state = self._sites.get(site, _SiteState())
+        if state.next_start > now:
+            return 0
+        slots = self._max_per_site - state.active
+        if self._site_interval:
+            slots = min(slots, 1)  # The rest have to wait their turn
+        return max(0, min(queued, slots))
+
+    def count(self) -> tuple[int, int]:
+        """Return how many sources are queued, and how many could be started now."""
+        now = time.monotonic()
+        total = ready = 0
+        with self.lock:
+            per_site: collections.Counter[Hashable] = collections.Counter()
+            for workspace, queues in self._checks.items():
+                check_ready = 0
+                for site, pending in queues.items():
+                    queued = sum(not item.source.skipped for item in pending)
+                    total += queued
+                    key = self._get_site_key(workspace, site)
+                    if self._isolated:
+                        check_ready += self._count_ready(key, queued, now)
+                    else:
+                        per_site[key] += queued
+                slots = self._get_check_slots(workspace)
+                if slots is not None:
+                    ready += max(0, min(check_ready, slots))
+            for site, queued in per_site.items():
+                ready += self._count_ready(site, queued, now)
+        return total, ready
+
+    def release(self, item: _QueuedSource) -> None:
+        """Mark a source returned by :py:meth:`get` as finished."""
+        workspace = item.source.workspace
+        key = self._get_site_key(workspace, item.site)
+        with self.lock:
+            state = self._sites[key]
+            state.active -= 1
+            if not state.active and state.next_start <= time.monotonic():
+                del self._sites[key]
+            self._active[workspace] -= 1
+            if not self._active[workspace]:
+                del self._active[workspace]
+            self._notify()
+
+    def discard(self, workspace: CopyvioWorkspace) -> None:
+        """Forget any sources still queued for a check that is over."""
+        with self.lock:
+            self._checks.pop(workspace, None)
+
+    def stop(self) -> None:
+        """Make workers waiting for sources exit."""
+        with self.lock:
+            self._stopped = True
+            self._notify()
+
+
+@dataclass(frozen=True)
+class WorkerPoolStats:
+    """A snapshot of the global worker pool, from :py:func:`get_pool_stats`."""
+
+    #: The number of worker threads running
+    workers: int
+    #: The number of workers handling a source right now
+    busy: int
+    #: The number of workers always kept running
+    min_workers: int
+    #: The most workers the pool will grow to
+    max_workers: int
+    #: The number of sources waiting for a worker
+    queued: int
+    #: The number of waiting sources that could be started right now
+    ready: int
+    #: The recent fraction of workers that were busy, between 0 and 1
+    utilization: float
+    #: The recent average time taken to handle a source, in seconds
+    fetch_latency: float
+
+
+class _WorkerPool:
+    """Runs a set of worker threads, adding and retiring them with demand.
+
+    The pool has its own scheduler, created with the given arguments. A monitor
+    thread checks it whenever sources are queued or finished, and every few moments
+    otherwise, and starts workers for any ready sources beyond the idle workers, up
+    to *max_workers*. Workers beyond *min_workers* exit once they have waited too
+    long for a source.
+
+    If *max_workers* is None, the pool grows up to the total number of workers asked
+    for by the checks in progress instead, for a pool whose *isolated* scheduler
+    limits each check to its own.
+    """
+
+    _INTERVAL = 0.25
+    _MIN_IDLE_TIME = 10.0
+    _SMOOTHING = 0.1  # Weight of each new sample in the moving averages
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int | None,
+        max_per_site: int = 1,
+        site_interval: float = 0,
+        isolated: bool = False,
+        name: str = "global",
+    ) -> None:
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self._name = name
+        self._wakeup = threading.Event()
+        self.scheduler = _SourceScheduler(
+            max_per_site, site_interval, wakeup=self._wakeup.set, isolated=isolated
+        )
+        self._workers = 0
+        self._busy = 0
+        self._started = 0
+        self._latency = 0.0
+        self._utilization = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def idle_time(self) -> float:
+        """How long an extra worker waits for a source before exiting."""
+        return max(self._MIN_IDLE_TIME, 4 * self._latency)
+
+    def _get_max_workers(self) -> int:
+        """Return the most workers the pool may have right now."""
+        if self.max_workers is None:
+            return max(self.min_workers, self.scheduler.get_capacity())
+        return self.max_workers
+
+    def _spawn(self) -> None:
+        """Start a new worker thread."""
+        with self._lock:
+            name = f"{self._name}-{self._started}"
+            self._started += 1
+            self._workers += 1
+        _CopyvioWorker(name, self.scheduler, pool=self).start()
+
+    def _monitor(self) -> None:
+        """Keep track of utilization and start workers when they are needed."""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._INTERVAL)
+            self._wakeup.clear()
+            _, ready = self.scheduler.count()
+            max_workers = self._get_max_workers()
+            with self._lock:
+                busy = self._busy / self._workers if self._workers else 0.0
+                self._utilization += self._SMOOTHING * (busy - self._utilization)
+                idle = self._workers - self._busy
+                needed = min(ready - idle, max_workers - self._workers)
+            for _ in range(needed):
+                self._spawn()
+
+    def start(self) -> None:
+        """Start the minimum number of workers and the monitor thread."""
+        for _ in range(self.min_workers):
+            self._spawn()
+        thread = threading.Thread(
+            target=self._monitor, name=f"cvworker-{self._name}-monitor"
+        )
+        thread.daemon = True
+        thread.start()
+
+    def stop(self) -> None:
+        """Stop the monitor thread and make all workers exit."""
+        self._stopped.set()
+        self.scheduler.stop()
+        self._wakeup.set()
+
+    def retire(self) -> bool:
+        """Return whether an idle worker may exit, and forget it if so."""
+        with self._lock:
+            if self._workers <= self.min_workers:
+                return False
+            self._workers -= 1
+            return True
+
+    def set_busy(self, busy: bool) -> None:
+        """Record that a worker has started or finished handling a source."""
+        with self._lock:
+            self._busy += 1 if busy else -1
+
+    def record_latency(self, elapsed: float) -> None:
+        """Record how long a worker took to handle a source."""
+        with self._lock:
+            if self._latency:
+                self._latency += self._SMOOTHING * (elapsed - self._latency)
+            else:
+                self._latency = elapsed
+
+    def get_stats(self) -> WorkerPoolStats:
+        """Return a snapshot of the pool's current state."""
+        queued, ready = self.scheduler.count()
+        max_workers = self._get_max_workers()
+        with self._lock:
+            return WorkerPoolStats(
+                workers=self._workers,
+                busy=self._busy,
+                min_workers=self.min_workers,
+                max_workers=max_workers,
+                queued=queued,
+                ready=ready,
+                utilization=self._utilization,
+                fetch_latency=self._latency,
+            )
+
+
+class _KeepAliveResponse(http.client.HTTPResponse):
+    """An HTTP response that gives its connection back when it is closed."""
+
+    release: Callable[[bool], None] | None = None
+
+    def close(self) -> None:
+        # Once the body has been read to the end, the connection can be used again;
+        # if we stopped partway through, the rest of the body is still in the way:
+        done = self.isclosed() or self.length == 0
+        reusable = done and not self.will_close
+        super().close()
+        if self.release:
+            release, self.release = self.release, None
+            release(reusable)
+
+
+class _KeepAliveMixin:
+    """Makes a urllib handler keep connections open between requests.
+
+    urllib normally opens a new connection for every request. Each worker has its
+    own opener, so handlers are only used by one thread at a time.
+    """
+
+    _MAX_IDLE = 8
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._idle: collections.OrderedDict[str, http.client.HTTPConnection] = (
+            collections.OrderedDict()
+        )
+
+    def _release(
+        self, host: str, conn: http.client.HTTPConnection, reusable: bool
+    ) -> None:
+        """Put a connection back in the idle set after its response was closed."""
+        if not reusable or not conn.sock:
+            conn.close()
+            return
+        if host in self._idle:
+            self._idle.pop(host).close()
+        self._idle[host] = conn
+        while len(self._idle) > self._MAX_IDLE:
+            self._idle.popitem(last=False)[1].close()
+
+    def _request(
+        self, conn: http.client.HTTPConnection, req: urllib.request.Request
+    ) -> http.client.HTTPResponse:
+        """Send a request on the given connection and return its response."""
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+        headers = {name.title(): val for name, val in headers.items()}
+        conn.request(
+            req.get_method(),
+            req.selector,
+            req.data,
+            headers,
+            encode_chunked=req.has_header("Transfer-encoding"),
+        )
+        return conn.getresponse()
+
+    def _keepalive_open(
+        self,
+        conn_class: type[http.client.HTTPConnection],
+        req: urllib.request.Request,
+        **kwargs: Any,
+    ) -> http.client.HTTPResponse:
+        """Open a request, reusing an idle connection to its host if we have one."""
+        if getattr(req, "_tunnel_host", None):  # Proxy tunnels aren't kept
+            return self.do_open(  # pyright: ignore[reportAttributeAccessIssue]
+                conn_class, req, **kwargs
+            )
+
+        host = req.host
+        conn = self._idle.pop(host, None)
+        if conn:
+            conn.timeout = req.timeout
+            if conn.sock:
+                conn.sock.settimeout(req.timeout)
+            try:
+                response = self._request(conn, req)
+            except (OSError, HTTPException):
+                conn.close()  # The server probably closed it; try a new connection
+                conn = None
+        if not conn:
+            conn = conn_class(host, timeout=req.timeout, **kwargs)
+            conn.response_class = _KeepAliveResponse
+            dns_cache = get_dns_cache()
+            if dns_cache is not None:
+                # http.client opens its socket through this (undeclared) hook:
+                setattr(conn, "_create_connection", dns_cache.create_connection)
+            try:
+                response = self._request(conn, req)
+            except (OSError, HTTPException) as exc:
+                conn.close()
+                raise URLError(exc) from exc
+
+        assert isinstance(response, _KeepAliveResponse)
+        response.release = functools.partial(self._release, host, conn)
+        response.url = req.get_full_url()
+        response.msg = response.reason  # pyright: ignore[reportAttributeAccessIssue]
+        return response
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        while self._idle:
+            self._idle.popitem()[1].close()
+
+
+class _KeepAliveHTTPHandler(_KeepAliveMixin, urllib.request.HTTPHandler):
+    def http_open(self, req: urllib.request.Request) -> http.client.HTTPResponse:
+        return self._keepalive_open(http.client.HTTPConnection, req)
+
+
+class _KeepAliveHTTPSHandler(_KeepAliveMixin, urllib.request.HTTPSHandler):
+    def https_open(self, req: urllib.request.Request) -> http.client.HTTPResponse:
+        return self._keepalive_open(
+            http.client.HTTPSConnection,
+            req,
+            context=self._context,  # pyright: ignore[reportAttributeAccessIssue]
+        )
 
 
 class _CopyvioWorker:
     """A multithreaded URL opener/parser instance."""
 
     def __init__(
-        self, name: str, queues: _CopyvioQueues, until: float | None = None
+        self,
+        name: str,
+        scheduler: _SourceScheduler,
+        until: float | None = None,
+        pool: _WorkerPool | None = None,
     ) -> None:
         self._name = name
-        self._queues = queues
+        self._scheduler = scheduler
         self._until = until
+        self._pool = pool
 
-        self._site: str | None = None
-        self._queue: SourceQueue | None = None
         self._search_config: dict[str, Any] | None = None
-        self._opener = urllib.request.build_opener()
+        self._cancellation: _CancellationToken | None = None
+        self._handlers = [_KeepAliveHTTPHandler(), _KeepAliveHTTPSHandler()]
+        self._opener = urllib.request.build_opener(*self._handlers)
         self._logger = logging.getLogger("earwigbot.wiki.cvworker." + name)
 
-    def _try_map_proxy_url(
-        self,
-        url: str,
-        parsed: urllib.parse.ParseResult,
-        extra_headers: dict[str, str],
-        is_error: bool = False,
-    ) -> tuple[str, bool]:
-        if not self._search_config or "proxies" not in self._search_config:
-            return url, False
-        for proxy_info in self._search_config["proxies"]:
-            if parsed.netloc != proxy_info["netloc"]:
-                continue
-            if "onerr" in proxy_info:
-                if proxy_info["onerr"] and not is_error:
-                    continue
-                if not proxy_info["onerr"] and is_error:
-                    continue
-            path = parsed.path
-            if "path" in proxy_info:
-                if not parsed.path.startswith(proxy_info["path"]):
-                    continue
-                path = path[len(proxy_info["path"]) :]
-            url = proxy_info["target"] + path
-            if parsed.query:
-                url += "?" + parsed.query
-            if "auth" in proxy_info:
-                auth_hash = base64.b64encode(proxy_info["auth"].encode()).decode()
-                extra_headers["Authorization"] = f"Basic {auth_hash}"
-            return url, True
-        return url, False
-
     def _open_url_raw(
         self,
         url: str,
         timeout: float = 5,
         allow_content_types: Container[str] | None = None,
+        validators: dict[str, str] | None = None,
+        source: CopyvioSource | None = None,
     ) -> OpenedURL | None:
         """Open a URL, without parsing it.
 
-        None will be returned for URLs that cannot be read for whatever reason.
+        None will be returned for URLs that cannot be read for whatever reason. If
+        *validators* are given, the request is conditional, and _NotModifiedError is
+        raised if the server says our copy is current. If *source* is given, the time
+        taken and bytes received are recorded on it.
         """
         parsed = urllib.parse.urlparse(url)
-        extra_headers: dict[str, str] = {}
-        url, _ = self._try_map_proxy_url(url, parsed, extra_headers)
+        extra_headers = {
+            "Accept-Encoding": _get_accept_encoding(),
+            **(validators or {}),
+        }
+        url, _ = _try_map_proxy_url(self._search_config, url, parsed, extra_headers)
+        with _timed(source, "dns"):
+            _resolve_host(url)
         request = urllib.request.Request(url, headers=extra_headers)
-        try:
-            response = self._opener.open(request, timeout=timeout)
-        except (OSError, URLError, HTTPException, ValueError):
-            url, remapped = self._try_map_proxy_url(
-                url, parsed, extra_headers, is_error=True
-            )
-            if not remapped:
-                self._logger.exception(f"Failed to fetch URL: {url}")
-                return None
-            self._logger.info(f"Failed to fetch URL, trying proxy remap: {url}")
-            request = urllib.request.Request(url, headers=extra_headers)
+        with _timed(source, "connect"):
             try:
                 response = self._opener.open(request, timeout=timeout)
-            except (OSError, URLError, HTTPException, ValueError):
-                self._logger.exception(f"Failed to fetch URL after proxy remap: {url}")
-                return None
-
-        try:
-            size = int(response.headers.get("Content-Length", 0))
-        except ValueError:
-            return None
-
-        content_type = response.headers.get("Content-Type", "text/plain")
-        content_type = content_type.split(";", 1)[0]
-        parser_class = get_parser(content_type)
-        if not parser_class and (
-            not allow_content_types or content_type not in allow_content_types
-        ):
-            return None
+            except (OSError, URLError, HTTPException, ValueError) as exc:
+                if validators and isinstance(exc, HTTPError) and exc.code == 304:
+                    raise _NotModifiedError() from None
+                url, remapped = _try_map_proxy_url(
+                    self._search_config, url, parsed, extra_headers, is_error=True
+                )
+                if not remapped:
+                    self._logger.exception(f"Failed to fetch URL: {url}")
+                    return None
+                self._logger.info(f"Failed to fetch URL, trying proxy remap: {url}")
+                request = urllib.request.Request(url, headers=extra_headers)
+                try:
+                    response = self._opener.open(request, timeout=timeout)
+                except (OSError, URLError, HTTPException, ValueError):
+                    self._logger.exception(
+                        f"Failed to fetch URL after proxy remap: {url}"
+                    )
+                    return None
+
+        parser_class = _get_response_parser(response.headers, allow_content_types)
         if not parser_class:
-            parser_class = get_parser()
-        if size > (15 if parser_class.TYPE == "PDF" else 2) * 1024**2:
             return None
 
+        # The Content-Length can be missing (Transfer-Encoding: chunked) or wrong, so
+        # keep checking the size as we go. read1() returns whatever has arrived, so
+        # we also notice quickly if the check is over:
+        decoder = _ContentDecoder(
+            response.headers.get("Content-Encoding"), parser_class
+        )
+        start = time.perf_counter()
         try:
-            # Additional safety check for pages using Transfer-Encoding: chunked
-            # where we can't read the Content-Length
-            content = response.read(_MAX_RAW_SIZE + 1)
-        except (OSError, URLError):
+            while chunk := response.read1(_CHUNK_SIZE):
+                if self._cancellation:
+                    self._cancellation.check()
+                if not decoder.feed(chunk):
+                    return None
+            opened = decoder.finish()
+        except (OSError, URLError, HTTPException):
             return None
-        if len(content) > _MAX_RAW_SIZE:
-            return None
-
-        if response.headers.get("Content-Encoding") == "gzip":
-            stream = io.BytesIO(content)
-            gzipper = gzip.GzipFile(fileobj=stream)
-            try:
-                content = gzipper.read()
-            except (OSError, struct.error):
-                return None
-
-        if len(content) > _MAX_RAW_SIZE:
-            return None
-        return OpenedURL(content, parser_class)
-
-    def _open_url(self, source: CopyvioSource, redirects: int = 0) -> str | None:
-        """Open a URL and return its parsed content, or None.
-
-        First, we will decompress the content if the headers contain "gzip" as its
-        content encoding. Then, we will return the content stripped using an HTML
-        parser if the headers indicate it is HTML, or return the content directly if it
-        is plain text. If we don't understand the content type, we'll return None.
-
-        If a URLError was raised while opening the URL or an IOError was raised while
-        decompressing, None will be returned.
+        finally:
+            response.close()
+            decoder.add_stats(source, time.perf_counter() - start)
+        return _add_cache_headers(opened, response.headers)
+
+    def _open_url(
+        self, source: CopyvioSource, redirects: int = 0
+    ) -> dict[int, MarkovChain] | None:
+        """Open a URL and return Markov chains of its parsed content, or None.
+
+        First, we will decompress the content as it is downloaded if the headers give
+        a content encoding (gzip, deflate, or Brotli, if available). Then, we will feed
+        the content stripped using an HTML parser if the headers indicate it is HTML,
+        or the content directly if it is plain text, into a chain builder as it is
+        parsed. A chain is built for each degree the workspace scores, mapped by
+        degree. If we don't understand the content type or the parsed content is
+        empty, we'll return None.
+
+        If a URLError was raised while opening the URL, the content could not be
+        decompressed, or it grew too large for its parser, None will be returned.
         """
         self._search_config = source.search_config
+        self._cancellation = source.workspace._cancellation
         if source.headers:
             self._opener.addheaders = source.headers
 
-        result = self._open_url_raw(source.url, timeout=source.timeout)
+        lookup = _CacheLookup.find(source)
+        if lookup and lookup.fresh:
+            self._logger.debug(f"Loaded from HTTP cache: {source.url}")
+            return lookup.load()
+        try:
+            result = self._open_url_raw(
+                source.url,
+                timeout=source.timeout,
+                validators=lookup.validators if lookup else None,
+                source=source,
+            )
+        except _NotModifiedError:
+            assert lookup is not None
+            self._logger.debug(f"Revalidated in HTTP cache: {source.url}")
+            return lookup.load(revalidated=True)
         if result is None:
             return None
 
-        args: ParserArgs = source.parser_args.copy() if source.parser_args else {}
-        args["open_url"] = functools.partial(self._open_url_raw, timeout=source.timeout)
-        parser = result.parser_class(result.content, source.url, args=args)
-        try:
-            return parser.parse()
-        except ParserRedirectError as exc:
+        open_url = functools.partial(self._open_url_raw, timeout=source.timeout)
+        parsed = _parse_opened(
+            source, result, open_url, self._logger, keep_text=lookup is not None
+        )
+        if parsed is None:
+            return None
+        if parsed.redirect is not None:
             if redirects >= _MAX_REDIRECTS:
                 return None
-            source.url = exc.url.decode("utf8")
+            source.url = parsed.redirect
             return self._open_url(source, redirects=redirects + 1)
-
-    def _acquire_new_site(self) -> None:
-        """Block for a new unassigned site queue."""
-        if self._until:
-            timeout = self._until - time.time()
-            if timeout <= 0:
-                raise queue.Empty()
-        else:
-            timeout = None
-
-        self._logger.debug("Waiting for new site queue")
-        site, q = self._queues.unassigned.get(timeout=timeout)
-        if isinstance(site, type) and issubclass(site, StopIteration):
-            raise StopIteration
-        self._logger.debug(f"Acquired new site queue: {site}")
-        self._site = site
-        self._queue = q
-
-    def _dequeue(self) -> CopyvioSource:
-        """Remove a source from one of the queues."""
-        if not self._site:
-            self._acquire_new_site()
-        assert self._site is not None
-        assert self._queue is not None
-
-        self._logger.debug(f"Fetching source URL from queue {self._site}")
-        self._queues.lock.acquire()
-        try:
-            source = self._queue.popleft()
-        except IndexError:
-            self._logger.debug("Queue is empty")
-            del self._queues.sites[self._site]
-            self._site = None
-            self._queue = None
-            self._queues.lock.release()
-            return self._dequeue()
-
-        self._logger.debug(f"Got source URL: {source.url}")
-        if source.skipped:
-            self._logger.debug("Source has been skipped")
-            self._queues.lock.release()
-            return self._dequeue()
-
-        source.start_work()
-        self._queues.lock.release()
-        return source
+        if lookup:
+            return lookup.store(result, parsed.chains)
+        return parsed.chains
 
     def _handle_once(self) -> bool:
-        """Handle a single source from one of the queues. Return if we should exit."""
+        """Handle a single source from the scheduler. Return if we should exit."""
+        until = self._until
+        if self._pool:
+            until = time.time() + self._pool.idle_time
         try:
-            source = self._dequeue()
+            item = self._scheduler.get(until)
         except queue.Empty:
+            if self._pool and not self._pool.retire():
+                return True  # Needed to keep the pool at its minimum size
             self._logger.debug("Exiting: queue timed out")
             return False
         except StopIteration:
             self._logger.debug("Exiting: got stop signal")
             return False
 
+        if self._pool:
+            self._pool.set_busy(True)
+        start = time.monotonic()
         try:
-            text = self._open_url(source)
+            self._handle_source(item)
+        finally:
+            if self._pool:
+                self._pool.set_busy(False)
+                self._pool.record_latency(time.monotonic() - start)
+        return True
+
+    def _handle_source(self, item: _QueuedSource) -> None:
+        """Open, parse, and compare a source given to us by the scheduler."""
+        source = item.source
+        self._logger.debug(f"Got source URL: {source.url}")
+        url = source.url
+        try:
+            chains = self._open_url(source)
         except ParserExclusionError:
             self._logger.debug("Source excluded by content parser")
             source.skipped = source.excluded = True
             source.finish_work()
+        except _SourceCancelledError:
+            self._logger.debug("Source cancelled; check is over")
+            source.skipped = True
+            source.finish_work()
         except Exception:
             self._logger.exception("Uncaught exception in worker")
             source.skip()
             source.finish_work()
         else:
-            chain = MarkovChain(text, degree=source.workspace._degree) if text else None
-            source.workspace.compare(source, chain)
-        return True
+            _compare_source(source, url, chains)
+        finally:
+            self._scheduler.release(item)
 
     def _run(self) -> None:
         """Main entry point for the worker thread.
 
-        We will keep fetching URLs from the queues and handling them until either we
-        run out of time, or we get an exit signal that the queue is now empty.
+        We will keep fetching URLs from the scheduler and handling them until either
+        we run out of time, or we get an exit signal that the check is done.
         """
-        while True:
-            try:
-                if not self._handle_once():
-                    break
-            except Exception:
-                self._logger.exception("Uncaught exception in worker")
-                time.sleep(5)  # Delay if we get stuck in a busy loop
+        try:
+            while True:
+                try:
+                    if not self._handle_once():
+                        break
+                except Exception:
+                    self._logger.exception("Uncaught exception in worker")
+                    time.sleep(5)  # Delay if we get stuck in a busy loop
+        finally:
+            for handler in self._handlers:
+                handler.close()
 
     def start(self) -> None:
         """Start the copyvio worker in a new thread."""
@@ -384,17 +1812,27 @@ class CopyvioWorkspace:
         exclusion_callback: Callable[[str], bool] | None = None,
         config: dict[str, Any] | None = None,
         degree: int = DEFAULT_DEGREE,
+        use_source_cache: bool = False,
+        revalidate: bool = False,
+        compact: bool = False,
+        max_phrases: int = 0,
+        extra_articles: dict[int, MarkovChain] | None = None,
+        fetcher: str = "urllib",
     ) -> None:
         self.sources: list[CopyvioSource] = []
         self.finished = False
         self.possible_miss = False
+        self.search_time = 0.0  # Filled in by the caller, if it searches
 
         self._article = article
         self._logger = logger.getChild("copyvios")
         self._min_confidence = min_confidence
         self._start_time = time.time()
         self._until = (self._start_time + max_time) if max_time > 0 else None
-        self._handled_urls: set[str] = set()
+        self._handled_urls: dict[str, CopyvioSource] = {}
+        self._verdict_time: float | None = None
+        self._cancellation = _CancellationToken()
+        self._cancelled_sources = 0
         self._finish_lock = threading.Lock()
         self._short_circuit = short_circuit
         self._source_args = {
@@ -406,19 +1844,75 @@ class CopyvioWorkspace:
         }
         self._exclusion_callback = exclusion_callback
         self._degree = degree
-
-        if _is_globalized:
-            assert _global_queues is not None
-            self._queues = _global_queues
+        self._compact = compact
+        self._max_phrases = max_phrases
+        self._extra_articles = {
+            extra: chain
+            for extra, chain in (extra_articles or {}).items()
+            if extra != degree
+        }
+        self._articles = {degree: article, **self._extra_articles}
+        self._included_deltas: dict[int, list[MarkovChain]] = {
+            extra: [] for extra in self._articles
+        }
+        self._source_cache = get_source_cache() if use_source_cache else None
+        self._source_cache_args = (
+            compact,
+            tuple(parser_args.get("mirror_hints", ())) if parser_args else (),
+        )
+        self._source_cache_hits = 0
+        self._source_cache_misses = 0
+        self._revalidate = revalidate  # Always ask servers about HTTP cache entries
+
+        self._num_workers = num_workers
+        self._fetcher = self._get_fetcher(fetcher)
+        self._owns_scheduler = False
+        if self._fetcher:
+            self._scheduler = self._fetcher.scheduler
+        elif _is_globalized:
+            assert _global_scheduler is not None
+            self._scheduler = _global_scheduler
+        elif num_workers > 0:
+            # Borrow up to num_workers threads from the shared pool; the scheduler
+            # keeps us from affecting other checks:
+            self._scheduler = _get_local_pool().scheduler
         else:
-            self._queues = _CopyvioQueues()
-            self._num_workers = num_workers
-            for i in range(num_workers):
-                name = f"local-{id(self) % 10000:04}.{i}"
-                _CopyvioWorker(name, self._queues, self._until).start()
+            self._scheduler = _SourceScheduler()  # Left for the caller to run
+            self._owns_scheduler = True
+
+    def _get_fetcher(self, name: str) -> AsyncFetcher | None:
+        """Return the async fetcher if it was chosen, or None to use worker threads.
 
-    def _calculate_confidence(self, delta: MarkovChainIntersection) -> float:
+        *name* is ``"urllib"`` for worker threads or ``"asyncio"`` for the fetcher.
+        """
+        if name == "urllib":
+            return None
+        if name != "asyncio":
+            raise ValueError(f"Unknown copyvio fetcher: {name!r}")
+        try:
+            from earwigbot.wiki.copyvios.fetcher import get_async_fetcher
+        except ModuleNotFoundError:
+            self._logger.warning(
+                "The asyncio fetcher requires aiohttp (install earwigbot[async]); "
+                "using urllib"
+            )
+            return None
+        return get_async_fetcher()
+
+    def _calculate_confidence(
+        self, delta: MarkovChainIntersection, article: MarkovChain | None = None
+    ) -> float:
         """Return the confidence of a violation as a float between 0 and 1."""
+        return self._get_confidence(delta.size, article)
+
+    def _get_confidence(
+        self, d_size: float, article: MarkovChain | None = None
+    ) -> float:
+        """Return the confidence of a violation given the size of its delta chain.
+
+        By default, this is relative to the article's chain at the main degree.
+        """
+        a_size = (article or self._article).size
 
         def conf_with_article_and_delta(article: float, delta: float) -> float:
             """Calculate confidence using the article and delta chain sizes."""
@@ -447,31 +1941,78 @@ class CopyvioWorkspace:
             else:
                 return (delta - 50) / delta
 
-        d_size = float(delta.size)
         return abs(
             max(
-                conf_with_article_and_delta(self._article.size, d_size),
-                conf_with_delta(d_size),
+                conf_with_article_and_delta(a_size, float(d_size)),
+                conf_with_delta(float(d_size)),
             )
         )
 
     def _finish_early(self) -> None:
         """Finish handling links prematurely (if we've hit min_confidence)."""
         self._logger.debug("Confidence threshold met; skipping remaining sources")
-        with self._queues.lock:
+        with self._scheduler.lock:
             for source in self.sources:
                 source.skip()
             self.finished = True
+        self._cancel()
+
+    def _cancel(self) -> None:
+        """Stop work on any sources still being fetched or parsed for this check."""
+        with self._scheduler.lock:
+            if self._cancellation.cancelled:
+                return
+            self._cancelled_sources = sum(source.active for source in self.sources)
+            if self._cancelled_sources:
+                self._logger.debug(f"Cancelling {self._cancelled_sources} sources")
+        self._cancellation.cancel()
+
+    def _get_cached_source(self, url: str) -> CachedSource | None:
+        """Look up a URL in the source cache, recording a hit or miss.
+
+        Return None unless the cached source has a chain for every degree we score.
+        """
+        if self._source_cache is None:
+            return None
+        entry = self._source_cache.get((url, self._source_cache_args))
+        if not entry or not all(degree in entry.chains for degree in self._articles):
+            self._source_cache_misses += 1
+            return None
+        self._source_cache_hits += 1
+        return entry
 
-    def enqueue(self, urls: list[str]) -> None:
-        """Put a list of URLs into the various worker queues."""
-        for url in urls:
-            with self._queues.lock:
+    def cache_source(
+        self, url: str, final_url: str, chains: dict[int, MarkovChain]
+    ) -> None:
+        """Store a parsed source's chains in the source cache, if it is enabled."""
+        if self._source_cache is None:
+            return
+        self._source_cache.put((url, self._source_cache_args), final_url, chains)
+
+    def enqueue(self, urls: list[str], origin: str = "search") -> None:
+        """Put a list of URLs into the various worker queues.
+
+        *origin* says where the URLs came from: ``"search"`` for the results of a
+        single search query, in rank order, or ``"link"`` for links found in the
+        article. Each source is given a priority from its origin, its search rank,
+        and how often its site has had matches before; URLs returned by more than
+        one query are bumped up. Sources with higher priorities are fetched first.
+
+        URLs found in the source cache are compared immediately instead. The hosts of
+        the others start being looked up right away, so they are usually known by the
+        time the sources are fetched.
+        """
+        hosts: list[str] = []
+        for rank, url in enumerate(dict.fromkeys(urls)):
+            site = _get_site(url)
+            with self._scheduler.lock:
                 if url in self._handled_urls:
+                    self._handled_urls[url].priority += PRIORITY_REPEAT
                     continue
-                self._handled_urls.add(url)
 
                 source = CopyvioSource(url=url, **self._source_args)
+                source.priority = self._get_priority(site, origin, rank)
+                self._handled_urls[url] = source
                 self.sources.append(source)
 
                 if self._exclusion_callback and self._exclusion_callback(url):
@@ -484,42 +2025,106 @@ class CopyvioWorkspace:
                     source.skip()
                     continue
 
-                try:
-                    import tldextract
+                cached = self._get_cached_source(url)
+                if cached:
+                    source.start_work()
+                else:
+                    self._logger.debug(f"enqueue(): {site} -> {url}")
+                    self._scheduler.put(source, site)
+                    if host := self._get_host(url):
+                        hosts.append(host)
+                    continue
 
-                    key = tldextract.extract(url).registered_domain
-                except ModuleNotFoundError:  # Fall back on very naive method
-                    from urllib.parse import urlparse
+            self._logger.debug(f"enqueue(): cache hit {url}")
+            source.url = cached.url
+            self.compare(source, cached.chains[self._degree], cached.chains)
 
-                    key = ".".join(urlparse(url).netloc.split(".")[-2:])
+        dns_cache = get_dns_cache()
+        if dns_cache is not None and hosts:
+            dns_cache.prefetch(hosts)
 
-                matchup = f"{key} -> {url}"
-                logmsg = "enqueue(): %s %s"
-                if key in self._queues.sites:
-                    self._logger.debug(logmsg % ("append", matchup))
-                    self._queues.sites[key].append(source)
-                else:
-                    self._logger.debug(logmsg % ("new", matchup))
-                    q: SourceQueue = collections.deque()
-                    q.append(source)
-                    self._queues.sites[key] = q
-                    self._queues.unassigned.put((key, q))
-
-    def compare(self, source: CopyvioSource, source_chain: MarkovChain | None) -> None:
-        """Compare a source to the article; call _finish_early if necessary."""
+    def _get_host(self, url: str) -> str | None:
+        """Return the host that a source URL will be downloaded from."""
+        config = self._source_args["search_config"]
+        try:
+            url, _ = _try_map_proxy_url(config, url, urllib.parse.urlparse(url), {})
+            return urllib.parse.urlparse(url).hostname
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _get_priority(site: str, origin: str, rank: int) -> float:
+        """Return how soon a new source should be fetched; higher is sooner."""
+        priority = PRIORITY_ORIGINS.get(origin, 0.0)
+        if origin == "search":
+            priority += PRIORITY_RANK / (rank + 1)
+        return priority + PRIORITY_DOMAIN * _get_domain_stats().get_rate(site)
+
+    def _score(
+        self, article: MarkovChain, source_chain: MarkovChain
+    ) -> tuple[float, MarkovChainIntersection]:
+        """Compare a source chain to an article chain of the same degree.
+
+        Return the confidence and the delta chain.
+        """
+        # Every source is intersected exactly, without a cheaper estimate first. A
+        # delta of about 18 shared nodes already reaches INCLUDE_THRESHOLD, whatever
+        # the article's size, and a sample (like a MinHash sketch) can only rule
+        # that out after looking at a third to a half of the article's nodes, which
+        # costs about as much as the intersection itself (well under a millisecond
+        # with numpy, even for a long article and source).
+        delta = MarkovChainIntersection(article, source_chain)
+        return self._calculate_confidence(delta, article), delta
+
+    def compare(
+        self,
+        source: CopyvioSource,
+        source_chain: MarkovChain | None,
+        extra_chains: dict[int, MarkovChain] | None = None,
+    ) -> None:
+        """Compare a source to the article; call _finish_early if necessary.
+
+        *extra_chains* holds the source's chains at any other degrees being scored.
+        Only the main degree counts towards finishing the check.
+        """
+        scores: dict[int, tuple[float, MarkovChainIntersection]] = {}
         if source_chain:
-            delta = MarkovChainIntersection(self._article, source_chain)
-            conf = self._calculate_confidence(delta)
+            conf, delta = self._score(self._article, source_chain)
+            scores[self._degree] = (conf, delta)
+            for degree, article in self._extra_articles.items():
+                if extra_chains and degree in extra_chains:
+                    extra_conf, extra_delta = self._score(article, extra_chains[degree])
+                    scores[degree] = (extra_conf, extra_delta)
         else:
             delta = None
             conf = 0.0
+        phrases = None
+        if self._compact and self._max_phrases and delta is not None and delta.size:
+            phrases = self._article.find_phrases(delta, self._max_phrases)
         self._logger.debug(f"compare(): {source.url} -> {conf}")
+        _get_domain_stats().record(_get_site(source.url), conf >= INCLUDE_THRESHOLD)
         with self._finish_lock:
             if source_chain:
                 assert delta is not None
-                source.update(conf, source_chain, delta)
+                source.update(
+                    conf,
+                    source_chain,
+                    delta,
+                    degree_confidences={
+                        degree: score for degree, (score, _) in scores.items()
+                    },
+                )
+                for degree, (score, chain) in scores.items():
+                    if score >= INCLUDE_THRESHOLD:
+                        # Keep just the delta's nodes, not the chains it came from:
+                        self._included_deltas[degree].append(
+                            MarkovChain._from_table(chain.chain, degree, None)
+                        )
+                if self._compact:
+                    source.compact(phrases)
             source.finish_work()
             if not self.finished and conf >= self._min_confidence:
+                self._verdict_time = time.time() - self._start_time
                 if self._short_circuit:
                     self._finish_early()
                 else:
@@ -530,11 +2135,27 @@ class CopyvioWorkspace:
         self._logger.debug(f"Waiting on {len(self.sources)} sources")
         for source in self.sources:
             source.join(self._until)
+        self._cancel()  # If we ran out of time, don't let sources outlive the check
+        self._scheduler.discard(self)
         with self._finish_lock:
             pass  # Wait for any remaining comparisons to be finished
-        if not _is_globalized:
-            for i in range(self._num_workers):
-                self._queues.unassigned.put((StopIteration, None))
+        if self._owns_scheduler:
+            self._scheduler.stop()
+
+    def _get_unified_confidence(self, degree: int) -> float | None:
+        """Return the confidence of all included sources combined at a degree.
+
+        Return None if no sources were included at that degree.
+        """
+        with self._finish_lock:
+            deltas = list(self._included_deltas[degree])
+        if not deltas:
+            return None
+        # Each delta holds min(article, source) for every node, so capping their sum
+        # at the article gives the same result as using the full sources:
+        article = self._articles[degree]
+        unified = MarkovChainIntersection(article, MarkovChainUnion(deltas))
+        return self._calculate_confidence(unified, article)
 
     def get_result(self, num_queries: int = 0) -> CopyvioCheckResult:
         """Return a CopyvioCheckResult containing the results of this check."""
@@ -543,7 +2164,7 @@ class CopyvioWorkspace:
                 s.confidence,
                 not s.excluded,
                 not s.skipped,
-                s.chains[0].size,
+                s.source_size,
             ),
             reverse=True,
         )
@@ -551,14 +2172,19 @@ class CopyvioWorkspace:
         included_sources = [
             source for source in self.sources if source.confidence >= INCLUDE_THRESHOLD
         ]
-        if included_sources:
-            unified = MarkovChainUnion(source.chains[0] for source in included_sources)
-            delta = MarkovChainIntersection(self._article, unified)
-            unified_confidence = self._calculate_confidence(delta)
-        else:
-            unified_confidence = None
-
-        return CopyvioCheckResult(
+        unified_confidence = self._get_unified_confidence(self._degree)
+
+        degree_confidences: dict[int, float] = {}
+        for degree in self._articles:
+            confidence = self._get_unified_confidence(degree)
+            if confidence is None:
+                confidence = max(
+                    (s.degree_confidences.get(degree, 0.0) for s in self.sources),
+                    default=0.0,
+                )
+            degree_confidences[degree] = confidence
+
+        result = CopyvioCheckResult(
             self.finished,
             self.sources,
             num_queries,
@@ -567,4 +2193,29 @@ class CopyvioWorkspace:
             self.possible_miss,
             included_sources,
             unified_confidence,
+            degree_confidences,
+        )
+        queue_times = [s.queue_time for s in self.sources if s.queue_time is not None]
+        result.metadata.queue_time = sum(queue_times)
+        result.metadata.max_queue_time = max(queue_times, default=0.0)
+        result.metadata.cancelled_sources = self._cancelled_sources
+        # Time spent on each phase, summed over sources (which overlap in time):
+        timings = {"search": self.search_time} if self.search_time else {}
+        for source in self.sources:
+            for phase, seconds in source.timings.items():
+                timings[phase] = timings.get(phase, 0.0) + seconds
+        result.metadata.timings = {
+            phase: timings[phase] for phase in PHASES if phase in timings
+        }
+        result.metadata.bytes_received = sum(s.bytes_received for s in self.sources)
+        result.metadata.bytes_decoded = sum(s.bytes_decoded for s in self.sources)
+        if self.search_time:
+            _get_timing_stats().record({"search": self.search_time})
+        # How long it took to find a violation, or to rule one out:
+        result.metadata.time_to_verdict = (
+            self._verdict_time if self._verdict_time is not None else result.time
         )
+        if self._source_cache is not None:
+            result.metadata.source_cache_hits = self._source_cache_hits
+            result.metadata.source_cache_misses = self._source_cache_misses
+        return result
@@ -20,16 +20,16 @@
 
 from __future__ import annotations
 
-__all__ = ["Page"]
+__all__ = ["Page", "ParseCache"]
 
 import hashlib
 import re
 import time
 import typing
 import urllib.parse
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
 from logging import Logger, NullHandler, getLogger
-from typing import Any
+from typing import Any, TypeVar
 
 import mwparserfromhell
 
@@ -41,6 +41,66 @@ if typing.TYPE_CHECKING:
     from earwigbot.wiki.site import Site
     from earwigbot.wiki.user import User
 
+T = TypeVar("T")
+
+
+class ParseCache:
+    """
+    **EarwigBot: Wiki Toolset: Parse Cache**
+
+    The parsed wikicode of one revision of a page, and results derived from it, so
+    that everything that needs the page parsed can share one parse.
+
+    The tree in :py:attr:`wikicode` is shared, so it must not be modified. Code that
+    needs to modify a tree calls :py:meth:`take` instead, which hands the cached
+    tree over if there is one (parsing it again the next time it is needed), so the
+    shared tree never sees the changes.
+    """
+
+    def __init__(self, text: str, revid: int | None = None) -> None:
+        self.text = text
+        self.revid = revid
+        self._wikicode: mwparserfromhell.wikicode.Wikicode | None = None
+        self._results: dict[str, Any] = {}
+
+    def __repr__(self) -> str:
+        """Return the canonical string representation of the ParseCache."""
+        return f"ParseCache(text={self.text!r}, revid={self.revid!r})"
+
+    def __str__(self) -> str:
+        """Return a nice string representation of the ParseCache."""
+        return f"<ParseCache of revision {self.revid} with size {len(self.text)}>"
+
+    def matches(self, text: str, revid: int | None) -> bool:
+        """Return whether this cache is for the given revision of a page."""
+        return revid == self.revid and (text is self.text or text == self.text)
+
+    @property
+    def wikicode(self) -> mwparserfromhell.wikicode.Wikicode:
+        """The parsed text, which is shared and must not be modified.
+
+        It may be handed over by :py:meth:`take` later, so it shouldn't be kept.
+        """
+        if self._wikicode is None:
+            self._wikicode = mwparserfromhell.parse(self.text)
+        return self._wikicode
+
+    def take(self) -> mwparserfromhell.wikicode.Wikicode:
+        """Return a parsed tree of the text that the caller is free to modify."""
+        if self._wikicode is None:
+            return mwparserfromhell.parse(self.text)
+        wikicode, self._wikicode = self._wikicode, None
+        return wikicode
+
+    def get_result(self, name: str, func: Callable[[], T]) -> T:
+        """Return a result derived from the text, calling *func* if it isn't cached.
+
+        Results are cached by *name*, and shared, so they shouldn't be modified.
+        """
+        if name not in self._results:
+            self._results[name] = func()
+        return self._results[name]
+
 
 class Page:
     """
@@ -63,6 +123,7 @@ class Page:
     - :py:attr:`protection`:  the page's current protection status
     - :py:attr:`is_talkpage`: ``True`` if this is a talkpage, else ``False``
     - :py:attr:`is_redirect`: ``True`` if this is a redirect, else ``False``
+    - :py:attr:`parse_cache`: the parsed content of the page's current revision
 
     *Public methods:*
 
@@ -130,6 +191,7 @@ class Page:
         self._fullurl: str | None = None
         self._content: str | None = None
         self._creator: str | None = None
+        self._parse_cache: ParseCache | None = None
 
         # Attributes used for editing/deleting/protecting/etc:
         self._basetimestamp: str | None = None
@@ -754,16 +816,32 @@ class Page:
             self._assert_existence()
         return self.site.get_user(self._creator)
 
+    @property
+    def parse_cache(self) -> ParseCache:
+        """
+        The parsed content of the page's current revision, and results derived from it.
+
+        This is shared by everything that parses the page, so the content is only
+        parsed once per revision; see :py:class:`ParseCache`. Raises the same
+        exceptions as :py:meth:`get`.
+        """
+        text = self.get()
+        cache = self._parse_cache
+        if not cache or not cache.matches(text, self._lastrevid):
+            cache = self._parse_cache = ParseCache(text, self._lastrevid)
+        return cache
+
     def parse(self) -> mwparserfromhell.wikicode.Wikicode:
         """
         Parse the page content for templates, links, etc.
 
-        Actual parsing is handled by :py:mod:`mwparserfromhell`. Raises
+        Actual parsing is handled by :py:mod:`mwparserfromhell`. Each call returns a
+        new tree, which can be modified freely. Raises
         :py:exc:`~earwigbot.exceptions.InvalidPageError` or
         :py:exc:`~earwigbot.exceptions.PageNotFoundError` if the page name is invalid
         or the page does not exist, respectively.
         """
-        return mwparserfromhell.parse(self.get())
+        return self.parse_cache.take()
 
     def edit(
         self,
@@ -853,7 +931,8 @@ class Page:
         optouts = [optout.lower() for optout in optouts] if optouts else []
 
         r_bots = r"\{\{\s*(no)?bots\s*(\||\}\})"
-        filter = self.parse().ifilter_templates(recursive=True, matches=r_bots)
+        code = self.parse_cache.wikicode
+        filter = code.ifilter_templates(recursive=True, matches=r_bots)
         for template in filter:
             if template.has_param("deny"):
                 denies = parse_param(template, "deny")
@@ -882,6 +961,9 @@ class Page:
         no_links: bool = False,
         short_circuit: bool = True,
         degree: int = DEFAULT_DEGREE,
+        extra_degrees: Iterable[int] = (),
+        compact: bool = False,
+        max_phrases: int = 0,
     ) -> CopyvioCheckResult:
         """
         Check the page for copyright violations.
@@ -912,7 +994,15 @@ class Page:
         and web queries, but setting *short_circuit* to ``False`` will prevent this.
 
         The *degree* controls the n-gram word size used in comparing similarity. It
-        should usually be a number between 3 and 5.
+        should usually be a number between 3 and 5. The page and each source can also
+        be scored at *extra_degrees* without fetching or parsing anything again; the
+        results are reported in the :py:attr:`~.CopyvioCheckResult.degree_confidences`
+        of the result and its sources, but only *degree* decides when to stop.
+
+        Setting *compact* to ``True`` makes the result much smaller by discarding each
+        source's text and Markov chains as soon as its confidence is known; only the
+        chain sizes are kept. In this mode, up to *max_phrases* of the most frequent
+        phrases that each source shares with the article are also kept.
 
         Raises :exc:`.CopyvioCheckError` or subclasses
         (:exc:`.UnknownSearchEngineError`, :exc:`.SearchQueryError`, ...) on errors.
@@ -923,6 +1013,9 @@ class Page:
             min_confidence=min_confidence,
             max_time=max_time,
             degree=degree,
+            extra_degrees=extra_degrees,
+            compact=compact,
+            max_phrases=max_phrases,
             logger=self._logger,
         )
 
@@ -941,6 +1034,9 @@ class Page:
         min_confidence: float = 0.75,
         max_time: float = 30,
         degree: int = DEFAULT_DEGREE,
+        extra_degrees: Iterable[int] = (),
+        compact: bool = False,
+        max_phrases: int = 0,
     ) -> CopyvioCheckResult:
         """
         Check the page, like :py:meth:`copyvio_check`, against specific URLs.
@@ -958,6 +1054,9 @@ class Page:
         source's content) cannot be stored for data retention reasons, so a fresh
         comparison is made using this function.
 
+        The *extra_degrees*, *compact*, and *max_phrases* arguments are the same as
+        in :py:meth:`copyvio_check`.
+
         Since no searching is done, neither :exc:`.UnknownSearchEngineError` nor
         :exc:`.SearchQueryError` will be raised.
         """
@@ -971,6 +1070,9 @@ class Page:
             min_confidence=min_confidence,
             max_time=max_time,
             degree=degree,
+            extra_degrees=extra_degrees,
+            compact=compact,
+            max_phrases=max_phrases,
             logger=self._logger,
         )
 
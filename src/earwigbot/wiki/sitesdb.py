@@ -34,7 +34,9 @@ from platform import python_version
 
 from earwigbot import __version__
 from earwigbot.exceptions import SiteNotFoundError
+from earwigbot.wiki.copyvios.cache import ArticleCache, HTTPCache
 from earwigbot.wiki.copyvios.exclusions import ExclusionsDB
+from earwigbot.wiki.copyvios.parsers import ArticleParser
 from earwigbot.wiki.site import Site, SqlConnInfo
 
 if typing.TYPE_CHECKING:
@@ -83,11 +85,23 @@ class SitesDB:
         self._sitesdb = path.join(bot.config.root_dir, "sites.db")
         self._cookie_file = path.join(bot.config.root_dir, ".cookies")
         self._cookiejar: CookieJar | None = None
+        self._nltk_dir = path.join(bot.config.root_dir, ".nltk")
 
         excl_db = path.join(bot.config.root_dir, "exclusions.db")
         excl_logger = self._logger.getChild("exclusionsdb")
         self._exclusions_db = ExclusionsDB(self, excl_db, excl_logger)
 
+        cache_db = path.join(bot.config.root_dir, "articles.db")
+        cache_logger = self._logger.getChild("articlecache")
+        self._article_cache = ArticleCache(cache_db, cache_logger)
+
+        http_db = path.join(bot.config.root_dir, "sources.db")
+        http_logger = self._logger.getChild("httpcache")
+        max_age = bot.config.wiki.get("search", {}).get(
+            "http_cache_max_age", HTTPCache.DEFAULT_MAX_AGE
+        )
+        self._http_cache = HTTPCache(http_db, http_logger, max_age=max_age)
+
     def __repr__(self) -> str:
         """
         Return the canonical string representation of the SitesDB.
@@ -234,9 +248,12 @@ class SitesDB:
             user_agent = user_agent.replace("$2", python_version())
 
         if search_config:
-            nltk_dir = path.join(self.config.root_dir, ".nltk")
-            search_config["nltk_dir"] = nltk_dir
+            search_config["nltk_dir"] = self._nltk_dir
             search_config["exclusions_db"] = self._exclusions_db
+            if search_config.get("article_cache", True):
+                search_config["article_cache"] = self._article_cache
+            if search_config.get("http_cache", False):
+                search_config["http_cache"] = self._http_cache
 
         sql = info.sql
         if not sql:
@@ -352,6 +369,24 @@ class SitesDB:
                 self._logger.info(f"Removed site '{name}'")
                 return True
 
+    def warm_up_tokenizers(self) -> None:
+        """
+        Load the sentence tokenizers used by copyvio checks ahead of time.
+
+        The languages are given by ``config.wiki["search"]["tokenizer_warmup"]``, a
+        list of site language codes like ``"en"``. This may block for a while,
+        especially if any need to be downloaded.
+        """
+        langs = self.config.wiki.get("search", {}).get("tokenizer_warmup")
+        if not langs:
+            return
+        self._logger.debug(f"Loading sentence tokenizers for {', '.join(langs)}")
+        failed = ArticleParser.warm_up(langs, self._nltk_dir)
+        if failed:
+            self._logger.warning(
+                f"Couldn't load sentence tokenizers for {', '.join(failed)}"
+            )
+
     def get_site(
         self,
         name: str | None = None,
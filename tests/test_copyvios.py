@@ -0,0 +1,1367 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import http.server
+import logging
+import os
+import queue
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import warnings
+import zlib
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from earwigbot.exceptions import ParserExclusionError, ParserRedirectError
+from earwigbot.wiki.copyvios import cache as cache_module
+from earwigbot.wiki.copyvios import parsers, pdfpool, resolver, tokenizers, workers
+from earwigbot.wiki.copyvios.cache import (
+    ArticleCache,
+    CachedArticle,
+    CachedResponse,
+    HTTPCache,
+    SourceCache,
+    get_source_cache,
+    set_source_cache,
+)
+from earwigbot.wiki.copyvios.markov import MarkovChain, MultiDegreeChainBuilder
+from earwigbot.wiki.copyvios.parsers import (
+    ArticleParser,
+    HTMLParser,
+    ParserArgs,
+    PDFParser,
+    PlainTextParser,
+)
+from earwigbot.wiki.copyvios.resolver import DNSCache
+from earwigbot.wiki.copyvios.result import CopyvioSource
+from earwigbot.wiki.copyvios.workers import CopyvioWorkspace
+from earwigbot.wiki.page import Page, ParseCache
+
+
+def _make_text(rng: random.Random, length: int) -> str:
+    return " ".join(f"word{rng.randrange(100000)}" for _ in range(length))
+
+
+def _make_workspace(article: MarkovChain, **kwargs) -> CopyvioWorkspace:
+    return CopyvioWorkspace(
+        article,
+        min_confidence=0.75,
+        max_time=-1,
+        logger=logging.getLogger("earwigbot.test"),
+        headers=[],
+        num_workers=0,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def rng() -> random.Random:
+    return random.Random(1234)
+
+
+@pytest.mark.parametrize("length", [1000, 5000])
+def test_compare_unrelated_source(rng: random.Random, length: int):
+    article = MarkovChain(_make_text(rng, length))
+    workspace = _make_workspace(article)
+
+    source = CopyvioSource(workspace, "https://example.com/unrelated")
+    workspace.compare(source, MarkovChain(_make_text(rng, 20000)))
+    assert source.confidence == 0.0
+    assert not workspace.finished
+
+
+@pytest.mark.parametrize("length", [1000, 5000])
+def test_compare_matching_source(rng: random.Random, length: int):
+    text = _make_text(rng, length)
+    article = MarkovChain(text)
+    workspace = _make_workspace(article)
+
+    source = CopyvioSource(workspace, "https://example.com/copy")
+    workspace.compare(source, MarkovChain(_make_text(rng, 20000) + " " + text))
+    assert source.confidence > 0.75
+    assert source.delta_size >= length
+    assert workspace.finished
+
+
+def _make_page(pageid: int, revid: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        site=SimpleNamespace(name="enwiki"), pageid=pageid, lastrevid=revid
+    )
+
+
+def _make_article(rng: random.Random, length: int) -> CachedArticle:
+    text = _make_text(rng, length)
+    return CachedArticle(
+        text=text, links=["https://example.com/"], chain=MarkovChain(text)
+    )
+
+
+def test_article_cache_roundtrip(rng: random.Random, tmp_path: Path):
+    cache = ArticleCache(str(tmp_path / "articles.db"), logging.getLogger())
+    page = _make_page(1, 100)
+    article = _make_article(rng, 500)
+
+    assert cache.get(page, article.chain.degree) is None
+    cache.put(page, article)
+    cache.set_chunks(page, article.chain.degree, 3, ["a", "b", "c"])
+
+    cached = cache.get(page, article.chain.degree)
+    assert cached is not None
+    assert cached.text == article.text
+    assert cached.links == article.links
+    assert cached.chunks == {3: ["a", "b", "c"]}
+    assert cached.chain.size == article.chain.size
+    assert list(cached.chain.chain.items()) == list(article.chain.chain.items())
+    assert cache.get(page, article.chain.degree + 1) is None
+    assert cache.get(_make_page(1, 101), article.chain.degree) is None
+
+
+def test_article_cache_version(
+    rng: random.Random, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    cache = ArticleCache(str(tmp_path / "articles.db"), logging.getLogger())
+    page = _make_page(1, 100)
+    cache.put(page, _make_article(rng, 50))
+    assert cache.get(page, 5) is not None
+
+    # Entries from another version may have been stripped or chunked differently:
+    monkeypatch.setattr(cache_module, "_FORMAT", cache_module._FORMAT + "+other")
+    assert cache.get(page, 5) is None
+
+
+def test_article_cache_replaces_old_revisions(rng: random.Random, tmp_path: Path):
+    cache = ArticleCache(str(tmp_path / "articles.db"), logging.getLogger())
+    cache.put(_make_page(1, 100), _make_article(rng, 50))
+    cache.put(_make_page(1, 101), _make_article(rng, 50))
+    assert cache.get(_make_page(1, 100), 5) is None
+    assert cache.get(_make_page(1, 101), 5) is not None
+
+
+def test_article_cache_evicts_least_recently_used(rng: random.Random, tmp_path: Path):
+    cache = ArticleCache(
+        str(tmp_path / "articles.db"), logging.getLogger(), max_size=20000
+    )
+    for pageid in range(1, 4):
+        cache.put(_make_page(pageid, 100), _make_article(rng, 400))
+    assert cache.get(_make_page(1, 100), 5) is None
+    assert cache.get(_make_page(2, 100), 5) is not None
+
+    cache.put(_make_page(4, 100), _make_article(rng, 400))
+    assert cache.get(_make_page(2, 100), 5) is not None
+    assert cache.get(_make_page(3, 100), 5) is None
+
+
+def test_http_cache(tmp_path: Path):
+    cache = HTTPCache(str(tmp_path / "sources.db"), logging.getLogger(), max_size=100)
+    response = CachedResponse("some text", '"abc"', None, time.time() - 1800)
+    assert cache.get("https://example.com/") is None
+    cache.put("https://example.com/", response)
+    assert cache.get("https://example.com/") == response
+    assert cache.get("https://example.com/", "hint") is None
+    assert cache.is_fresh(response)
+    assert response.validators == {"If-None-Match": '"abc"'}
+
+    cache.refresh("https://example.com/")
+    refreshed = cache.get("https://example.com/")
+    assert refreshed is not None and refreshed.fetched > response.fetched
+
+    cache.put("https://example.org/", CachedResponse("x" * 80, None, None, time.time()))
+    assert cache.get("https://example.com/") is None
+    assert cache.get("https://example.org/") is not None
+
+
+def test_http_cache_expiry(tmp_path: Path):
+    dbfile = str(tmp_path / "sources.db")
+    cache = HTTPCache(dbfile, logging.getLogger())
+    old = CachedResponse("old", None, None, time.time() - 7200)
+    cache.put("https://example.com/old", old)
+    assert cache.get("https://example.com/old") is None
+
+    now = time.time()
+    cache.put("https://example.com/a", CachedResponse("a", None, None, now - 60))
+    cache.put("https://example.com/b", CachedResponse("b", None, None, now - 60))
+    cache._max_age = 30  # Both expire; the next write deletes them
+    cache.put("https://example.com/c", CachedResponse("c", None, None, now))
+    with sqlite3.connect(dbfile) as conn:
+        rows = conn.execute("SELECT response_url FROM responses").fetchall()
+    assert rows == [("https://example.com/c",)]
+
+    cache = HTTPCache(dbfile, logging.getLogger(), max_age=-60)
+    assert cache.get("https://example.com/missing") is None
+    with sqlite3.connect(dbfile) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM responses").fetchone() == (0,)
+
+
+@pytest.fixture
+def source_cache():
+    old = get_source_cache()
+    cache = SourceCache()
+    set_source_cache(cache)
+    yield cache
+    set_source_cache(old)
+
+
+def test_source_cache_lru(rng: random.Random):
+    chains = [{5: MarkovChain(_make_text(rng, 200))} for _ in range(3)]
+    cache = SourceCache()
+    cache.put("a", "https://example.com/a", chains[0])
+    cache = SourceCache(max_size=cache.size * 5 // 2)
+    cache.put("a", "https://example.com/a", chains[0])
+    cache.put("b", "https://example.com/b", chains[1])
+    assert cache.get("a") is not None
+    cache.put("c", "https://example.com/c", chains[2])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert len(cache) == 2
+
+
+def test_source_cache_ttl(rng: random.Random, monkeypatch: pytest.MonkeyPatch):
+    cache = SourceCache(ttl=60)
+    cache.put("a", "https://example.com/a", {5: MarkovChain(_make_text(rng, 50))})
+    assert cache.get("a") is not None
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_source_cache_size(rng: random.Random):
+    text = _make_text(rng, 200)
+    builder = MultiDegreeChainBuilder([3, 5], keep_text=True)
+    builder.feed(text)
+    built = builder.build()
+    assert built[3].text is built[5].text
+
+    cache = SourceCache()
+    cache.put("a", "https://example.com/a", built)
+    nbytes = built[3].chain.nbytes + built[5].chain.nbytes
+    assert cache.size == nbytes + sys.getsizeof(built[5].text)
+    entry = cache.get("a")
+    assert entry is not None and set(entry.chains) == {3, 5}
+
+
+def test_enqueue_resolves_cached_sources(rng: random.Random, source_cache: SourceCache):
+    text = _make_text(rng, 300)
+    url = "https://example.com/copy"
+    workspace = _make_workspace(
+        MarkovChain(text), short_circuit=False, use_source_cache=True
+    )
+    workspace.cache_source(url, url + "/final", {5: MarkovChain(text)})
+
+    workspace.enqueue([url, "https://example.com/other"])
+    result = workspace.get_result()
+    assert result.sources[0].url == url + "/final"
+    assert result.sources[0].confidence > 0.75
+    assert result.metadata.source_cache_hits == 1
+    assert result.metadata.source_cache_misses == 1
+
+
+def test_compact_mode(rng: random.Random):
+    text = _make_text(rng, 300)
+    article = MarkovChain(text)
+    sources = [
+        MarkovChain(_make_text(rng, 100) + " " + text[: len(text) // 2]),
+        MarkovChain(text[len(text) // 3 :] + " " + _make_text(rng, 100)),
+    ]
+
+    results = []
+    for compact in (False, True):
+        workspace = _make_workspace(
+            article, short_circuit=False, compact=compact, max_phrases=2
+        )
+        for i, chain in enumerate(sources):
+            source = CopyvioSource(workspace, f"https://example.com/{i}")
+            workspace.sources.append(source)
+            workspace.compare(source, chain)
+        results.append(workspace.get_result())
+
+    full, compact = results
+    assert compact.unified_confidence == full.unified_confidence
+    for src1, src2 in zip(full.sources, compact.sources):
+        assert src1.confidence == src2.confidence
+        assert src1.source_size == src2.source_size == src1.chains[0].size
+        assert src1.delta_size == src2.delta_size == src1.chains[1].size
+        assert src1.phrases == []
+        assert len(src2.phrases) == 2
+        assert src2.chains[0].size < src2.source_size
+
+
+def test_extra_degrees(rng: random.Random):
+    text = _make_text(rng, 300)
+    articles = {degree: MarkovChain(text, degree) for degree in (3, 5)}
+    workspace = _make_workspace(
+        articles[5], short_circuit=False, degree=5, extra_articles=articles
+    )
+    copied = text[: len(text) // 2] + " " + _make_text(rng, 100)
+    for i, source_text in enumerate([copied, _make_text(rng, 200)]):
+        source = CopyvioSource(workspace, f"https://example.com/{i}")
+        workspace.sources.append(source)
+        chains = {degree: MarkovChain(source_text, degree) for degree in (3, 5)}
+        workspace.compare(source, chains[5], chains)
+    result = workspace.get_result()
+
+    single = _make_workspace(articles[3], degree=3)
+    expected = CopyvioSource(single, "https://example.com/0")
+    single.compare(expected, MarkovChain(copied, 3))
+
+    assert result.degree_confidences[5] == result.confidence
+    assert result.degree_confidences[3] == expected.confidence
+    best, other = result.sources
+    assert best.degree_confidences == {
+        3: expected.confidence,
+        5: best.confidence,
+    }
+    assert other.degree_confidences[3] < 0.15
+
+
+def test_parse_pool(rng: random.Random):
+    pytest.importorskip("bs4")
+    text = _make_text(rng, 500)
+    job: workers._ParseJob = (
+        text.encode(),
+        PlainTextParser,
+        "https://example.com/",
+        {},
+        [3, 5],
+        True,
+    )
+    local = workers._parse_source(*job)
+    assert local.chains is not None
+
+    workers.start_parse_pool(1)
+    try:
+        assert workers._parse_pool is not None
+        logger = logging.getLogger("earwigbot.test")
+        remote = workers._parse_in_pool(workers._parse_pool, job, logger)
+    finally:
+        workers.stop_parse_pool()
+
+    assert remote is not None and remote.chains is not None
+    assert remote.redirect is None
+    for degree, chain in local.chains.items():
+        assert remote.chains[degree].text == text
+        assert remote.chains[degree].chain.hashes == chain.chain.hashes
+        assert remote.chains[degree].chain.counts == chain.chain.counts
+
+
+class _HangingParser(PlainTextParser):
+    def iter_parse(self) -> Iterator[str]:
+        if self.text == b"hang":
+            time.sleep(60)
+        yield from super().iter_parse()
+
+
+def test_parse_pool_timeout():
+    def make_job(content: bytes) -> workers._ParseJob:
+        return (content, _HangingParser, "https://example.com/", {}, [5], True)
+
+    logger = logging.getLogger("earwigbot.test")
+    pool = workers._ParsePool(1, timeout=2)
+    try:
+        start = time.monotonic()
+        assert workers._parse_in_pool(pool, make_job(b"hang"), logger) is None
+        parsed = workers._parse_in_pool(pool, make_job(b"one two three"), logger)
+        assert parsed is not None and parsed.chains is not None
+        assert parsed.chains[5].text == "one two three"
+        assert time.monotonic() - start < 10
+
+        token = workers._CancellationToken()
+        threading.Timer(0.5, token.cancel).start()
+        start = time.monotonic()
+        with pytest.raises(workers._SourceCancelledError):
+            workers._parse_in_pool(pool, make_job(b"hang"), logger, token)
+        assert time.monotonic() - start < 1.5
+        assert not pool._idle
+    finally:
+        pool.close()
+
+
+class _SourceHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    text = b"the quick brown fox jumps over the lazy dog " * 50
+    etag_requests: list[str | None] = []
+    clients: list[tuple[str, int]] = []
+
+    def do_GET(self) -> None:
+        self.clients.append(self.client_address)
+        headers = {"Content-Type": "text/plain"}
+        body = self.text
+        if self.path == "/etag":
+            validator = self.headers.get("If-None-Match")
+            self.etag_requests.append(validator)
+            if validator == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            headers["ETag"] = '"v1"'
+        elif self.path == "/gzip":
+            headers["Content-Encoding"] = "gzip"
+            body = gzip.compress(body)
+        elif self.path == "/bomb":
+            headers["Content-Encoding"] = "gzip"
+            body = gzip.compress(b" " * 3 * 1024**2)
+        elif self.path == "/slow":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                for char in body[:200]:
+                    self.wfile.write(bytes([char]))
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                pass
+            return
+        elif self.path == "/huge":
+            headers["Content-Length"] = str(3 * 1024**2)
+        elif self.path != "/plain":
+            self.send_error(404)
+            return
+        headers.setdefault("Content-Length", str(len(body)))
+        self.send_response(200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def source_server() -> Iterator[str]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SourceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_async_fetcher(source_server: str):
+    pytest.importorskip("aiohttp")
+    from earwigbot.wiki.copyvios.fetcher import AsyncFetcher
+
+    config = {"proxies": [{"netloc": "mirror.example.com", "target": source_server}]}
+    fetcher = AsyncFetcher(num_threads=1)
+    try:
+
+        def fetch(url: str):
+            return fetcher._open_url_blocking(url, [], config, timeout=5)
+
+        plain = fetch(source_server + "/plain")
+        assert plain is not None
+        assert plain.content == _SourceHandler.text
+        assert plain.parser_class is PlainTextParser
+        compressed = fetch(source_server + "/gzip")
+        assert compressed is not None
+        assert compressed.content == _SourceHandler.text
+        assert fetch("http://mirror.example.com/plain") == plain
+        assert fetch(source_server + "/huge") is None
+        assert fetch(source_server + "/missing") is None
+    finally:
+        fetcher.close()
+
+
+def test_worker_streams_content(source_server: str):
+    worker = workers._CopyvioWorker("test", workers._SourceScheduler(), None)
+    plain = worker._open_url_raw(source_server + "/plain")
+    assert plain is not None
+    assert plain.content == _SourceHandler.text
+    assert worker._open_url_raw(source_server + "/gzip") == plain
+    assert worker._open_url_raw(source_server + "/bomb") is None
+
+
+def test_worker_http_cache(source_server: str, tmp_path: Path):
+    cache = HTTPCache(str(tmp_path / "sources.db"), logging.getLogger())
+    config = {"http_cache": cache}
+    workspace = _make_workspace(MarkovChain(""), compact=True, revalidate=True)
+    worker = workers._CopyvioWorker("test", workers._SourceScheduler(), None)
+    _SourceHandler.etag_requests.clear()
+
+    def open_source() -> dict[int, MarkovChain] | None:
+        source = CopyvioSource(workspace, source_server + "/etag", search_config=config)
+        return worker._open_url(source)
+
+    first = open_source()
+    second = open_source()
+    assert _SourceHandler.etag_requests == [None, '"v1"']
+    assert first is not None and second is not None
+    assert first[5].text is None
+    assert second[5].chain.hashes == first[5].chain.hashes
+    cached = cache.get(source_server + "/etag")
+    assert cached is not None
+    assert cached.text == _SourceHandler.text.decode().strip()
+    assert cached.etag == '"v1"'
+
+    workspace._revalidate = False
+    assert open_source() is not None
+    assert len(_SourceHandler.etag_requests) == 2
+
+
+@pytest.mark.parametrize(
+    "encoding,compress",
+    [
+        (None, lambda data: data),
+        ("gzip", gzip.compress),
+        ("x-gzip", gzip.compress),
+        ("deflate", zlib.compress),
+        ("deflate", lambda data: zlib.compress(data, wbits=-zlib.MAX_WBITS)),
+    ],
+)
+def test_content_decoder(encoding: str | None, compress: Callable[[bytes], bytes]):
+    data = b"the quick brown fox jumps over the lazy dog " * 5000
+    raw = compress(data)
+    decoder = workers._ContentDecoder(encoding, PlainTextParser)
+    for i in range(0, len(raw), 7):
+        assert decoder.feed(raw[i : i + 7])
+    opened = decoder.finish()
+    assert opened is not None
+    assert opened.content == data
+    assert opened.parser_class is PlainTextParser
+
+
+def test_content_decoder_limits():
+    bomb = gzip.compress(b" " * (2 * 1024**2 + 1))
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    assert not decoder.feed(bomb)
+
+    # PDFs are allowed to be larger:
+    decoder = workers._ContentDecoder("gzip", PDFParser)
+    assert decoder.feed(bomb)
+    assert decoder.finish() is not None
+
+    truncated = gzip.compress(b"some text" * 100)[:-10]
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    assert decoder.feed(truncated)
+    assert decoder.finish() is None
+
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    assert not decoder.feed(b"not compressed")
+    assert not workers._ContentDecoder("compress", PlainTextParser).feed(b"")
+    assert not workers._ContentDecoder("gzip, br", PlainTextParser).feed(b"")
+
+
+def test_content_decoder_gzip_members():
+    first = b"the quick brown fox " * 1000
+    second = b"jumps over the lazy dog " * 1000
+    raw = gzip.compress(first) + gzip.compress(second) + b"\x00" * 4
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    for i in range(0, len(raw), 7):
+        assert decoder.feed(raw[i : i + 7])
+    opened = decoder.finish()
+    assert opened is not None
+    assert opened.content == first + second
+
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    assert decoder.feed(gzip.compress(first) + gzip.compress(second)[:-10])
+    assert decoder.finish() is None
+
+    # The size limit covers every member together:
+    member = gzip.compress(b" " * 1024**2)
+    decoder = workers._ContentDecoder("gzip", PlainTextParser)
+    assert not decoder.feed(member * 3)
+
+
+def test_content_decoder_brotli():
+    brotli = pytest.importorskip("brotli")
+    data = b"the quick brown fox jumps over the lazy dog " * 5000
+    decoder = workers._ContentDecoder("br", PlainTextParser)
+    assert decoder.feed(brotli.compress(data))
+    opened = decoder.finish()
+    assert opened is not None and opened.content == data
+    assert workers._get_accept_encoding() == "gzip, deflate, br"
+
+
+def test_async_fetcher_workspace(source_server: str, monkeypatch: pytest.MonkeyPatch):
+    pytest.importorskip("aiohttp")
+    from earwigbot.wiki.copyvios import fetcher as fetcher_module
+
+    monkeypatch.setattr(fetcher_module, "_fetcher", None)
+    article = MarkovChain(_SourceHandler.text.decode())
+    workspace = _make_workspace(article, short_circuit=False, fetcher="asyncio")
+    try:
+        workspace.enqueue([source_server + "/plain", source_server + "/missing"])
+        workspace.wait()
+    finally:
+        fetcher_module.stop_async_fetcher()
+
+    result = workspace.get_result()
+    assert [source.url for source in result.sources] == [
+        source_server + "/plain",
+        source_server + "/missing",
+    ]
+    assert result.sources[0].confidence > 0.75
+    assert result.sources[1].confidence == 0
+
+
+@pytest.mark.parametrize("fetcher", ["urllib", "asyncio"])
+def test_cancel_in_flight_source(
+    source_server: str, fetcher: str, monkeypatch: pytest.MonkeyPatch
+):
+    if fetcher == "asyncio":
+        pytest.importorskip("aiohttp")
+        from earwigbot.wiki.copyvios import fetcher as fetcher_module
+
+        monkeypatch.setattr(fetcher_module, "_fetcher", None)
+    workspace = _make_workspace(MarkovChain(""), fetcher=fetcher)
+    if fetcher == "urllib":
+        workers._CopyvioWorker("test", workspace._scheduler).start()
+    try:
+        workspace.enqueue([source_server + "/slow"])
+        (source,) = workspace.sources
+        deadline = time.monotonic() + 5
+        while not source.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        workspace._finish_early()
+        workspace.wait()
+        assert time.monotonic() - start < 1
+    finally:
+        if fetcher == "asyncio":
+            fetcher_module.stop_async_fetcher()
+
+    assert source.skipped
+    assert workspace.get_result().metadata.cancelled_sources == 1
+
+
+def _make_check(urls: list[tuple[str, str]]) -> list[tuple[CopyvioSource, str]]:
+    workspace = _make_workspace(MarkovChain(""))
+    return [(CopyvioSource(workspace, url), site) for url, site in urls]
+
+
+def test_scheduler_round_robin():
+    scheduler = workers._SourceScheduler()
+    busy = _make_check([(f"https://news.example/{i}", "news") for i in range(3)])
+    quiet = _make_check([("https://blog.example/", "blog")])
+    with scheduler.lock:
+        for source, site in busy + quiet:
+            scheduler.put(source, site)
+
+    first = scheduler.get()
+    second = scheduler.get()
+    assert first.source is busy[0][0]
+    assert second.source is quiet[0][0]
+    assert first.source.queue_time is not None
+
+    # The busy check's site is still being fetched, so nothing else is ready yet:
+    with pytest.raises(queue.Empty):
+        scheduler.get(until=time.time() + 0.05)
+    scheduler.release(first)
+    assert scheduler.get().source is busy[1][0]
+
+
+def test_scheduler_priority():
+    scheduler = workers._SourceScheduler(max_per_site=2)
+    check = _make_check(
+        [
+            ("https://news.example/0", "news"),
+            ("https://news.example/1", "news"),
+            ("https://blog.example/", "blog"),
+        ]
+    )
+    for (source, _), priority in zip(check, [1.0, 5.0, 3.0]):
+        source.priority = priority
+    with scheduler.lock:
+        for source, site in check:
+            scheduler.put(source, site)
+
+    items, _ = scheduler.get_ready()
+    assert [item.source for item in items] == [check[1][0], check[2][0], check[0][0]]
+
+
+def test_get_site():
+    pytest.importorskip("tldextract")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        assert workers._get_site("https://news.example.co.uk/a") == "example.co.uk"
+        assert workers._get_site("http://127.0.0.1:8000/") == "127.0.0.1:8000"
+
+
+def test_enqueue_priority(monkeypatch: pytest.MonkeyPatch):
+    stats = workers._DomainStats()
+    monkeypatch.setattr(workers, "_domain_stats", stats)
+    for _ in range(8):
+        stats.record("trusted.example", True)
+
+    workspace = _make_workspace(MarkovChain(""), short_circuit=False)
+    workspace.enqueue(["https://a.example/", "https://b.example/"])
+    workspace.enqueue(["https://c.example/"], origin="link")
+    workspace.enqueue(["https://trusted.example/", "https://b.example/"])
+    first, second, link, trusted = workspace.sources
+    assert len(workspace.sources) == 4
+    assert first.priority > link.priority
+    assert second.priority > first.priority  # Returned by two queries
+    assert trusted.priority > first.priority  # Its site has had matches before
+    assert workspace.get_result().metadata.time_to_verdict >= 0
+
+
+def test_scheduler_site_interval():
+    scheduler = workers._SourceScheduler(max_per_site=2, site_interval=0.1)
+    check = _make_check([(f"https://news.example/{i}", "news") for i in range(2)])
+    with scheduler.lock:
+        for source, site in check:
+            scheduler.put(source, site)
+
+    scheduler.get()
+    items, delay = scheduler.get_ready()
+    assert items == []
+    assert delay is not None and 0 < delay <= 0.1
+    start = time.monotonic()
+    assert scheduler.get().source is check[1][0]
+    assert time.monotonic() - start >= delay * 0.9
+
+
+def test_scheduler_count():
+    scheduler = workers._SourceScheduler()
+    check = _make_check(
+        [
+            ("https://news.example/0", "news"),
+            ("https://news.example/1", "news"),
+            ("https://blog.example/", "blog"),
+        ]
+    )
+    with scheduler.lock:
+        for source, site in check:
+            scheduler.put(source, site)
+    assert scheduler.count() == (3, 2)
+    scheduler.get()
+    assert scheduler.count() == (2, 1)
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_worker_pool_autoscales(source_server: str, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(workers._WorkerPool, "_INTERVAL", 0.02)
+    monkeypatch.setattr(workers._WorkerPool, "_MIN_IDLE_TIME", 0.2)
+    pool = workers._WorkerPool(1, 3)
+    scheduler = pool.scheduler
+    pool.start()
+    try:
+        workspace = _make_workspace(MarkovChain(""))
+        with scheduler.lock:
+            for i in range(4):
+                source = CopyvioSource(workspace, source_server + "/slow")
+                workspace.sources.append(source)
+                scheduler.put(source, f"site{i}")
+
+        _wait_for(lambda: pool.get_stats().busy == 3)
+        stats = pool.get_stats()
+        assert (stats.workers, stats.queued, stats.ready) == (3, 1, 1)
+
+        workspace._cancel()
+        _wait_for(lambda: pool.get_stats().workers == 1)
+        stats = pool.get_stats()
+        assert (stats.busy, stats.queued) == (0, 0)
+        assert stats.fetch_latency > 0
+    finally:
+        pool.stop()
+
+
+def test_scheduler_stop():
+    scheduler = workers._SourceScheduler()
+    scheduler.stop()
+    with pytest.raises(StopIteration):
+        scheduler.get()
+
+
+def test_worker_keeps_connections_alive(source_server: str):
+    worker = workers._CopyvioWorker("test", workers._SourceScheduler())
+    _SourceHandler.clients.clear()
+    try:
+        for path in ["/plain", "/gzip", "/missing", "/plain"]:
+            worker._open_url_raw(source_server + path)
+    finally:
+        for handler in worker._handlers:
+            handler.close()
+    # The 404 response was left unread, so only that connection was replaced:
+    assert len(_SourceHandler.clients) == 4
+    assert len(set(_SourceHandler.clients)) == 2
+
+
+def test_local_pool_isolates_checks(
+    source_server: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(workers, "_local_pool", None)
+    monkeypatch.setattr(workers._WorkerPool, "_MIN_IDLE_TIME", 0.2)
+    one = _make_workspace(MarkovChain(""))
+    one._num_workers = 1
+    two = _make_workspace(MarkovChain(""))
+    two._num_workers = 2
+    pool = workers._get_local_pool()
+    try:
+        assert workers._get_local_pool() is pool
+        with pool.scheduler.lock:
+            for workspace in (one, two):
+                for i in range(3):
+                    source = CopyvioSource(workspace, source_server + "/slow")
+                    workspace.sources.append(source)
+                    pool.scheduler.put(source, f"site{i}")
+
+        # Each check gets as many workers as it asked for, even for the same site:
+        _wait_for(lambda: pool.get_stats().busy == 3)
+        assert pool.scheduler.count() == (3, 0)
+        two._cancel()
+        pool.scheduler.discard(two)
+        assert pool.scheduler.count() == (2, 0)
+        one._cancel()
+        _wait_for(lambda: pool.get_stats().workers == 0)
+    finally:
+        pool.stop()
+
+
+def test_local_pool_grows_with_checks(
+    source_server: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(workers, "_local_pool", None)
+    monkeypatch.setattr(workers._WorkerPool, "_INTERVAL", 0.02)
+    monkeypatch.setattr(workers._WorkerPool, "_MIN_IDLE_TIME", 0.2)
+    checks = [_make_workspace(MarkovChain("")) for _ in range(12)]
+    pool = workers._get_local_pool()
+    try:
+        with pool.scheduler.lock:
+            for workspace in checks:
+                workspace._num_workers = 2
+                for i in range(3):
+                    source = CopyvioSource(workspace, source_server + "/slow")
+                    workspace.sources.append(source)
+                    pool.scheduler.put(source, f"site{i}")
+
+        # No check waits on threads held by the others:
+        _wait_for(lambda: pool.get_stats().busy == 24)
+        stats = pool.get_stats()
+        assert (stats.workers, stats.max_workers, stats.queued) == (24, 24, 12)
+
+        for workspace in checks:
+            workspace._cancel()
+            pool.scheduler.discard(workspace)
+        _wait_for(lambda: pool.get_stats().workers == 0)
+        assert pool.get_stats().max_workers == 0
+    finally:
+        pool.stop()
+
+
+@pytest.fixture
+def fake_dns(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Make source.test resolve to localhost, and record lookups of test hosts."""
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def fake_getaddrinfo(host: str, *args, **kwargs):
+        if host.endswith(".test") or host.endswith(".invalid"):
+            lookups.append(host)
+            if host != "source.test":
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            host = "127.0.0.1"
+        return getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    monkeypatch.setattr(resolver, "_dns_cache", DNSCache())
+    return lookups
+
+
+def test_dns_cache(fake_dns: list[str]):
+    dns = DNSCache(ttl=0.2)
+    assert dns.get("source.test", 80) is None
+    assert [info[4] for info in dns.resolve("source.test", 80)] == [("127.0.0.1", 80)]
+    assert [info[4] for info in dns.get("source.test", 443)] == [("127.0.0.1", 443)]
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            dns.resolve("nowhere.invalid", 80)
+    assert fake_dns == ["source.test", "nowhere.invalid"]
+
+    time.sleep(0.2)
+    assert dns.get("source.test", 80) is None
+    dns.resolve("source.test", 80)
+    assert fake_dns.count("source.test") == 2
+
+
+def test_enqueue_prefetches_hosts(source_server: str, fake_dns: list[str]):
+    dns = resolver.get_dns_cache()
+    assert dns is not None
+    url = source_server.replace("127.0.0.1", "source.test") + "/plain"
+    workspace = _make_workspace(MarkovChain(""))
+    workspace.enqueue([url])
+    _wait_for(lambda: dns.get("source.test", 80) is not None)
+
+    worker = workers._CopyvioWorker("test", workspace._scheduler)
+    opened = worker._open_url_raw(url)
+    assert opened is not None
+    assert opened.content == _SourceHandler.text
+    assert fake_dns == ["source.test"]
+
+
+def test_async_fetcher_dns_cache(source_server: str, fake_dns: list[str]):
+    pytest.importorskip("aiohttp")
+    from earwigbot.wiki.copyvios.fetcher import AsyncFetcher
+
+    url = source_server.replace("127.0.0.1", "source.test") + "/plain"
+    fetcher = AsyncFetcher(num_threads=1)
+    try:
+        for _ in range(2):
+            opened = fetcher._open_url_blocking(url, [], None, timeout=5)
+            assert opened is not None
+            assert opened.content == _SourceHandler.text
+    finally:
+        fetcher.close()
+    assert fake_dns == ["source.test"]
+
+
+def test_source_timings(source_server: str, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(workers, "_timing_stats", None)
+    workspace = _make_workspace(MarkovChain(_SourceHandler.text.decode()))
+    worker = workers._CopyvioWorker("test", workers._SourceScheduler())
+    source = CopyvioSource(workspace, source_server + "/gzip")
+    workspace.sources.append(source)
+    chains = worker._open_url(source)
+    workers._compare_source(source, source.url, chains)
+
+    assert list(source.timings) == [
+        "dns",
+        "connect",
+        "download",
+        "decode",
+        "parse",
+        "chain",
+        "compare",
+    ]
+    assert all(seconds >= 0 for seconds in source.timings.values())
+    assert source.bytes_decoded == len(_SourceHandler.text)
+    assert 0 < source.bytes_received < source.bytes_decoded
+
+    workspace.search_time = 1.5
+    result = workspace.get_result(1)
+    assert list(result.metadata.timings)[0] == "search"
+    assert result.metadata.bytes_received == source.bytes_received
+    assert "most time in search 1.50s" in result.get_log_message("Foo")
+
+    stats = workers.get_timing_stats()
+    assert stats["search"] == workers.TimingStats(1, 1.5, 1.5, 1.5, 1.5)
+    assert stats["parse"].count == 1
+
+
+def test_timing_stats():
+    stats = workers._TimingStats(max_samples=100)
+    for i in range(150):
+        stats.record({"download": float(i)})
+    download = stats.get_stats()["download"]
+    assert download.count == 100
+    assert (download.p50, download.p90, download.p99) == (99.0, 139.0, 148.0)
+    assert download.mean == 99.5
+
+
+CORPUS_DIR = Path(__file__).parent.parent / "benchmarks" / "corpus"
+HTML_SAMPLES = [
+    b"<html><body><p>Hello, <b>world</b>!</p><p>Second\nline</p></body></html>",
+    b"<body>before<!-- a comment -->after<script>var x;</script>tail</body>",
+    b"<body><template>hidden</template><ruby>text<rp>(</rp><rt>gloss</rt></ruby>",
+    b"<body><p>unclosed<div>nested <span>tags</div> &amp; entities &eacute;</body>",
+    "<meta charset='utf-8'><body><p>café — naïve</p>".encode(),
+    "<body><p>été</p></body>".encode("latin-1"),
+    b"<html><head><title>No body</title></head></html>",
+    b"",
+    *(path.read_bytes() for path in sorted(CORPUS_DIR.glob("*.html"))),
+]
+
+
+def _parse_html(data: bytes, url: str = "http://example.com/", **args) -> str:
+    parser = HTMLParser(data, url, args or None)
+    parser.use_lxml = True
+    return parser.parse()
+
+
+@pytest.mark.parametrize("data", HTML_SAMPLES)
+def test_html_parser_lxml(data: bytes):
+    pytest.importorskip("lxml")
+    expected = HTMLParser(data, "http://example.com/")
+    expected.use_lxml = False
+    assert _parse_html(data) == expected.parse()
+
+
+def test_html_parser_lxml_special_cases():
+    pytest.importorskip("lxml")
+    mirror = b'<head><link href="http://mirror.example/x"></head><body>text</body>'
+    with pytest.raises(ParserExclusionError):
+        _parse_html(mirror, mirror_hints=["mirror.example"])
+    assert _parse_html(mirror, mirror_hints=["elsewhere.example"]) == "text"
+
+    archived = (
+        b'<body><div><iframe id="playback" src="https://web.archive.org/x.pdf">'
+        b"</iframe></div></body>"
+    )
+    url = "https://web.archive.org/web/2024/http://example.com/x.pdf"
+    with pytest.raises(ParserRedirectError) as exc:
+        _parse_html(archived, url)
+    assert exc.value.url == "https://web.archive.org/x.pdf"
+
+
+MIRROR_HINTS = ["en.wikipedia.org/w/index.php", "en.wikipedia.org/wiki/Foo"]
+
+
+@pytest.mark.parametrize(
+    "data,excluded",
+    [
+        (b'<body><a href="https://en.wikipedia.org/wiki/Foo">x</a></body>', True),
+        (b"<body><a title=x HREF = 'http://en.wikipedia.org/wiki/Foo_'></a>", True),
+        (b"<body><img src=//en.wikipedia.org/w/index.php?title=Foo></body>", True),
+        (b"<head><link href='//en.wikipedia.org/wiki/Foo'></head>", True),
+        (b"<body><p>Copied from en.wikipedia.org/wiki/Foo</p></body>", False),
+        (b'<body><a title="en.wikipedia.org/wiki/Foo" href="/">x</a></body>', False),
+        (b'<body><a data-src="en.wikipedia.org/wiki/Foo">x</a></body>', False),
+        ('<body><a href="//en.wikipedia.org/wiki/Foo">'.encode("utf-16"), True),
+        (b'<a title="a>b" href="//en.wikipedia.org/wiki/Foo">x</a>', True),
+        (b"<a title='a>b' href='//en.wikipedia.org/wiki/Foo'>x</a>", True),
+        (b'<a title="a>b" href="/">en.wikipedia.org/wiki/Foo</a>', False),
+        (b'<body><!-- <a href="//en.wikipedia.org/wiki/Foo"> --></body>', False),
+        (b"<script>s = '<a href=\"//en.wikipedia.org/wiki/Foo\">';</script>", False),
+        (b'<style>a[href="//en.wikipedia.org/wiki/Foo"] {}</style><p>x</p>', False),
+        (b'<!-- x --><a href="//en.wikipedia.org/wiki/Foo">x</a>', True),
+        (b'<script></script><a href="//en.wikipedia.org/wiki/Foo">x</a>', True),
+        (b'<a href="https://en.wikipedia&#46;org/wiki/Foo">x</a>', True),
+        (b'<a href="https://en&period;wikipedia.org/wiki/Foo">x</a>', True),
+        (b'<a href="/?a=1&amp;b=en.wikipedia.org/wiki/Foo">x</a>', True),
+    ],
+)
+@pytest.mark.parametrize("use_lxml", [True, False])
+def test_html_parser_mirror_hints(data: bytes, excluded: bool, use_lxml: bool):
+    if use_lxml:
+        pytest.importorskip("lxml")
+    parser = HTMLParser(data, "http://example.com/", {"mirror_hints": MIRROR_HINTS})
+    parser.use_lxml = use_lxml
+    if excluded:
+        with pytest.raises(ParserExclusionError):
+            parser.parse()
+    else:
+        parser.parse()
+
+
+@pytest.mark.parametrize(
+    "data,scanned",
+    [
+        (b"<p>Copied from en.wikipedia.org/wiki/Foo</p>", True),
+        (b'<a href="/">x</a> en.wikipedia.org/wiki/Foo', True),
+        (b'<a href="/">en.wikipedia.org/wiki/Foo</a>', False),
+        (b'<a title="a>b" href="//en.wikipedia.org/wiki/Foo">', False),
+        (b'<!-- <a href="//en.wikipedia.org/wiki/Foo"> -->', False),
+        (b"<SCRIPT>'<a href=\"//en.wikipedia.org/wiki/Foo\">'</SCRIPT>", False),
+        (b'<a href="https://en.wikipedia&#46;org/wiki/Foo">x</a>', False),
+        (b'<a href="/?a=1&amp;b=2">Caf&eacute;</a>', True),
+    ],
+)
+def test_html_parser_mirror_scan_unclear(data: bytes, scanned: bool):
+    parser = HTMLParser(data, "http://example.com/", {"mirror_hints": MIRROR_HINTS})
+    assert parser._scan_for_mirror() is scanned
+
+
+def test_mirror_hint_pattern():
+    pattern = parsers._compile_mirror_hints(("ab.c", "ab", "abd", "x", ""))
+    assert pattern is parsers._compile_mirror_hints(("ab.c", "ab", "abd", "x", ""))
+    assert pattern is not None
+    assert pattern.pattern == rb"(?:ab(?:\.c|d)?|x)"
+    assert [m.group() for m in pattern.finditer(b"abc ab.c xabd")] == [
+        b"ab",
+        b"ab.c",
+        b"x",
+        b"abd",
+    ]
+    assert parsers._compile_mirror_hints(()) is None
+
+
+@pytest.fixture
+def pdf_pool() -> Iterator[Callable[..., pdfpool.PDFPool]]:
+    """Swap in PDF pools with custom limits, restoring the default afterwards."""
+    original = pdfpool.get_pdf_pool()
+    pools: list[pdfpool.PDFPool] = []
+
+    def make(**kwargs) -> pdfpool.PDFPool:
+        pool = pdfpool.PDFPool(num_processes=1, **kwargs)
+        pools.append(pool)
+        pdfpool._pdf_pool = pool
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+    pdfpool._pdf_pool = original
+
+
+def test_pdf_pool(pdf_pool: Callable[..., pdfpool.PDFPool]):
+    pytest.importorskip("pdfminer")
+    data = (CORPUS_DIR / "report.pdf").read_bytes()
+    local = pdfpool.PDFExtraction(pdfpool.extract_pages(data))
+    expected = list(local)
+    assert local.pages == 2 and local.truncated is None
+
+    pool = pdf_pool()
+    extraction = pool.extract(data)
+    assert list(extraction) == expected
+    assert extraction.pages == 2 and extraction.truncated is None
+    assert extraction.elapsed > 0
+    assert len(pool._idle) == 1  # Kept for the next PDF
+
+    pdf_pool(max_pages=1)
+    parsed = workers._parse_source(data, PDFParser, "report.pdf", {}, [3], True)
+    assert parsed.truncated == "pages"
+    assert parsed.chains is not None
+    text = parsed.chains[3].text
+    assert text and text.startswith("HARROW POINT")
+    assert len(text) < len("".join(expected))
+
+    pool = pdf_pool(timeout=0)
+    extraction = pool.extract(data)
+    assert list(extraction) == []
+    assert extraction.truncated == "timeout"
+    assert not pool._idle
+
+
+def test_pdf_pool_cancel(
+    pdf_pool: Callable[..., pdfpool.PDFPool], monkeypatch: pytest.MonkeyPatch
+):
+    # Processes that never answer, like one stuck on a pathological PDF:
+    monkeypatch.setattr(pdfpool._Process, "_SCRIPT", "import time; time.sleep(60)")
+    pool = pdf_pool(timeout=30)
+    token = workers._CancellationToken()
+    threading.Timer(0.3, token.cancel).start()
+
+    start = time.monotonic()
+    args: ParserArgs = {"cancelled": lambda: token.cancelled}
+    with pytest.raises(workers._SourceCancelledError):
+        workers._parse_source(b"%PDF", PDFParser, "a.pdf", args, [3], True, token)
+    assert time.monotonic() - start < 1
+    assert not pool._idle
+
+    # Waiting for a free process can be cancelled too:
+    done = threading.Event()
+    busy = pool.extract(b"%PDF", cancelled=done.is_set)
+    busy_thread = threading.Thread(target=list, args=(busy,))
+    busy_thread.start()
+    time.sleep(0.2)
+    extraction = pool.extract(b"%PDF", cancelled=lambda: True)
+    assert list(extraction) == []
+    assert extraction.truncated == "cancelled"
+    done.set()
+    busy_thread.join()
+    assert busy.truncated == "cancelled"
+
+
+WIKITEXT = """\
+'''Harrow Point''' is a headland.<ref>{{cite web |url=https://example.com/ref}}</ref>
+[[File:Harrow.jpg|thumb|The headland]]
+{{quote|text=A long quotation from the survey, long enough to be merged in.}}
+{{bots|deny=OtherBot}}
+See [https://example.org/harrow the trust's site] and [[Lighthouse|lighthouses]].
+"""
+
+
+@pytest.fixture
+def count_parses(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    import mwparserfromhell
+
+    parses: list[str] = []
+    parse = mwparserfromhell.parse
+
+    def counted(text, *args, **kwargs):
+        parses.append(text)
+        return parse(text, *args, **kwargs)
+
+    monkeypatch.setattr(mwparserfromhell, "parse", counted)
+    return parses
+
+
+def test_parse_cache(count_parses: list[str]):
+    cache = ParseCache(WIKITEXT, 1)
+    code = cache.wikicode
+    assert cache.wikicode is code
+    assert cache.take() is code
+    assert cache.wikicode is not code
+    assert cache.take() is not cache.take()
+    assert len(count_parses) == 3
+
+    assert cache.get_result("foo", lambda: [1]) == [1]
+    assert cache.get_result("foo", lambda: [2]) == [1]
+    assert cache.matches(WIKITEXT, 1)
+    assert not cache.matches(WIKITEXT, 2)
+    assert not cache.matches(WIKITEXT + "x", 1)
+
+
+def test_article_parser_parse_cache(count_parses: list[str]):
+    expected = ArticleParser(WIKITEXT, "en", "")
+    clean, links = expected.strip(), expected.get_links()
+    assert "headland" in clean and "quotation" in clean and "cite web" not in clean
+    assert links == ["https://example.com/ref", "https://example.org/harrow"]
+    count_parses.clear()
+
+    cache = ParseCache(WIKITEXT, 1)
+    exclusion_tree = cache.wikicode  # As used by Page.check_exclusion()
+    parser = ArticleParser(WIKITEXT, "en", "", parse_cache=cache)
+    assert parser.strip() == clean
+    assert parser.get_links() == links
+    assert len(count_parses) == 1
+
+    # Stripping took the tree over; a fresh tree is parsed for the next reader:
+    assert str(exclusion_tree) != WIKITEXT
+    assert str(cache.wikicode) == WIKITEXT
+
+    other = ArticleParser(WIKITEXT, "en", "", parse_cache=cache)
+    assert other.strip() == clean
+    assert other.get_links() == links
+    assert len(count_parses) == 2
+
+
+def test_page_parse_cache(count_parses: list[str]):
+    page = Page(SimpleNamespace(), "Harrow Point")  # pyright: ignore[reportArgumentType]
+    page._exists = Page.PAGE_EXISTS
+    page._content = WIKITEXT
+    page._lastrevid = 1
+
+    cache = page.parse_cache
+    assert page.parse_cache is cache
+    assert page.check_exclusion("EarwigBot")
+    assert not page.check_exclusion("OtherBot")
+    assert len(count_parses) == 1
+
+    code = page.parse()
+    code.remove(code.filter_templates()[0])
+    assert str(page.parse()) == WIKITEXT
+    assert page.check_exclusion("EarwigBot")
+    assert str(cache.wikicode) == WIKITEXT
+
+    page._content = WIKITEXT + "{{nobots}}"
+    page._lastrevid = 2
+    assert page.parse_cache is not cache
+    assert not page.check_exclusion("EarwigBot")
+
+
+@pytest.fixture
+def nltk_dir(tmp_path: Path) -> str:
+    params = tmp_path / "tokenizers" / "punkt_tab" / "english"
+    params.mkdir(parents=True)
+    (params / "abbrev_types.txt").write_text("dr\nmr\nmrs\ne.g\n")
+    (params / "collocations.tab").write_text("##number##\tjanuary\n")
+    (params / "ortho_context.tab").write_text("the\t46\nsmith\t4\n")
+    (params / "sent_starters.txt").write_text("the\nbut\n")
+    return str(tmp_path)
+
+
+TOKENIZER_TEXT = (
+    "Dr. Smith met Mr. Jones on 5. January 2020. The meeting went well. But "
+    "nobody, e.g. the press, was told."
+)
+
+
+def test_save_load_tokenizer(
+    nltk_dir: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    import nltk
+    from nltk.tokenize import PunktTokenizer
+
+    monkeypatch.setattr(nltk.data, "path", [nltk_dir])
+    original = PunktTokenizer("english")
+    path = str(tmp_path / "saved" / "english.json")
+    tokenizers.save_tokenizer(original, path)
+    loaded = tokenizers.load_tokenizer(path)
+    assert loaded.tokenize(TOKENIZER_TEXT) == original.tokenize(TOKENIZER_TEXT)
+    assert len(loaded.tokenize(TOKENIZER_TEXT)) == 3
+    assert loaded._params.ortho_context == original._params.ortho_context
+    assert loaded._params.collocations == original._params.collocations
+
+    (tmp_path / "bad.json").write_text("[]")
+    with pytest.raises(ValueError):
+        tokenizers.load_tokenizer(str(tmp_path / "bad.json"))
+
+
+def test_tokenizer_registry(nltk_dir: str, monkeypatch: pytest.MonkeyPatch):
+    import nltk
+
+    monkeypatch.setattr(nltk.data, "path", list(nltk.data.path))
+    saved = Path(nltk_dir) / "tokenizers" / "punkt_json" / "english.json"
+    loads: list[str] = []
+    load_tokenizer = tokenizers.load_tokenizer
+    monkeypatch.setattr(
+        tokenizers,
+        "load_tokenizer",
+        lambda path: loads.append(path) or load_tokenizer(path),
+    )
+
+    registry = tokenizers.TokenizerRegistry()
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(registry.get("english", nltk_dir))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8
+    assert all(tokenizer is results[0] for tokenizer in results)
+    assert saved.exists()
+    assert not loads
+    assert str(registry) == "<TokenizerRegistry of [english]>"
+
+    # A new process loads the saved form instead:
+    registry = tokenizers.TokenizerRegistry()
+    assert registry.warm_up(["english"], nltk_dir) == []
+    assert loads == [str(saved)]
+    tokenizer = registry.get("english", nltk_dir)
+    assert len(tokenizer.tokenize(TOKENIZER_TEXT)) == 3
+    assert loads == [str(saved)]
+
+    # ...unless the original model has been updated since:
+    registry.clear()
+    params = Path(nltk_dir) / "tokenizers" / "punkt_tab" / "english"
+    mtime = saved.stat().st_mtime
+    os.utime(params / "abbrev_types.txt", (mtime + 10, mtime + 10))
+    registry.get("english", nltk_dir)
+    assert loads == [str(saved)]
+    assert saved.stat().st_mtime > mtime
+
+
+def test_article_parser_warm_up(nltk_dir: str, monkeypatch: pytest.MonkeyPatch):
+    import nltk
+
+    monkeypatch.setattr(nltk.data, "path", list(nltk.data.path))
+    monkeypatch.setattr(tokenizers, "_registry", tokenizers.TokenizerRegistry())
+    monkeypatch.setattr(nltk, "download", lambda *args, **kwargs: False)
+    assert ArticleParser.warm_up(["en", "simple", "fr"], nltk_dir) == ["fr"]
+
+    parser = ArticleParser("Foo. Bar.", "simple", nltk_dir)
+    assert parser._get_tokenizer() is tokenizers.get_tokenizer("english", nltk_dir)
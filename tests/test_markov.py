@@ -0,0 +1,179 @@
+# Copyright (C) 2009-2024 Ben Kurtovic <ben.kurtovic@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import re
+
+import pytest
+
+from earwigbot.wiki.copyvios import markov
+from earwigbot.wiki.copyvios.markov import (
+    EMPTY,
+    MarkovChain,
+    MarkovChainBuilder,
+    MarkovChainIntersection,
+    MarkovChainUnion,
+    MultiDegreeChainBuilder,
+    Sentinel,
+)
+
+TEXTS = [
+    "",
+    "The quick brown fox jumps over the lazy dog.",
+    "The quick brown fox jumps over the lazy cat, and the quick brown fox runs.",
+    "Über-fast   résumé\nprocessing; with -- hyphens and numbers 1 2 3 1 2 3 1 2 3.",
+    "a b a b a b a b a b a b a b a b",
+]
+
+
+@pytest.fixture(autouse=True, params=["python", "numpy"])
+def backend(request: pytest.FixtureRequest):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    markov.set_backend(request.param)
+    yield request.param
+    markov.set_backend(None)
+
+
+def _reference_chain(text: str, degree: int) -> dict[tuple, int]:
+    padding = degree - 1
+    words = re.sub(r"[^\w\s-]", "", text.lower()).split()
+    words = [Sentinel.START] * padding + words + [Sentinel.END] * padding
+    chain: dict[tuple, int] = {}
+    for i in range(len(words) - degree + 1):
+        phrase = tuple(words[i : i + degree])
+        chain[phrase] = chain.get(phrase, 0) + 1
+    return chain
+
+
+@pytest.mark.parametrize("degree", [1, 3, 5])
+@pytest.mark.parametrize("text", TEXTS)
+def test_chain_matches_reference(text: str, degree: int):
+    chain = MarkovChain(text, degree=degree)
+    reference = _reference_chain(text, degree)
+
+    assert chain.size == sum(reference.values())
+    assert len(chain.chain) == len(reference)
+    assert list(chain.chain.hashes) == sorted(chain.chain.hashes)
+    for phrase, count in reference.items():
+        assert phrase in chain.chain
+        assert chain.chain.get(phrase) == count
+
+
+@pytest.mark.parametrize("degree", [3, 5])
+def test_intersection_and_union(degree: int):
+    chains = [MarkovChain(text, degree=degree) for text in TEXTS]
+    refs = [_reference_chain(text, degree) for text in TEXTS]
+
+    for mc1, ref1 in zip(chains, refs):
+        for mc2, ref2 in zip(chains, refs):
+            expected = sum(min(ref1[p], ref2[p]) for p in ref1 if p in ref2)
+            assert MarkovChainIntersection(mc1, mc2).size == expected
+
+    union = MarkovChainUnion(chains)
+    assert union.size == sum(chain.size for chain in chains)
+    assert len(union.chain) == len(set().union(*refs))
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+@pytest.mark.parametrize("text", TEXTS)
+def test_streaming_matches_whole_text(text: str, size: int):
+    chunks = [text[i : i + size] for i in range(0, len(text), size)]
+    expected = MarkovChain(text, degree=3)
+
+    chain = MarkovChain.from_chunks(chunks, degree=3)
+    assert chain.text is None
+    assert chain.size == expected.size
+    assert chain.chain.hashes == expected.chain.hashes
+    assert chain.chain.counts == expected.chain.counts
+
+    chain = MarkovChain.from_chunks(iter(chunks), degree=3, keep_text=True)
+    assert chain.text == text
+
+
+def test_builder_flushes_large_input():
+    text = " ".join(TEXTS[1:]) * 1000
+    builder = MarkovChainBuilder(degree=4)
+    assert builder.empty
+    for i in range(0, len(text), 333):
+        builder.feed(text[i : i + 333])
+    assert not builder.empty
+    chain = builder.build()
+
+    expected = MarkovChain(text, degree=4)
+    assert chain.chain.hashes == expected.chain.hashes
+    assert chain.chain.counts == expected.chain.counts
+    with pytest.raises(ValueError):
+        builder.feed("more text")
+
+
+def test_empty():
+    assert EMPTY.size == 4
+    assert ("quick", "brown", "fox", "jumps", "over") not in EMPTY.chain
+    assert MarkovChainIntersection(EMPTY, MarkovChain("foo bar")).size == 0
+
+
+def test_backends_agree():
+    pytest.importorskip("numpy")
+    text = " ".join(TEXTS * 3)
+    results = []
+    for name in ["python", "numpy"]:
+        markov.set_backend(name)
+        mc1, mc2 = MarkovChain(text), MarkovChain(TEXTS[2])
+        delta = MarkovChainIntersection(mc1, mc2)
+        union = MarkovChainUnion([mc1, mc2, delta])
+        results.append(
+            [(chain.chain.hashes, chain.chain.counts) for chain in (mc1, delta, union)]
+        )
+    assert results[0] == results[1]
+
+
+def test_set_backend_invalid():
+    with pytest.raises(ValueError):
+        markov.set_backend("fortran")
+
+
+def test_find_phrases():
+    article = MarkovChain("one two three. four five six! four five six; seven", 3)
+    source = MarkovChain("four five six four five six and one two three", 3)
+    delta = MarkovChainIntersection(article, source)
+    assert article.find_phrases(delta, 10) == [
+        ("four", "five", "six"),
+        ("one", "two", "three"),
+        ("five", "six", "four"),
+        ("six", "four", "five"),
+    ]
+    assert article.find_phrases(delta, 1) == [("four", "five", "six")]
+    with pytest.raises(ValueError):
+        MarkovChain.from_chunks(["one two three"], 3).find_phrases(source, 1)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_multi_degree_builder(text: str):
+    builder = MultiDegreeChainBuilder([5, 2, 3], keep_text=True)
+    for i in range(0, len(text), 7):
+        builder.feed(text[i : i + 7])
+    chains = builder.build()
+    assert list(chains) == [2, 3, 5]
+    for degree, chain in chains.items():
+        expected = MarkovChain(text, degree=degree)
+        assert chain.degree == degree
+        assert chain.text == text
+        assert chain.chain.hashes == expected.chain.hashes
+        assert chain.chain.counts == expected.chain.counts